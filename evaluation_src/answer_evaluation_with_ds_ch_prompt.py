@@ -1,93 +1,118 @@
 import os
 import json
 import re
-import time
-from openai import OpenAI
+import asyncio
+from llm_client import get_client, get_async_client, ChatRequest, Pause, VERDICT, run_plan, arun_plan, record_saved_call, saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from rate_limit import rate_limit_report
+from call_profile import profile_report
+from result_parser import extract_marked_answer
+from equivalence import answers_equivalent
+from run_journal import open_journal, journaled
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from results_store import answer_rows, store_rows, store_report
+from leaderboard import record_answer_file, leaderboard_report
 from collections import defaultdict
-from tqdm import tqdm
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 MODEL_FILES = {
     'deepseek_r1.txt': ('evaluation_deepseek_r1_ds.json', 'deepseek_r1')
 }
 
-def create_client():
-    client = OpenAI(
-        base_url="https://api.deepseek.com",
-        api_key="your_api_key",
-    )
-    return client
+USE_ASYNC = False  # 使用 asyncio 引擎代替线程池评分，两者结果相同
+ANSWER_FAST_PATH = True  # 先在本地读取 sub_question_N_answer: 标记后的答案，失败时才调用 LLM 提取
+LOCAL_EQUIVALENCE = True  # 先在本地判断纯数值（含单位）和简单公式是否等价（见 equivalence.py），无法判断时再询问 LLM
+MAX_WORKERS = 16  # 同时评分的子问题数量上限
+ALL_MODELS = False  # 一次运行评分 result/ 下所有模型的输出（*.txt），而不只是 MODEL_FILES
+
+def model_files(entry):
+    """问题中需要评分的模型输出：输入文件 -> (输出文件, 模型名)"""
+    if not ALL_MODELS:
+        return MODEL_FILES
+    return {
+        file: MODEL_FILES.get(file, (f"evaluation_{os.path.splitext(file)[0]}_ds.json", os.path.splitext(file)[0]))
+        for file in entry["files"]["result"]
+        if file.endswith('.txt')
+    }
 
 def find_files_to_process(base_path):
-    """返回需要处理的文件列表，格式为: [(problem_dir, input_file_path, output_file_path, model_name)]"""
+    """返回需要处理的文件列表，格式为: [(problem_dir, input_file_path, output_file_path, model_name, cost)]"""
     files_to_process = []
     total_files = 0
     skipped_files = 0
     
-    for problem_dir in os.listdir(base_path):
-        problem_path = os.path.join(base_path, problem_dir)
-        if not os.path.isdir(problem_path):
-            continue
-            
+    for problem_dir, problem_path, entry in load_manifest(base_path).problems():
         result_dir = os.path.join(problem_path, 'result')
         score_dir = os.path.join(problem_path, 'score')
         
-        if not os.path.exists(result_dir):
-            continue
-            
-        if not os.path.exists(score_dir):
-            os.makedirs(score_dir)
-            
-        if not os.path.exists(os.path.join(problem_path, 'problem.json')):
-            continue
-            
-        for input_file, (output_file, model_name) in MODEL_FILES.items():
-            input_path = os.path.join(result_dir, input_file)
-            output_path = os.path.join(score_dir, output_file)
-            
-            if os.path.exists(input_path):
+        for input_file, (output_file, model_name) in model_files(entry).items():
+            if has_file(entry, 'result', input_file):
                 total_files += 1
-                if os.path.exists(output_path):
+                if has_file(entry, 'score', output_file):
                     skipped_files += 1
                     continue
-                files_to_process.append((problem_path, input_path, output_path, model_name))
+                os.makedirs(score_dir, exist_ok=True)
+                files_to_process.append((problem_path, os.path.join(result_dir, input_file), os.path.join(score_dir, output_file), model_name, estimate_cost(entry, 'answer')))
                 
-    return files_to_process, total_files, skipped_files
+    # 子问题最多的问题先评分（LPT），避免最后只剩个别问题在运行
+    return lpt_order(files_to_process, lambda file: file[4]), total_files, skipped_files
 
-def extract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
-    """Extract answer with retry mechanism"""
+def plan_extract_answer(content, question_content, sub_q_num, max_retries=3):
+    """extract_answer_with_retry 的请求计划（见 llm_client.run_plan）"""
+    # 快速路径：大多数输出在标记后直接给出答案，无需调用 LLM
+    if ANSWER_FAST_PATH:
+        answer = extract_marked_answer(content, f"sub_question_{sub_q_num}")
+        if answer is not None:
+            record_saved_call("answer extractions")
+            return answer
     for attempt in range(max_retries):
         try:
-            client = create_client()
-            prompt = f"""请从以下输出文本中提取针对特定问题的答案。
+            # 输出文本放在最前面，同一输出其他子问题的提取请求可以共用提示前缀
+            prompt = f"""输出文本：
+{content}
+
+请从以上输出文本中提取针对以下具体问题的答案。
 具体问题：
 {question_content}
 
-输出文本：
-{content}
-
 请直接返回答案，不需要任何解释或额外文字。答案通常在'sub_question_{sub_q_num}_answer:'后面。"""
 
-            response = client.chat.completions.create(
+            reply = yield ChatRequest(
                 model="deepseek/deepseek-chat",
+                kind="answer.extract",
                 messages=[
                     {"role": "system", "content": "你是一个专业的答案提取助手，请只返回提取到的答案，不要添加任何额外的解释。"},
                     {"role": "user", "content": prompt},
-                ],
-                stream=False
+                ]
             )
             
-            extracted_answer = response.choices[0].message.content.strip()
+            extracted_answer = reply.strip()
             return re.sub(r'sub_question_\d+_answer:', '', extracted_answer).strip()
         except Exception as e:
             if attempt == max_retries - 1:
                 print(f"Failed to extract answer after {max_retries} attempts: {str(e)}")
                 return ""
-            time.sleep(1)  # Wait before retry
+            yield Pause(1)  # Wait before retry
+
+def extract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
+    """Extract answer with retry mechanism"""
+    return run_plan(get_client(), plan_extract_answer(content, question_content, sub_q_num, max_retries))
+
+async def aextract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
+    """异步引擎使用的 extract_answer_with_retry"""
+    return await arun_plan(get_async_client(), plan_extract_answer(content, question_content, sub_q_num, max_retries))
+
+def plan_evaluate_answer(actual_answer, expected_answer, question_content):
+    """evaluate_with_deepseek 的请求计划"""
+    # 纯数值和简单表达式在本地比较，只有无法判断的答案才交给 LLM
+    if LOCAL_EQUIVALENCE:
+        verdict = answers_equivalent(actual_answer, expected_answer)
+        if verdict is not None:
+            record_saved_call("answer judgments")
+            return verdict
 
-def evaluate_with_deepseek(actual_answer, expected_answer, question_content):
-    client = create_client()
-    
     prompt = f"""请基于以下信息，判断两个答案是否在含义上等价：
 具体问题：
 {question_content}
@@ -97,76 +122,197 @@ def evaluate_with_deepseek(actual_answer, expected_answer, question_content):
 {expected_answer}
 请只回答"正确"或"错误"来表示这两个答案是否表达相同的含义。评判时请考虑数学表达式、单位等细节是否等价。"""
 
-    response = client.chat.completions.create(
+    reply = yield ChatRequest(
         model="deepseek/deepseek-chat",
+        kind="answer.judge",
+        stop_at=VERDICT,
         messages=[
             {"role": "system", "content": "你是一个专业的数学问题答案评估助手"},
             {"role": "user", "content": prompt},
-        ],
-        stream=False
+        ]
     )
     
-    return response.choices[0].message.content.strip() == '正确'
+    return reply.strip() == '正确'
+
+def evaluate_with_deepseek(actual_answer, expected_answer, question_content):
+    return run_plan(get_client(), plan_evaluate_answer(actual_answer, expected_answer, question_content))
+
+async def aevaluate_with_deepseek(actual_answer, expected_answer, question_content):
+    """异步引擎使用的 evaluate_with_deepseek"""
+    return await arun_plan(get_async_client(), plan_evaluate_answer(actual_answer, expected_answer, question_content))
+
+def plan_grade_sub_question(content, problem_data, sub_q_num, journal=None):
+    """grade_sub_question 的请求计划"""
+    sub_q_key = f"sub_question_{sub_q_num}"
+    expected_answer = problem_data["answer"][sub_q_num - 1]
+    question_content = problem_data["question_structure"][sub_q_key]
+    
+    # 使用新的答案提取方法
+    actual_answer = yield from journaled(journal, "extraction", sub_q_key, plan_extract_answer(content, question_content, sub_q_num))
+    
+    is_correct = (yield from journaled(journal, "answer", sub_q_key, plan_evaluate_answer(
+        actual_answer, 
+        expected_answer,
+        question_content
+    ))) if actual_answer else False
+    
+    return {
+        "correct": is_correct,
+        "actual_answer": actual_answer,
+        "expected_answer": expected_answer,
+        "context": problem_data["question_structure"]["context"],
+        "question_content": question_content,
+        "difficulty": problem_data["difficulty"]
+    }
+
+def grade_sub_question(content, problem_data, sub_q_num, journal=None):
+    """评估单个子问题：先提取模型答案，再与预期答案比较"""
+    return run_plan(get_client(), plan_grade_sub_question(content, problem_data, sub_q_num, journal))
+
+def load_job(problem_path, input_path, output_path, model_name, problem_data=None):
+    """读取单个文件的问题数据和模型输出，生成评分任务"""
+    # 读取问题数据；同一问题其他模型的任务直接传入已读取的数据
+    if problem_data is None:
+        with open(os.path.join(problem_path, 'problem.json'), 'r', encoding='utf-8') as f:
+            problem_data = json.load(f)
+    
+    # 读取答案文件
+    with open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    return {
+        "problem_path": problem_path,
+        "input_path": input_path,
+        "output_path": output_path,
+        "model_name": model_name,
+        "problem_data": problem_data,
+        "content": content,
+        # 中断的运行已完成的提取和判定会从日志中重放
+        "journal": open_journal(output_path),
+        "results": {},
+        "pending": len(problem_data["answer"]),
+        "failed": False
+    }
+
+def evaluate_answer_file(problem_path, input_path, output_path, model_name, problem_data=None):
+    """评估单个文件的所有子问题并保存评分 JSON，供流水线调用"""
+    job = load_job(problem_path, input_path, output_path, model_name, problem_data)
+    for sub_q_num in range(1, job["pending"] + 1):
+        job["results"][sub_q_num] = grade_sub_question(job["content"], job["problem_data"], sub_q_num, job["journal"])
+    save_evaluation_results(job)
+    return job["results"]
+
+def save_evaluation_results(job):
+    """问题的所有子问题评分完成后写入评分 JSON"""
+    # 按子问题顺序保存评估结果
+    evaluation_results = {job["model_name"]: {
+        f"sub_question_{num}": job["results"][num]
+        for num in sorted(job["results"])
+    }}
+    output_path = job["output_path"]
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(evaluation_results, f, indent=4, ensure_ascii=False)
+    job["journal"].finish()
+    store_rows(answer_rows(job["problem_path"], output_path, job["results"]))
+    record_answer_file(job["problem_path"], output_path, job["results"])
+    [print(f"Saved evaluation results to {output_path}")]
+
+def load_jobs(files_to_process):
+    """把每个文件读取为评分任务，无法读取的文件报告后跳过"""
+    jobs = []
+    problems = {}
+    for problem_path, input_path, output_path, model_name, cost in files_to_process:
+        try:
+            # 同一问题的所有模型输出共用一份解析后的 problem.json
+            job = load_job(problem_path, input_path, output_path, model_name, problems.get(problem_path))
+            problems[problem_path] = job["problem_data"]
+            job["cost"] = cost
+            jobs.append(job)
+        except Exception as e:
+            print(f"\nError processing {input_path}: {str(e)}")
+    return jobs
+
+def record_sub_question(job, sub_q_num, result, error, stats, pbar):
+    """记录一个子问题的评分结果，问题的所有子问题完成后保存"""
+    if error is None:
+        job["results"][sub_q_num] = result
+        stats[result["difficulty"]]['total'] += 1
+        if result["correct"]:
+            stats[result["difficulty"]]['correct'] += 1
+    else:
+        if not job["failed"]:
+            print(f"\nError processing {job['input_path']}: {str(error)}")
+        job["failed"] = True
+    
+    job["pending"] -= 1
+    if job["pending"] > 0:
+        return
+    
+    try:
+        if not job["failed"]:
+            save_evaluation_results(job)
+    except Exception as e:
+        print(f"\nError processing {job['input_path']}: {str(e)}")
+    finally:
+        pbar.update(job["cost"])
 
-def process_files(files_to_process):
+def process_files(files_to_process, max_workers=MAX_WORKERS):
     stats = defaultdict(lambda: {'correct': 0, 'total': 0})
+    jobs = load_jobs(files_to_process)
     
-    with tqdm(total=len(files_to_process), desc="处理文件") as pbar:
-        for problem_path, input_path, output_path, model_name in files_to_process:
-            try:
-                # 读取问题数据
-                with open(os.path.join(problem_path, 'problem.json'), 'r', encoding='utf-8') as f:
-                    problem_data = json.load(f)
-                
-                # 读取答案文件
-                with open(input_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                sub_questions_count = len(problem_data["answer"])
-                evaluation_results = {model_name: {}}
-                
-                difficulty = problem_data["difficulty"]
-                context = problem_data["question_structure"]["context"]
-                
-                # 处理每个子问题
-                for sub_q_num in range(1, sub_questions_count + 1):
-                    sub_q_key = f"sub_question_{sub_q_num}"
-                    expected_answer = problem_data["answer"][sub_q_num - 1]
-                    question_content = problem_data["question_structure"][sub_q_key]
-                    
-                    # 使用新的答案提取方法
-                    actual_answer = extract_answer_with_retry(content, question_content, sub_q_num)
-                    
-                    is_correct = evaluate_with_deepseek(
-                        actual_answer, 
-                        expected_answer,
-                        question_content
-                    ) if actual_answer else False
-                    
-                    stats[difficulty]['total'] += 1
-                    if is_correct:
-                        stats[difficulty]['correct'] += 1
-                    
-                    evaluation_results[model_name][sub_q_key] = {
-                        "correct": is_correct,
-                        "actual_answer": actual_answer,
-                        "expected_answer": expected_answer,
-                        "context": context,
-                        "question_content": question_content,
-                        "difficulty": difficulty
-                    }
-                
-                # 保存评估结果
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(evaluation_results, f, indent=4, ensure_ascii=False)
-                [print(f"Saved evaluation results to {output_path}")]
-                
-            except Exception as e:
-                print(f"\nError processing {input_path}: {str(e)}")
-                continue
+    total_cost = sum(file[4] for file in files_to_process)
+    with cost_bar(total_cost, desc="处理文件") as pbar:
+        pbar.update(total_cost - sum(job["cost"] for job in jobs))
+        
+        # 所有问题的所有子问题共用一个有界线程池并发评分
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for job in jobs:
+                for sub_q_num in range(1, job["pending"] + 1):
+                    future = executor.submit(grade_sub_question, job["content"], job["problem_data"], sub_q_num, job["journal"])
+                    futures[future] = (job, sub_q_num)
+                if job["pending"] == 0:
+                    save_evaluation_results(job)
+                    pbar.update(job["cost"])
             
-            finally:
-                pbar.update(1)
+            for future in as_completed(futures):
+                job, sub_q_num = futures[future]
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                record_sub_question(job, sub_q_num, result, error, stats, pbar)
+    
+    return stats
+
+async def aprocess_files(files_to_process, concurrency=MAX_WORKERS):
+    """异步引擎版本的 process_files：子问题作为任务运行，最多同时运行 concurrency 个。
+
+    评分 JSON 和统计结果与 process_files 相同；运行中断时任务组会取消所有未完成的请求。"""
+    stats = defaultdict(lambda: {'correct': 0, 'total': 0})
+    jobs = load_jobs(files_to_process)
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    total_cost = sum(file[4] for file in files_to_process)
+    with cost_bar(total_cost, desc="处理文件") as pbar:
+        pbar.update(total_cost - sum(job["cost"] for job in jobs))
+        
+        async def grade(job, sub_q_num):
+            async with semaphore:
+                try:
+                    result, error = await arun_plan(client, plan_grade_sub_question(job["content"], job["problem_data"], sub_q_num, job["journal"])), None
+                except Exception as e:
+                    result, error = None, e
+            record_sub_question(job, sub_q_num, result, error, stats, pbar)
+        
+        async with asyncio.TaskGroup() as task_group:
+            for job in jobs:
+                for sub_q_num in range(1, job["pending"] + 1):
+                    task_group.create_task(grade(job, sub_q_num))
+                if job["pending"] == 0:
+                    save_evaluation_results(job)
+                    pbar.update(job["cost"])
     
     return stats
 
@@ -183,16 +329,28 @@ def main():
         
         if not files_to_process:
             print("没有需要处理的文件")
+            print(leaderboard_report(base_path))
             return
         
         # 处理文件并收集统计信息
-        stats = process_files(files_to_process)
+        if USE_ASYNC:
+            stats = asyncio.run(aprocess_files(files_to_process))
+        else:
+            stats = process_files(files_to_process)
         
         # 打印统计信息
-        print("\nFinal Statistics:")
+        print("\nThis run:")
         for difficulty, results in stats.items():
             accuracy = (results['correct'] / results['total'] * 100) if results['total'] > 0 else 0
             print(f"{difficulty.capitalize()}: {results['correct']}/{results['total']} correct ({accuracy:.1f}%)")
+        print(cache_report())
+        print(rate_limit_report())
+        print(prompt_cache_report())
+        print(profile_report())
+        print(saved_calls_report())
+        print(store_report())
+        # 统计至今评分过的所有问题，包括本次运行跳过的问题
+        print(leaderboard_report(base_path))
             
     except Exception as e:
         print(f"\nError occurred: {str(e)}", file=sys.stderr)
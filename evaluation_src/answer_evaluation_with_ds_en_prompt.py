@@ -1,93 +1,118 @@
 import os
 import json
 import re
-import time
-from openai import OpenAI
+import asyncio
+from llm_client import get_client, get_async_client, ChatRequest, Pause, VERDICT, run_plan, arun_plan, record_saved_call, saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from rate_limit import rate_limit_report
+from call_profile import profile_report
+from result_parser import extract_marked_answer
+from equivalence import answers_equivalent
+from run_journal import open_journal, journaled
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from results_store import answer_rows, store_rows, store_report
+from leaderboard import record_answer_file, leaderboard_report
 from collections import defaultdict
-from tqdm import tqdm
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 MODEL_FILES = {
     'deepseek_r1.txt': ('evaluation_deepseek_r1_ds.json', 'deepseek_r1')
 }
 
-def create_client():
-    client = OpenAI(
-        base_url="https://api.deepseek.com",
-        api_key="your_api_key",
-    )
-    return client
+USE_ASYNC = False  # Grade on the asyncio engine instead of the thread pool; both give the same results
+ANSWER_FAST_PATH = True  # Read the answer after its sub_question_N_answer: marker locally; call the LLM extractor only when that fails
+LOCAL_EQUIVALENCE = True  # Decide plain numbers with units and simple formulas locally (see equivalence.py) before asking the LLM
+MAX_WORKERS = 16  # Upper bound on sub-questions graded concurrently
+ALL_MODELS = False  # Grade every model output (*.txt) under result/ in one run instead of only MODEL_FILES
+
+def model_files(entry):
+    """input file -> (output file, model name) of the model outputs to grade in a problem"""
+    if not ALL_MODELS:
+        return MODEL_FILES
+    return {
+        file: MODEL_FILES.get(file, (f"evaluation_{os.path.splitext(file)[0]}_ds.json", os.path.splitext(file)[0]))
+        for file in entry["files"]["result"]
+        if file.endswith('.txt')
+    }
 
 def find_files_to_process(base_path):
-    """Returns a list of files to process, format: [(problem_dir, input_file_path, output_file_path, model_name)]"""
+    """Returns a list of files to process, format: [(problem_dir, input_file_path, output_file_path, model_name, cost)]"""
     files_to_process = []
     total_files = 0
     skipped_files = 0
     
-    for problem_dir in os.listdir(base_path):
-        problem_path = os.path.join(base_path, problem_dir)
-        if not os.path.isdir(problem_path):
-            continue
-            
+    for problem_dir, problem_path, entry in load_manifest(base_path).problems():
         result_dir = os.path.join(problem_path, 'result')
         score_dir = os.path.join(problem_path, 'score')
         
-        if not os.path.exists(result_dir):
-            continue
-            
-        if not os.path.exists(score_dir):
-            os.makedirs(score_dir)
-            
-        if not os.path.exists(os.path.join(problem_path, 'problem.json')):
-            continue
-            
-        for input_file, (output_file, model_name) in MODEL_FILES.items():
-            input_path = os.path.join(result_dir, input_file)
-            output_path = os.path.join(score_dir, output_file)
-            
-            if os.path.exists(input_path):
+        for input_file, (output_file, model_name) in model_files(entry).items():
+            if has_file(entry, 'result', input_file):
                 total_files += 1
-                if os.path.exists(output_path):
+                if has_file(entry, 'score', output_file):
                     skipped_files += 1
                     continue
-                files_to_process.append((problem_path, input_path, output_path, model_name))
+                os.makedirs(score_dir, exist_ok=True)
+                files_to_process.append((problem_path, os.path.join(result_dir, input_file), os.path.join(score_dir, output_file), model_name, estimate_cost(entry, 'answer')))
                 
-    return files_to_process, total_files, skipped_files
+    # Problems with the most sub-questions are graded first (LPT), so none is left running alone at the end
+    return lpt_order(files_to_process, lambda file: file[4]), total_files, skipped_files
 
-def extract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
-    """Extract answer with retry mechanism"""
+def plan_extract_answer(content, question_content, sub_q_num, max_retries=3):
+    """Request plan of extract_answer_with_retry (see llm_client.run_plan)"""
+    # Fast path: most outputs state the answer after its marker, so no LLM call is needed
+    if ANSWER_FAST_PATH:
+        answer = extract_marked_answer(content, f"sub_question_{sub_q_num}")
+        if answer is not None:
+            record_saved_call("answer extractions")
+            return answer
     for attempt in range(max_retries):
         try:
-            client = create_client()
-            prompt = f"""Please extract the answer for the specific question from the following output text.
+            # The output text comes first, so the extractions of its other sub-questions share the prompt prefix
+            prompt = f"""Output text:
+{content}
+
+Please extract the answer for the following specific question from the output text above.
 Specific question:
 {question_content}
 
-Output text:
-{content}
-
 Please return the answer directly without any explanation or additional text. The answer is usually after 'sub_question_{sub_q_num}_answer:'."""
 
-            response = client.chat.completions.create(
+            reply = yield ChatRequest(
                 model="deepseek/deepseek-chat",
+                kind="answer.extract",
                 messages=[
                     {"role": "system", "content": "You are a professional answer extraction assistant. Please only return the extracted answer without adding any additional explanations."},
                     {"role": "user", "content": prompt},
-                ],
-                stream=False
+                ]
             )
             
-            extracted_answer = response.choices[0].message.content.strip()
+            extracted_answer = reply.strip()
             return re.sub(r'sub_question_\d+_answer:', '', extracted_answer).strip()
         except Exception as e:
             if attempt == max_retries - 1:
                 print(f"Failed to extract answer after {max_retries} attempts: {str(e)}")
                 return ""
-            time.sleep(1)  # Wait before retry
+            yield Pause(1)  # Wait before retry
+
+def extract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
+    """Extract answer with retry mechanism"""
+    return run_plan(get_client(), plan_extract_answer(content, question_content, sub_q_num, max_retries))
+
+async def aextract_answer_with_retry(content, question_content, sub_q_num, max_retries=3):
+    """Async extract_answer_with_retry for the asyncio engine"""
+    return await arun_plan(get_async_client(), plan_extract_answer(content, question_content, sub_q_num, max_retries))
+
+def plan_evaluate_answer(actual_answer, expected_answer, question_content):
+    """Request plan of evaluate_with_deepseek"""
+    # Plain numbers and simple expressions are compared locally; only undecidable answers reach the LLM
+    if LOCAL_EQUIVALENCE:
+        verdict = answers_equivalent(actual_answer, expected_answer)
+        if verdict is not None:
+            record_saved_call("answer judgments")
+            return verdict
 
-def evaluate_with_deepseek(actual_answer, expected_answer, question_content):
-    client = create_client()
-    
     prompt = f"""Based on the following information, please determine whether the two answers are semantically equivalent:
 Specific question:
 {question_content}
@@ -97,76 +122,198 @@ Expected answer:
 {expected_answer}
 Please only answer "true" or "false" to indicate whether these two answers express the same meaning. When evaluating, please consider whether mathematical expressions, units, and other details are equivalent."""
 
-    response = client.chat.completions.create(
+    reply = yield ChatRequest(
         model="deepseek/deepseek-chat",
+        kind="answer.judge",
+        stop_at=VERDICT,
         messages=[
             {"role": "system", "content": "You are a professional mathematical problem answer evaluation assistant"},
             {"role": "user", "content": prompt},
-        ],
-        stream=False
+        ]
     )
     
-    return response.choices[0].message.content.strip().lower() == 'true'
+    return reply.strip().lower() == 'true'
+
+def evaluate_with_deepseek(actual_answer, expected_answer, question_content):
+    return run_plan(get_client(), plan_evaluate_answer(actual_answer, expected_answer, question_content))
+
+async def aevaluate_with_deepseek(actual_answer, expected_answer, question_content):
+    """Async evaluate_with_deepseek for the asyncio engine"""
+    return await arun_plan(get_async_client(), plan_evaluate_answer(actual_answer, expected_answer, question_content))
+
+def plan_grade_sub_question(content, problem_data, sub_q_num, journal=None):
+    """Request plan of grade_sub_question"""
+    sub_q_key = f"sub_question_{sub_q_num}"
+    expected_answer = problem_data["answer"][sub_q_num - 1]
+    question_content = problem_data["question_structure"][sub_q_key]
+    
+    # Use new answer extraction method
+    actual_answer = yield from journaled(journal, "extraction", sub_q_key, plan_extract_answer(content, question_content, sub_q_num))
+    
+    is_correct = (yield from journaled(journal, "answer", sub_q_key, plan_evaluate_answer(
+        actual_answer, 
+        expected_answer,
+        question_content
+    ))) if actual_answer else False
+    
+    return {
+        "correct": is_correct,
+        "actual_answer": actual_answer,
+        "expected_answer": expected_answer,
+        "context": problem_data["question_structure"]["context"],
+        "question_content": question_content,
+        "difficulty": problem_data["difficulty"]
+    }
+
+def grade_sub_question(content, problem_data, sub_q_num, journal=None):
+    """Grade one sub-question: extract the model answer, then judge it against the expected answer"""
+    return run_plan(get_client(), plan_grade_sub_question(content, problem_data, sub_q_num, journal))
+
+def load_job(problem_path, input_path, output_path, model_name, problem_data=None):
+    """Read the problem and model output of one file into a grading job"""
+    # Read problem data; the jobs of other models of the same problem pass it in
+    if problem_data is None:
+        with open(os.path.join(problem_path, 'problem.json'), 'r', encoding='utf-8') as f:
+            problem_data = json.load(f)
+    
+    # Read answer file
+    with open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    return {
+        "problem_path": problem_path,
+        "input_path": input_path,
+        "output_path": output_path,
+        "model_name": model_name,
+        "problem_data": problem_data,
+        "content": content,
+        # Extractions and verdicts an interrupted run already finished are replayed from it
+        "journal": open_journal(output_path),
+        "results": {},
+        "pending": len(problem_data["answer"]),
+        "failed": False
+    }
+
+def evaluate_answer_file(problem_path, input_path, output_path, model_name, problem_data=None):
+    """Grade every sub-question of one file and save its score JSON; used by the pipeline runner"""
+    job = load_job(problem_path, input_path, output_path, model_name, problem_data)
+    for sub_q_num in range(1, job["pending"] + 1):
+        job["results"][sub_q_num] = grade_sub_question(job["content"], job["problem_data"], sub_q_num, job["journal"])
+    save_evaluation_results(job)
+    return job["results"]
+
+def save_evaluation_results(job):
+    """Write the score JSON of a problem once all its sub-questions are graded"""
+    # Save evaluation results in sub-question order
+    evaluation_results = {job["model_name"]: {
+        f"sub_question_{num}": job["results"][num]
+        for num in sorted(job["results"])
+    }}
+    output_path = job["output_path"]
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(evaluation_results, f, indent=4, ensure_ascii=False)
+    job["journal"].finish()
+    store_rows(answer_rows(job["problem_path"], output_path, job["results"]))
+    record_answer_file(job["problem_path"], output_path, job["results"])
+    print(f"Saved evaluation results to {output_path}")
+
+def load_jobs(files_to_process):
+    """Read every file into a grading job, skipping (and reporting) unreadable ones"""
+    jobs = []
+    problems = {}
+    for problem_path, input_path, output_path, model_name, cost in files_to_process:
+        try:
+            # Every model output of a problem shares one parsed problem.json
+            job = load_job(problem_path, input_path, output_path, model_name, problems.get(problem_path))
+            problems[problem_path] = job["problem_data"]
+            job["cost"] = cost
+            jobs.append(job)
+        except Exception as e:
+            print(f"\nError processing {input_path}: {str(e)}")
+    return jobs
+
+def record_sub_question(job, sub_q_num, result, error, stats, pbar):
+    """Record one graded sub-question and save the problem once all its sub-questions are done"""
+    if error is None:
+        job["results"][sub_q_num] = result
+        stats[result["difficulty"]]['total'] += 1
+        if result["correct"]:
+            stats[result["difficulty"]]['correct'] += 1
+    else:
+        if not job["failed"]:
+            print(f"\nError processing {job['input_path']}: {str(error)}")
+        job["failed"] = True
+    
+    job["pending"] -= 1
+    if job["pending"] > 0:
+        return
+    
+    try:
+        if not job["failed"]:
+            save_evaluation_results(job)
+    except Exception as e:
+        print(f"\nError processing {job['input_path']}: {str(e)}")
+    finally:
+        pbar.update(job["cost"])
 
-def process_files(files_to_process):
+def process_files(files_to_process, max_workers=MAX_WORKERS):
     stats = defaultdict(lambda: {'correct': 0, 'total': 0})
+    jobs = load_jobs(files_to_process)
     
-    with tqdm(total=len(files_to_process), desc="Processing files") as pbar:
-        for problem_path, input_path, output_path, model_name in files_to_process:
-            try:
-                # Read problem data
-                with open(os.path.join(problem_path, 'problem.json'), 'r', encoding='utf-8') as f:
-                    problem_data = json.load(f)
-                
-                # Read answer file
-                with open(input_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                sub_questions_count = len(problem_data["answer"])
-                evaluation_results = {model_name: {}}
-                
-                difficulty = problem_data["difficulty"]
-                context = problem_data["question_structure"]["context"]
-                
-                # Process each sub-question
-                for sub_q_num in range(1, sub_questions_count + 1):
-                    sub_q_key = f"sub_question_{sub_q_num}"
-                    expected_answer = problem_data["answer"][sub_q_num - 1]
-                    question_content = problem_data["question_structure"][sub_q_key]
-                    
-                    # Use new answer extraction method
-                    actual_answer = extract_answer_with_retry(content, question_content, sub_q_num)
-                    
-                    is_correct = evaluate_with_deepseek(
-                        actual_answer, 
-                        expected_answer,
-                        question_content
-                    ) if actual_answer else False
-                    
-                    stats[difficulty]['total'] += 1
-                    if is_correct:
-                        stats[difficulty]['correct'] += 1
-                    
-                    evaluation_results[model_name][sub_q_key] = {
-                        "correct": is_correct,
-                        "actual_answer": actual_answer,
-                        "expected_answer": expected_answer,
-                        "context": context,
-                        "question_content": question_content,
-                        "difficulty": difficulty
-                    }
-                
-                # Save evaluation results
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(evaluation_results, f, indent=4, ensure_ascii=False)
-                print(f"Saved evaluation results to {output_path}")
-                
-            except Exception as e:
-                print(f"\nError processing {input_path}: {str(e)}")
-                continue
+    total_cost = sum(file[4] for file in files_to_process)
+    with cost_bar(total_cost, desc="Processing files") as pbar:
+        pbar.update(total_cost - sum(job["cost"] for job in jobs))
+        
+        # Grade every sub-question of every problem on one bounded pool
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for job in jobs:
+                for sub_q_num in range(1, job["pending"] + 1):
+                    future = executor.submit(grade_sub_question, job["content"], job["problem_data"], sub_q_num, job["journal"])
+                    futures[future] = (job, sub_q_num)
+                if job["pending"] == 0:
+                    save_evaluation_results(job)
+                    pbar.update(job["cost"])
             
-            finally:
-                pbar.update(1)
+            for future in as_completed(futures):
+                job, sub_q_num = futures[future]
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                record_sub_question(job, sub_q_num, result, error, stats, pbar)
+    
+    return stats
+
+async def aprocess_files(files_to_process, concurrency=MAX_WORKERS):
+    """process_files on the asyncio engine: sub-questions run as tasks, at most `concurrency` at once.
+
+    Gives the same score JSON and stats as process_files; the task group cancels
+    every outstanding request if the run is interrupted."""
+    stats = defaultdict(lambda: {'correct': 0, 'total': 0})
+    jobs = load_jobs(files_to_process)
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    total_cost = sum(file[4] for file in files_to_process)
+    with cost_bar(total_cost, desc="Processing files") as pbar:
+        pbar.update(total_cost - sum(job["cost"] for job in jobs))
+        
+        async def grade(job, sub_q_num):
+            async with semaphore:
+                try:
+                    result, error = await arun_plan(client, plan_grade_sub_question(job["content"], job["problem_data"], sub_q_num, job["journal"])), None
+                except Exception as e:
+                    result, error = None, e
+            record_sub_question(job, sub_q_num, result, error, stats, pbar)
+        
+        async with asyncio.TaskGroup() as task_group:
+            for job in jobs:
+                for sub_q_num in range(1, job["pending"] + 1):
+                    task_group.create_task(grade(job, sub_q_num))
+                if job["pending"] == 0:
+                    save_evaluation_results(job)
+                    pbar.update(job["cost"])
     
     return stats
 
@@ -183,16 +330,28 @@ def main():
         
         if not files_to_process:
             print("No files need to be processed")
+            print(leaderboard_report(base_path))
             return
         
         # Process files and collect statistics
-        stats = process_files(files_to_process)
+        if USE_ASYNC:
+            stats = asyncio.run(aprocess_files(files_to_process))
+        else:
+            stats = process_files(files_to_process)
         
         # Print statistics
-        print("\nFinal Statistics:")
+        print("\nThis run:")
         for difficulty, results in stats.items():
             accuracy = (results['correct'] / results['total'] * 100) if results['total'] > 0 else 0
             print(f"{difficulty.capitalize()}: {results['correct']}/{results['total']} correct ({accuracy:.1f}%)")
+        print(cache_report())
+        print(rate_limit_report())
+        print(prompt_cache_report())
+        print(profile_report())
+        print(saved_calls_report())
+        print(store_report())
+        # Counts every problem graded so far, including the ones skipped by this run
+        print(leaderboard_report(base_path))
             
     except Exception as e:
         print(f"\nError occurred: {str(e)}", file=sys.stderr)
@@ -0,0 +1,108 @@
+import os
+import json
+import math
+import threading
+from collections import defaultdict
+
+PROFILE_ENABLED = True
+TRACE_PATH = None  # e.g. "llm_trace.json": every call as a Chrome trace event (open in chrome://tracing or Perfetto)
+
+_calls = []
+_calls_lock = threading.Lock()
+
+def record_call(kind, start, duration, latency=None, retries=0, usage=None, cached=False, coalesced=False, stopped=False, error=None, lane=None):
+    """Record one chat() call.
+
+    kind is "<stage>.<prompt kind>" (e.g. "step.judge_value"), start the wall-clock
+    time it began, duration the seconds until it returned (rate-limit waits and
+    retries included) and latency the seconds of the API request that answered it.
+    coalesced calls waited for an identical request already in flight, and
+    stopped ones were streamed and closed once the caller had what it needed."""
+    if not PROFILE_ENABLED:
+        return
+    kind = kind or "unlabelled"
+    record = {
+        "kind": kind,
+        "stage": kind.split('.', 1)[0],
+        "start": start,
+        "duration": duration,
+        "latency": latency,
+        "retries": retries,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "cached": cached,
+        "coalesced": coalesced,
+        "stopped": stopped,
+        "error": error,
+        "lane": lane or threading.current_thread().name,
+    }
+    with _calls_lock:
+        _calls.append(record)
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+def profile_report():
+    """p50/p95/p99 API latency, retries and tokens per prompt kind, for printing at the end of a run.
+
+    Also writes the trace file when TRACE_PATH is set."""
+    with _calls_lock:
+        calls = list(_calls)
+    if not calls:
+        return "LLM call profile: no calls"
+    by_kind = defaultdict(list)
+    for call in calls:
+        by_kind[call["kind"]].append(call)
+
+    lines = ["LLM call profile (API latency in seconds; wait = time in rate limiter and retries):"]
+    for kind, kind_calls in sorted(by_kind.items()):
+        sent = [call for call in kind_calls if call["latency"] is not None]
+        cached = sum(1 for call in kind_calls if call["cached"])
+        coalesced = sum(1 for call in kind_calls if call["coalesced"])
+        stopped = sum(1 for call in kind_calls if call["stopped"])
+        failed = sum(1 for call in kind_calls if call["error"])
+        retries = sum(call["retries"] for call in kind_calls)
+        line = f"  {kind}: {len(kind_calls)} calls ({cached} cached, {coalesced} coalesced, {failed} failed, {retries} retries)"
+        if stopped:
+            line += f", {stopped} stopped early"
+        if sent:
+            latencies = sorted(call["latency"] for call in sent)
+            waits = sum(call["duration"] - call["latency"] for call in sent) / len(sent)
+            prompt_tokens = [call["prompt_tokens"] for call in sent if call["prompt_tokens"] is not None]
+            completion_tokens = [call["completion_tokens"] for call in sent if call["completion_tokens"] is not None]
+            line += (f", p50 {percentile(latencies, 50):.2f} p95 {percentile(latencies, 95):.2f} "
+                     f"p99 {percentile(latencies, 99):.2f}, mean wait {waits:.2f}")
+            if prompt_tokens:
+                line += f", tokens {sum(prompt_tokens)} in / {sum(completion_tokens)} out"
+        lines.append(line)
+
+    if TRACE_PATH:
+        lines.append(f"Trace of {export_trace(TRACE_PATH)} calls written to {TRACE_PATH}")
+    return "\n".join(lines)
+
+def export_trace(path):
+    """Write every recorded call as a Chrome trace-event JSON file and return the number of calls"""
+    with _calls_lock:
+        calls = list(_calls)
+    lanes = {}
+    events = []
+    for call in calls:
+        tid = lanes.setdefault(call["lane"], len(lanes) + 1)
+        events.append({
+            "name": call["kind"],
+            "cat": call["stage"],
+            "ph": "X",
+            "ts": call["start"] * 1e6,
+            "dur": call["duration"] * 1e6,
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {key: call[key] for key in ("latency", "retries", "prompt_tokens", "completion_tokens", "cached", "coalesced", "stopped", "error")},
+        })
+    events.extend(
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": lane}}
+        for lane, tid in lanes.items()
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(calls)
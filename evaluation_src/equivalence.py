@@ -0,0 +1,171 @@
+import re
+import math
+import random
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication, implicit_application, convert_xor
+except ImportError:  # sympy is optional; without it only numbers with units are decided locally
+    sympy = None
+
+REL_TOL = 0.01  # Numbers within this relative difference are equal
+MISMATCH_TOL = 0.05  # Numbers further apart than this are confidently different; in between the LLM decides
+MAX_EXPRESSION_LENGTH = 200  # Longer expressions are left to the LLM
+SAMPLE_POINTS = 3  # Random substitutions used to compare symbolic expressions
+
+# Units that convert to a base unit by a factor; anything else must match literally
+UNIT_SCALES = {
+    'km': ('m', 1e3), 'cm': ('m', 1e-2), 'mm': ('m', 1e-3), 'μm': ('m', 1e-6), 'um': ('m', 1e-6), 'nm': ('m', 1e-9),
+    'g': ('kg', 1e-3), 'mg': ('kg', 1e-6),
+    'ms': ('s', 1e-3), 'μs': ('s', 1e-6), 'us': ('s', 1e-6), 'min': ('s', 60), 'h': ('s', 3600),
+    'km/h': ('m/s', 1 / 3.6), 'cm/s': ('m/s', 1e-2), 'cm/s2': ('m/s2', 1e-2),
+    'kN': ('N', 1e3), 'mN': ('N', 1e-3),
+    'kJ': ('J', 1e3), 'MJ': ('J', 1e6), 'eV': ('J', 1.602176634e-19), 'keV': ('J', 1.602176634e-16), 'MeV': ('J', 1.602176634e-13),
+    'kW': ('W', 1e3), 'MW': ('W', 1e6), 'mW': ('W', 1e-3),
+    'kPa': ('Pa', 1e3), 'MPa': ('Pa', 1e6),
+    'kV': ('V', 1e3), 'mV': ('V', 1e-3),
+    'mA': ('A', 1e-3), 'μA': ('A', 1e-6), 'uA': ('A', 1e-6),
+    'kΩ': ('Ω', 1e3), 'MΩ': ('Ω', 1e6),
+    'mC': ('C', 1e-3), 'μC': ('C', 1e-6), 'uC': ('C', 1e-6), 'nC': ('C', 1e-9),
+    'mF': ('F', 1e-3), 'μF': ('F', 1e-6), 'uF': ('F', 1e-6), 'nF': ('F', 1e-9), 'pF': ('F', 1e-12),
+    'mH': ('H', 1e-3), 'mT': ('T', 1e-3),
+    'L': ('m3', 1e-3), 'mL': ('m3', 1e-6), 'cm3': ('m3', 1e-6), 'g/cm3': ('kg/m3', 1e3),
+}
+
+LATEX_REPLACEMENTS = [
+    (re.compile(r'\\(?:text|mathrm|rm|mathit|operatorname)\s*\{([^{}]*)\}'), r' \1'),
+    (re.compile(r'\\d?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}'), r'((\1)/(\2))'),
+    (re.compile(r'\\sqrt\s*\{([^{}]*)\}'), r'sqrt(\1)'),
+    (re.compile(r'\^\s*\{?\s*\\circ\s*\}?'), '°'),
+    (re.compile(r'\\(?:times|cdot)'), '*'),
+    (re.compile(r'\\(?:left|right|displaystyle)'), ''),
+    (re.compile(r'\\[,;:! ]|~'), ' '),
+    (re.compile(r'\\Omega'), 'Ω'),
+    (re.compile(r'\\mu\s*'), 'μ'),
+    (re.compile(r'\\([A-Za-z]+)'), r' \1 '),
+]
+
+NUMBER = r'[-+−]?(?:\d+(?:\.\d*)?|\.\d+)'
+QUANTITY_PATTERN = re.compile(
+    rf'^(?:[A-Za-z][\w\']*(?:_\w+)?\s*=\s*)?'  # optional "v =" / "v_0 ="
+    rf'(?P<number>{NUMBER})'
+    rf'(?:\s*[eE]\s*(?P<exp>[-+−]?\d+)|\s*[*×x]\s*10\s*\^\s*\(?\s*(?P<pow>[-+−]?\d+)\s*\)?)?'
+    rf'\s*(?P<unit>[^=]*?)\s*\.?$'
+)
+UNIT_PATTERN = re.compile(r'^[A-Za-zΩμ°]+(?:[./]?[A-Za-zΩμ°]+|-?\d)*$')
+SAFE_EXPRESSION = re.compile(r'^[\w\s.+\-*/^()=]*$')
+IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+FUNCTIONS = {'sqrt', 'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'asin', 'acos', 'atan',
+             'sinh', 'cosh', 'tanh', 'exp', 'log', 'ln', 'pi'}
+
+def clean_latex(text):
+    """Plain-text form of a (simple) LaTeX or markdown answer"""
+    text = text.replace('$', '').strip().strip('*').strip()
+    for pattern, replacement in LATEX_REPLACEMENTS:
+        text = pattern.sub(replacement, text)
+    return text.replace('{', '(').replace('}', ')').replace('−', '-').strip()
+
+def normalize_unit(unit):
+    unit = re.sub(r'[\s^()]', '', unit).replace('·', '.').replace('*', '.')
+    return UNIT_SCALES.get(unit, (unit, 1.0))
+
+def parse_quantity(text):
+    """(value, unit) of a single number with an optional unit, e.g. "v = 2.5e3 m/s", or None"""
+    match = QUANTITY_PATTERN.match(clean_latex(text))
+    if match is None:
+        return None
+    value = float(match.group('number').replace('−', '-'))
+    exponent = match.group('exp') or match.group('pow')
+    if exponent:
+        value *= 10 ** int(exponent.replace('−', '-'))
+    unit = match.group('unit').strip()
+    if unit and not UNIT_PATTERN.match(re.sub(r'[\s^()*·]', '', unit)):
+        return None
+    base_unit, scale = normalize_unit(unit)
+    return value * scale, base_unit
+
+def values_equivalent(actual, expected):
+    """True/False when both sides are plain numbers with compatible units, None when undecidable"""
+    actual_quantity = parse_quantity(actual)
+    expected_quantity = parse_quantity(expected)
+    if actual_quantity is None or expected_quantity is None:
+        return None
+    (actual_value, actual_unit), (expected_value, expected_unit) = actual_quantity, expected_quantity
+    if actual_unit != expected_unit:
+        return None
+    difference = abs(actual_value - expected_value)
+    scale = max(abs(actual_value), abs(expected_value))
+    if difference <= REL_TOL * scale:
+        return True
+    if difference > MISMATCH_TOL * scale:
+        return False
+    return None
+
+def _parse_expression(text):
+    text = clean_latex(text).replace('μ', ' mu ')
+    if len(text) > MAX_EXPRESSION_LENGTH or not SAFE_EXPRESSION.match(text) or '__' in text:
+        return None
+    transformations = standard_transformations + (implicit_multiplication, implicit_application, convert_xor)
+    # Every other name is a plain symbol, so E, I, N or S are not taken for sympy objects
+    local_dict = {name: sympy.Symbol(name) for name in IDENTIFIER.findall(text) if name not in FUNCTIONS}
+    local_dict['ln'] = sympy.log
+    try:
+        sides = [parse_expr(side, local_dict=local_dict, transformations=transformations) for side in text.split('=')]
+    except Exception:
+        return None
+    return sides
+
+def _is_finite(value):
+    return math.isfinite(value.real) and math.isfinite(value.imag)
+
+def _same_function(a, b):
+    """Whether two sympy expressions agree at a few random positive points"""
+    symbols = sorted(a.free_symbols | b.free_symbols, key=str)
+    rng = random.Random(0)
+    for _ in range(SAMPLE_POINTS):
+        point = {symbol: rng.uniform(0.5, 2.0) for symbol in symbols}
+        try:
+            a_value = complex(a.evalf(subs=point))
+            b_value = complex(b.evalf(subs=point))
+        except Exception:
+            return False
+        if not (_is_finite(a_value) and _is_finite(b_value)):
+            return False
+        if abs(a_value - b_value) > 1e-9 * max(1.0, abs(a_value), abs(b_value)):
+            return False
+    return True
+
+def expressions_equivalent(actual, expected):
+    """True when two expressions or equations are provably the same, None otherwise (never a confident False).
+
+    Equations match when their lhs - rhs agree; a leading "v =" on only one side is ignored."""
+    if sympy is None:
+        return None
+    actual_sides = _parse_expression(actual)
+    expected_sides = _parse_expression(expected)
+    if actual_sides is None or expected_sides is None or len(actual_sides) > 2 or len(expected_sides) > 2:
+        return None
+    try:
+        if len(actual_sides) == len(expected_sides) == 2:
+            actual_expr = actual_sides[0] - actual_sides[1]
+            expected_expr = expected_sides[0] - expected_sides[1]
+            same = _same_function(actual_expr, expected_expr) or _same_function(actual_expr, -expected_expr)
+        else:
+            same = _same_function(actual_sides[-1], expected_sides[-1])
+    except Exception:
+        return None
+    return True if same else None
+
+def answers_equivalent(actual, expected):
+    """Local verdict on two final answers: numbers with units first, then symbolic expressions"""
+    verdict = values_equivalent(actual, expected)
+    if verdict is None:
+        verdict = expressions_equivalent(actual, expected)
+    return verdict
+
+def single_quantity_verdict(quantities, field, actual_content, judge):
+    """Local verdict on the extracted content when exactly one quantity has an expected `field` ('value' or 'equation'), else None"""
+    expected = [q[field] for q in quantities if q[field] != 'N/A']
+    if len(expected) != 1:
+        return None
+    return judge(actual_content, expected[0])
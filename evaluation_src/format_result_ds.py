@@ -1,11 +1,19 @@
 import os
-from openai import OpenAI
+import llm_client
+from llm_client import ChatRequest, run_plan, arun_plan, prompt_cache_report, saved_calls_report
+from llm_cache import cache_report
+from rate_limit import pick_key, rate_limit_report
+from call_profile import profile_report
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from result_parser import split_sub_questions, parse_sub_question
 import json
+import re
 from tqdm import tqdm
 import time
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-import random
 
 TARGET_FILES = {
     'deepseek_r1.txt', 
@@ -14,29 +22,29 @@ TARGET_FILES = {
 API_KEYS = [
     "you_api_keys_list"
 ]
+WORKERS_PER_KEY = 4  # Concurrent workers per key; the rate limiter keeps each key within its quota
+USE_ASYNC = False  # Restructure on the asyncio engine (one event loop) instead of a thread pool
+ALL_MODELS = False  # Restructure every model output (*.txt) under result/ instead of only TARGET_FILES
+CHUNKED_RESTRUCTURE = False  # Split long outputs into chunks restructured concurrently, then stitch them with continuous step numbers
+CHUNK_TOKENS = 8000  # Approximate tokens per chunk (about 3 characters per token); shorter outputs are sent whole
+
+# Lines where a raw output starts working on a sub-question, preferred as chunk boundaries
+SUB_QUESTION_START = re.compile(
+    r'^\s*[#*>\s]*(?:\(\d+\)|（\d+）|sub_question_\d+|(?:sub-?question|part|question)\s*\d+|第\s*[一二三四五六七八九十\d]+\s*[问小题])',
+    re.IGNORECASE
+)
 
-thread_local = threading.local()
-api_key_lock = threading.Lock()
-current_api_key_index = 0
 processed_count = 0
 total_count = 0
 count_lock = threading.Lock()
 
 def get_next_api_key():
-    global current_api_key_index
-    with api_key_lock:
-        api_key = API_KEYS[current_api_key_index]
-        current_api_key_index = (current_api_key_index + 1) % len(API_KEYS)
-        return api_key
+    # The key with free quota soonest, so no key sits idle while another is cooling down after a 429
+    return pick_key(API_KEYS)
 
 def get_client():
-    if not hasattr(thread_local, 'client'):
-        api_key = get_next_api_key()
-        thread_local.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
-    return thread_local.client
+    # Clients (and their connection pools) are shared per key
+    return llm_client.get_client(get_next_api_key())
 
 def retry_with_new_key(func):
     def wrapper(*args, **kwargs):
@@ -46,13 +54,8 @@ def retry_with_new_key(func):
                 return func(*args, **kwargs)
             except Exception as e:
                 if attempt < max_retries - 1:
+                    # Backoff is left to the rate limiter; the next call picks the least loaded key
                     tqdm.write(f"\nRetrying with new API key. Error: {str(e)}")
-                    api_key = get_next_api_key()
-                    thread_local.client = OpenAI(
-                        api_key=api_key,
-                        base_url="https://api.deepseek.com"
-                    )
-                    time.sleep(1)
                 else:
                     raise e
     return wrapper
@@ -61,10 +64,13 @@ def ensure_directory(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
-@retry_with_new_key
-def process_with_deepseek(content, problem_structure):
-    client = get_client()
-    
+def plan_restructure(content, problem_structure, part=1, parts=1):
+    """Request plan of the restructuring call, run by process_with_deepseek or aprocess_with_deepseek.
+
+    With parts > 1 the content is chunk `part` of a long output (see split_content)."""
+    # The chunk note goes after the fixed instructions, so every chunk of a problem shares the prompt prefix
+    chunk_note = "" if parts == 1 else f"""This content is part {part} of {parts} of one solution, split for length. Restructure only this part: label each step with the sub_question it works on, number its steps from step_1 (steps are renumbered continuously when the parts are stitched together, so the continuity rule above does not apply across parts), and only give sub_question_N_answer for a sub_question whose final answer is stated in this part.
+"""
     prompt = f"""
 Given the following problem structure:
 {json.dumps(problem_structure, indent=2)}
@@ -87,101 +93,238 @@ step_5: [reasoning step]
 sub_question_3_answer: [final answer]
 The step sequences of different sub_questions should be continuous.
 Do not return other content.
-Content to restructure:
+{chunk_note}Content to restructure:
 {content}
 """
-    response = client.chat.completions.create(
+    reply = yield ChatRequest(
         model="deepseek-chat",
+        kind="restructure",
         messages=[
             {"role": "system", "content": "You are a helpful assistant"},
             {"role": "user", "content": prompt},
-        ],
-        stream=False
+        ]
     )
     
-    return response.choices[0].message.content
+    return reply
+
+@retry_with_new_key
+def process_with_deepseek(content, problem_structure, part=1, parts=1):
+    return run_plan(get_client(), plan_restructure(content, problem_structure, part, parts))
+
+async def aprocess_with_deepseek(content, problem_structure, part=1, parts=1):
+    max_retries = len(API_KEYS)
+    for attempt in range(max_retries):
+        try:
+            client = llm_client.get_async_client(get_next_api_key())
+            return await arun_plan(client, plan_restructure(content, problem_structure, part, parts))
+        except Exception as e:
+            if attempt < max_retries - 1:
+                tqdm.write(f"\nRetrying with new API key. Error: {str(e)}")
+            else:
+                raise e
+
+def _cut_point(lines, begin, end, sub_question_starts):
+    """Line index where the chunk lines[begin:end] should end: the last sub-question start
+    in its second half, else the line after its last blank line there, else end"""
+    half = begin + (end - begin) // 2
+    for i in range(end - 1, half, -1):
+        if i in sub_question_starts:
+            return i
+    for i in range(end - 1, half, -1):
+        if not lines[i].strip():
+            return i + 1
+    return end
+
+def split_content(content, max_tokens=CHUNK_TOKENS):
+    """Split a raw output into chunks of about max_tokens, cutting at sub-question starts or paragraph breaks"""
+    budget = max_tokens * 3
+    if len(content) <= budget:
+        return [content]
+    lines = content.splitlines(keepends=True)
+    sub_question_starts = {i for i, line in enumerate(lines) if SUB_QUESTION_START.match(line)}
+    chunks = []
+    begin = 0
+    size = 0
+    for i, line in enumerate(lines):
+        if i > begin and size + len(line) > budget:
+            cut = _cut_point(lines, begin, i, sub_question_starts)
+            chunks.append(''.join(lines[begin:cut]))
+            size = sum(len(chunk_line) for chunk_line in lines[cut:i])
+            begin = cut
+        size += len(line)
+    chunks.append(''.join(lines[begin:]))
+    return chunks
+
+def stitch_chunks(replies, problem_structure):
+    """Join the restructured chunks into one output: the steps of each sub-question in chunk order,
+    numbered continuously across sub-questions, and the last answer given for it"""
+    merged = {key: {"steps": [], "answer": ""} for key in problem_structure if key.startswith('sub_question_')}
+    for reply in replies:
+        for sub_q_label, sub_q_block in split_sub_questions(reply).items():
+            parsed = parse_sub_question(sub_q_label, sub_q_block)
+            sub_q = merged.setdefault(sub_q_label, {"steps": [], "answer": ""})
+            sub_q["steps"].extend(step["content"] for step in parsed["steps"].values())
+            if parsed["answer"]:
+                sub_q["answer"] = parsed["answer"]
+
+    lines = []
+    step = 1
+    for sub_q_label, sub_q in merged.items():
+        if not sub_q["steps"] and not sub_q["answer"]:
+            continue
+        lines.append(f"{sub_q_label}:")
+        for step_content in sub_q["steps"]:
+            lines.append(f"step_{step}: {step_content}")
+            step += 1
+        lines.append(f"{sub_q_label}_answer: {sub_q['answer']}")
+    return "\n".join(lines) + "\n"
+
+def restructure_content(content, problem_structure):
+    """Restructured text of a raw output; with CHUNKED_RESTRUCTURE a long output is restructured chunk by chunk in parallel"""
+    chunks = split_content(content, CHUNK_TOKENS) if CHUNKED_RESTRUCTURE else [content]
+    if len(chunks) == 1:
+        return process_with_deepseek(content, problem_structure)
+    # llm_client.MAX_IN_FLIGHT still caps the requests of all files together
+    with ThreadPoolExecutor(max_workers=len(chunks)) as chunk_executor:
+        replies = list(chunk_executor.map(
+            lambda part: process_with_deepseek(chunks[part - 1], problem_structure, part, len(chunks)),
+            range(1, len(chunks) + 1)
+        ))
+    return stitch_chunks(replies, problem_structure)
+
+async def arestructure_content(content, problem_structure):
+    """restructure_content on the asyncio engine"""
+    chunks = split_content(content, CHUNK_TOKENS) if CHUNKED_RESTRUCTURE else [content]
+    if len(chunks) == 1:
+        return await aprocess_with_deepseek(content, problem_structure)
+    replies = await asyncio.gather(*(
+        aprocess_with_deepseek(chunk, problem_structure, part, len(chunks))
+        for part, chunk in enumerate(chunks, 1)
+    ))
+    return stitch_chunks(replies, problem_structure)
+
+def is_target(file):
+    """Whether result/<file> is a model output to restructure"""
+    return file.endswith('.txt') if ALL_MODELS else file in TARGET_FILES
+
+def get_output_path(problem_path, file):
+    filename_without_ext = os.path.splitext(file)[0]
+    return os.path.join(problem_path, 'txt', f"{filename_without_ext}_ds.txt")
+
+def restructure_file(problem_path, file, problem_structure):
+    """Restructure result/<file> into txt/<file>_ds.txt unless it already exists, returning the output path"""
+    input_path = os.path.join(problem_path, 'result', file)
+    output_path = get_output_path(problem_path, file)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    if os.path.exists(output_path):
+        return output_path
+        
+    with open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    processed_content = restructure_content(content, problem_structure)
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(processed_content)
+    return output_path
+
+async def arestructure_file(problem_path, file, problem_structure):
+    """restructure_file on the asyncio engine"""
+    input_path = os.path.join(problem_path, 'result', file)
+    output_path = get_output_path(problem_path, file)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    if os.path.exists(output_path):
+        return output_path
+        
+    with open(input_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    processed_content = await arestructure_content(content, problem_structure)
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(processed_content)
+    return output_path
+
+async def aprocess_single_file(semaphore, problem_path, file, problem_structure, cost, main_pbar):
+    global processed_count
+    async with semaphore:
+        try:
+            await arestructure_file(problem_path, file, problem_structure)
+            processed_count += 1
+            print(f"\rProcessed: {processed_count}/{total_count} files ({(processed_count/total_count)*100:.2f}%)", end="")
+            return True
+        except Exception as e:
+            tqdm.write(f"\nError processing {os.path.join(problem_path, 'result', file)}: {str(e)}")
+            return False
+        finally:
+            main_pbar.update(cost)
 
 def process_single_file(args):
     global processed_count
-    problem_path, file, problem_structure, main_pbar = args
+    problem_path, file, problem_structure, cost, main_pbar = args
     
     try:
-        input_path = os.path.join(problem_path, 'result', file)
-        txt_folder = os.path.join(problem_path, 'txt')
-        if not os.path.exists(txt_folder):
-            os.makedirs(txt_folder)
-            
-        filename_without_ext = os.path.splitext(file)[0]
-        new_filename = f"{filename_without_ext}_ds.txt"
-        output_path = os.path.join(txt_folder, new_filename)
-        
-        if os.path.exists(output_path):
-            with count_lock:
-                processed_count += 1
-                print(f"\rProcessed: {processed_count}/{total_count} files ({(processed_count/total_count)*100:.2f}%)", end="")
-            main_pbar.update(1)
-            return True
-            
-        with open(input_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        processed_content = process_with_deepseek(content, problem_structure)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(processed_content)
+        restructure_file(problem_path, file, problem_structure)
         
         with count_lock:
             processed_count += 1
             print(f"\rProcessed: {processed_count}/{total_count} files ({(processed_count/total_count)*100:.2f}%)", end="")
             
-        main_pbar.update(1)
+        main_pbar.update(cost)
         return True
         
     except Exception as e:
-        tqdm.write(f"\nError processing {input_path}: {str(e)}")
-        main_pbar.update(1)
+        tqdm.write(f"\nError processing {os.path.join(problem_path, 'result', file)}: {str(e)}")
+        main_pbar.update(cost)
         return False
 
-def count_total_files(base_path):
-    with tqdm(os.listdir(base_path), desc="Counting files", unit="dir") as pbar:
-        total = 0
-        for problem_dir in pbar:
-            if problem_dir.startswith('cal_problem_'):
-                problem_path = os.path.join(base_path, problem_dir)
-                if os.path.isdir(problem_path):
-                    total += len([f for f in os.listdir(os.path.join(problem_path, 'result')) if f in TARGET_FILES])
-        return total
+def pending_files(manifest):
+    """(problem_path, file, entry) of every target file whose restructured txt does not exist yet"""
+    for problem_dir, problem_path, entry in manifest.problems('cal_problem_'):
+        for file in entry["files"]["result"]:
+            if is_target(file) and not has_file(entry, 'txt', os.path.basename(get_output_path(problem_path, file))):
+                yield problem_path, file, entry
 
-def process_files(base_path):
-    global total_count
-    print("Counting total files to process...")
-    total_count = count_total_files(base_path)
+def count_total_files(manifest):
+    return sum(1 for _ in pending_files(manifest))
+
+def count_total_cost(manifest):
+    """Estimated cost of restructuring every pending file, the total of the overall progress bar"""
+    return sum(estimate_cost(entry, 'restructure') for _, _, entry in pending_files(manifest))
+
+def collect_tasks(manifest, main_pbar):
+    """Restructuring tasks, longest problems first"""
     tasks = []
-    
-    with tqdm(total=total_count, desc="Overall progress", unit="file", position=0) as main_pbar:
-        for problem_dir in tqdm(os.listdir(base_path), desc="Collecting tasks", unit="dir", position=1, leave=False):
-            if not problem_dir.startswith('cal_problem_'):
-                continue
-                
-            problem_path = os.path.join(base_path, problem_dir)
-            if not os.path.isdir(problem_path):
-                continue
-            
+    problem_structures = {}
+    for problem_path, file, entry in tqdm(list(pending_files(manifest)), desc="Collecting tasks", unit="file", position=1, leave=False):
+        # Only problems with files left to restructure have their problem.json read
+        if problem_path not in problem_structures:
             json_path = os.path.join(problem_path, 'problem.json')
             try:
                 with open(json_path, 'r', encoding='utf-8') as f:
                     problem_data = json.load(f)
-                    problem_structure = problem_data["question_structure"]
+                    problem_structures[problem_path] = problem_data["question_structure"]
             except Exception as e:
                 tqdm.write(f"\nError reading json file {json_path}: {str(e)}")
-                continue
-            
-            for file in os.listdir(os.path.join(problem_path, "result")):
-                if file in TARGET_FILES:
-                    tasks.append((problem_path, file, problem_structure, main_pbar))
+                problem_structures[problem_path] = None
         
-        with ThreadPoolExecutor(max_workers=len(API_KEYS)) as executor:
-            random.shuffle(tasks)
+        if problem_structures[problem_path] is not None:
+            tasks.append((problem_path, file, problem_structures[problem_path], estimate_cost(entry, 'restructure'), main_pbar))
+    # Long outputs start first, so they do not hold up the end of the run (LPT scheduling)
+    return lpt_order(tasks, lambda task: task[3])
+
+def process_files(base_path):
+    global total_count
+    print("Counting total files to process...")
+    manifest = load_manifest(base_path)
+    total_count = count_total_files(manifest)
+    
+    with cost_bar(count_total_cost(manifest), desc="Overall progress") as main_pbar:
+        tasks = collect_tasks(manifest, main_pbar)
+        
+        with ThreadPoolExecutor(max_workers=len(API_KEYS) * WORKERS_PER_KEY) as executor:
             list(tqdm(
                 executor.map(process_single_file, tasks),
                 total=len(tasks),
@@ -191,19 +334,41 @@ def process_files(base_path):
                 leave=False
             ))
 
+async def aprocess_files(base_path):
+    """process_files on the asyncio engine; a task group cancels every request on error or Ctrl+C"""
+    global total_count
+    print("Counting total files to process...")
+    manifest = load_manifest(base_path)
+    total_count = count_total_files(manifest)
+    semaphore = asyncio.Semaphore(len(API_KEYS) * WORKERS_PER_KEY)
+    
+    with cost_bar(count_total_cost(manifest), desc="Overall progress") as main_pbar:
+        tasks = collect_tasks(manifest, main_pbar)
+        async with asyncio.TaskGroup() as task_group:
+            for task in tasks:
+                task_group.create_task(aprocess_single_file(semaphore, *task))
+
 def main():
     base_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
     
     print("Starting file processing...")
-    print(f"Target files to process: {', '.join(TARGET_FILES)}")
-    print(f"Using {len(API_KEYS)} API keys with {len(API_KEYS)} concurrent workers")
+    print(f"Target files to process: {'every model output' if ALL_MODELS else ', '.join(TARGET_FILES)}")
+    print(f"Using {len(API_KEYS)} API keys with {len(API_KEYS) * WORKERS_PER_KEY} concurrent workers")
     
     start_time = time.time()
-    process_files(base_path)
+    if USE_ASYNC:
+        asyncio.run(aprocess_files(base_path))
+    else:
+        process_files(base_path)
     elapsed_time = time.time() - start_time
     
     print(f"\nProcessing completed in {elapsed_time:.2f} seconds")
     print(f"Total files processed: {processed_count}/{total_count}")
+    print(cache_report())
+    print(rate_limit_report())
+    print(prompt_cache_report())
+    print(profile_report())
+    print(saved_calls_report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import atexit
+import threading
+from manifest import load_manifest, state_path, write_state, output_model
+
+LEADERBOARD_ENABLED = True
+LEADERBOARD_NAME = "leaderboard.json"  # Kept next to manifest.json in the state subfolder of the benchmark
+SAVE_INTERVAL = 5  # Seconds between writes of the state file; files finished in between are backfilled after a crash
+
+def answer_contribution(model, results):
+    """('answer', model, {difficulty: [correct, total]}) of one score file; results maps sub-question to its result"""
+    by_difficulty = {}
+    for result in results.values():
+        cell = by_difficulty.setdefault(result["difficulty"], [0, 0])
+        cell[0] += 1 if result["correct"] else 0
+        cell[1] += 1
+    return ['answer', model, by_difficulty]
+
+def step_contribution(model, difficulty, txt_results):
+    """('step', model, {difficulty: [score sum, sub-questions]}) of one step evaluation file"""
+    scores = [sub_q_result['score'] for sub_q_result in txt_results.values()]
+    return ['step', model, {difficulty: [sum(scores), len(scores)]}]
+
+class Leaderboard:
+    """Running per-model, per-difficulty totals of answer accuracy and mean sub-question step score.
+
+    Every finished output file adds its contribution, kept per file so a
+    re-evaluated file replaces its old numbers instead of counting twice.
+    Output files the state does not know yet (written before a crash, or by
+    an older version) are read once when the leaderboard is loaded, and
+    files that no longer exist are dropped, so the totals always match what
+    is on disk regardless of how many runs produced it."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = state_path(base_path, LEADERBOARD_NAME)
+        self.data = {"totals": {}, "files": {}}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except ValueError:
+                pass  # A damaged state file is rebuilt from the outputs
+        self.backfill()
+
+    def _apply(self, contribution, sign):
+        stage, model, by_difficulty = contribution
+        for difficulty, (amount, count) in by_difficulty.items():
+            cell = self.data["totals"].setdefault(stage, {}).setdefault(model, {}).setdefault(str(difficulty), [0, 0])
+            cell[0] += sign * amount
+            cell[1] += sign * count
+
+    def _record(self, key, contribution):
+        old = self.data["files"].get(key)
+        if old is not None:
+            self._apply(old, -1)
+        self.data["files"][key] = contribution
+        self._apply(contribution, 1)
+        self._dirty = True
+
+    def record(self, key, contribution):
+        """Add (or replace) the contribution of one output file, key being <problem>/<folder>/<file>"""
+        with self._lock:
+            self._record(key, contribution)
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save()
+
+    def backfill(self):
+        """Bring the totals in line with the score/ and evaluation/ files listed in the manifest"""
+        present = set()
+        with self._lock:
+            for problem_dir, problem_path, entry in load_manifest(self.base_path).problems():
+                for folder in ('score', 'evaluation'):
+                    for file in entry["files"].get(folder, []):
+                        if not file.endswith('.json'):
+                            continue
+                        key = f"{problem_dir}/{folder}/{file}"
+                        present.add(key)
+                        # Contributions counted under an older naming of the model are read again
+                        if key in self.data["files"] and self.data["files"][key][1] == output_model(file):
+                            continue
+                        try:
+                            with open(os.path.join(problem_path, folder, file), 'r', encoding='utf-8') as f:
+                                output = json.load(f)
+                            if folder == 'score':
+                                for results in output.values():
+                                    self._record(key, answer_contribution(output_model(file), results))
+                            else:
+                                self._record(key, step_contribution(output_model(file), entry["difficulty"], output))
+                        except (ValueError, KeyError, TypeError, AttributeError):
+                            continue  # Not an evaluation output
+            for key in set(self.data["files"]) - present:
+                self._apply(self.data["files"].pop(key), -1)
+                self._dirty = True
+            self._save()
+
+    def _save(self):
+        if not self._dirty:
+            return
+        write_state(self.path, self.data)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def report(self):
+        """Leaderboard of every model, best answer accuracy first"""
+        with self._lock:
+            answer = self.data["totals"].get('answer', {})
+            step = self.data["totals"].get('step', {})
+            rows = []
+            for model in set(answer) | set(step):
+                answer_cells = answer.get(model, {})
+                step_cells = step.get(model, {})
+                correct = sum(cell[0] for cell in answer_cells.values())
+                total = sum(cell[1] for cell in answer_cells.values())
+                score = sum(cell[0] for cell in step_cells.values())
+                count = sum(cell[1] for cell in step_cells.values())
+                line = f"{model}:"
+                if total:
+                    per_difficulty = ", ".join(
+                        f"{difficulty} {cell[0] / cell[1] * 100:.1f}%"
+                        for difficulty, cell in sorted(answer_cells.items()) if cell[1]
+                    )
+                    line += f" answer {correct}/{total} ({correct / total * 100:.1f}%; {per_difficulty})"
+                if count:
+                    per_difficulty = ", ".join(
+                        f"{difficulty} {cell[0] / cell[1]:.3f}"
+                        for difficulty, cell in sorted(step_cells.items()) if cell[1]
+                    )
+                    line += f" step score {score / count:.3f} ({per_difficulty})"
+                rows.append((correct / total if total else -1, line))
+        lines = [line for _, line in sorted(rows, reverse=True)]
+        return "Leaderboard (all runs):\n" + ("\n".join(lines) if lines else "no results yet")
+
+_leaderboards = {}
+_leaderboards_lock = threading.Lock()
+
+def get_leaderboard(base_path):
+    """Return the process-wide leaderboard of a benchmark folder, or None when disabled"""
+    if not LEADERBOARD_ENABLED:
+        return None
+    base_path = os.path.abspath(base_path)
+    with _leaderboards_lock:
+        leaderboard = _leaderboards.get(base_path)
+        if leaderboard is None:
+            leaderboard = Leaderboard(base_path)
+            _leaderboards[base_path] = leaderboard
+            atexit.register(leaderboard.save)
+        return leaderboard
+
+def record_answer_file(problem_path, output_path, results):
+    """Count a finished score file; results maps sub-question to its result"""
+    leaderboard = get_leaderboard(os.path.dirname(problem_path))
+    if leaderboard is not None:
+        key = f"{os.path.basename(problem_path)}/score/{os.path.basename(output_path)}"
+        leaderboard.record(key, answer_contribution(output_model(output_path), results))
+
+def record_step_file(problem_path, result_path, difficulty, txt_results):
+    """Count a finished step evaluation file"""
+    leaderboard = get_leaderboard(os.path.dirname(problem_path))
+    if leaderboard is not None:
+        result_name = os.path.basename(result_path)
+        key = f"{os.path.basename(problem_path)}/evaluation/{result_name}"
+        leaderboard.record(key, step_contribution(output_model(result_name), difficulty, txt_results))
+
+def leaderboard_report(base_path):
+    """Final leaderboard of a benchmark folder, for printing at the end of a run"""
+    leaderboard = get_leaderboard(base_path)
+    if leaderboard is None:
+        return "Leaderboard: disabled"
+    leaderboard.save()
+    return leaderboard.report()
@@ -0,0 +1,399 @@
+import re
+import time
+import asyncio
+import threading
+import weakref
+import concurrent.futures
+from collections import namedtuple, Counter
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+from llm_cache import get_cache, make_key
+from rate_limit import get_limiter, estimate_tokens, parse_retry_after
+from call_profile import record_call
+
+BASE_URL = "https://api.deepseek.com"
+API_KEY = "your_api_key"
+
+POOL_SIZE = 64  # Max open (and kept-alive) connections per API key
+KEEPALIVE_EXPIRY = 60  # Seconds an idle connection stays in the pool
+TIMEOUT = 600  # Seconds before a single request gives up
+MAX_IN_FLIGHT = 32  # Global cap on concurrent API requests across all threads
+MAX_RETRIES = 5  # Attempts per request on 429s, timeouts, connection and server errors
+STREAM_VERDICTS = False  # Stream requests that have stop_at and close them once it matches, instead of waiting for the full reply
+
+# stop_at of the true/false (正确/错误) judge prompts: the reply is decided by its first verdict word
+VERDICT = re.compile(r'\b(?:true|false)\b|正确|错误', re.IGNORECASE)
+
+_clients = {}
+_clients_lock = threading.Lock()
+_in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+# Async clients and semaphores belong to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+_async_in_flight = weakref.WeakKeyDictionary()
+
+# Judge calls answered locally instead of through the API, by kind
+_saved_calls = Counter()
+_saved_calls_lock = threading.Lock()
+
+# Requests being sent right now, by make_key(); identical concurrent requests wait for the same reply
+_pending = {}
+_pending_lock = threading.Lock()
+_async_pending = weakref.WeakKeyDictionary()
+
+# Prompt tokens sent, and how many of them the provider served from its prefix (context) cache
+_prompt_tokens = Counter()
+_prompt_tokens_lock = threading.Lock()
+
+# kind ("<stage>.<prompt kind>", e.g. "step.judge_value") labels the request in the call profile;
+# stop_at (e.g. VERDICT) marks a request whose caller only needs the reply up to the first match
+ChatRequest = namedtuple("ChatRequest", ["model", "messages", "kind", "stop_at"], defaults=[None, None])
+
+class Pause:
+    """Yielded by a request plan to wait before its next request, e.g. between retries"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+def get_client(api_key=None, base_url=None):
+    """Return the process-wide client for an API key, creating its connection pool on first use.
+
+    OpenAI clients are thread-safe, so every thread of every script shares the
+    same client and reuses its warm keep-alive connections. API_KEY and BASE_URL
+    are the defaults, read at call time so they can be pointed elsewhere (e.g. at
+    mock_llm_server.py)."""
+    api_key, base_url = api_key or API_KEY, base_url or BASE_URL
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(limits=_limits(), timeout=TIMEOUT)
+            # Retries are handled in chat() so the rate limiter sees every 429
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            _clients[key] = client
+        return client
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_SIZE,
+        max_keepalive_connections=POOL_SIZE,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+def get_async_client(api_key=None, base_url=None):
+    """Async counterpart of get_client(), shared by every task of the running event loop"""
+    api_key, base_url = api_key or API_KEY, base_url or BASE_URL
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = (api_key, base_url)
+    if key not in clients:
+        http_client = httpx.AsyncClient(limits=_limits(), timeout=TIMEOUT)
+        clients[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    return clients[key]
+
+def set_max_in_flight(max_in_flight):
+    """Change the global cap on concurrent API requests"""
+    global MAX_IN_FLIGHT, _in_flight
+    MAX_IN_FLIGHT = max_in_flight
+    _in_flight = threading.BoundedSemaphore(max_in_flight)
+
+def set_pool_size(pool_size):
+    """Change the connection pool size; clients created afterwards use the new size"""
+    global POOL_SIZE
+    POOL_SIZE = pool_size
+    close_clients()
+
+def close_clients():
+    """Close every pooled client and its connections"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+def _variant(stop_at):
+    """Cache variant of a request: the stop pattern its reply is cut at when streamed, else None"""
+    return f"stop_at:{stop_at.pattern}" if stop_at is not None and STREAM_VERDICTS else None
+
+def chat(client, model, messages, kind=None, stop_at=None):
+    """Send a chat completion and return the reply text.
+
+    Every judge call goes through here so an identical request (same model and
+    messages) is answered from the on-disk cache instead of the API, and one
+    that is already in flight on another thread waits for that reply instead of
+    being sent again. Each call is recorded in the call profile under kind.
+    With STREAM_VERDICTS and a stop_at pattern the reply is streamed and only
+    read up to the end of the first match of stop_at; such a cut reply is cached
+    apart from the full reply to the same messages."""
+    start, started = time.time(), time.perf_counter()
+    variant = _variant(stop_at)
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(model, messages, variant)
+        if cached is not None:
+            record_call(kind, start, time.perf_counter() - started, cached=True)
+            return cached
+
+    key = make_key(model, messages, variant)
+    with _pending_lock:
+        future = _pending.get(key)
+        leader = future is None
+        if leader:
+            future = _pending[key] = concurrent.futures.Future()
+    if not leader:
+        # Raises the error of the request it shares, which already used up its retries
+        content = future.result()
+        record_saved_call("coalesced requests")
+        record_call(kind, start, time.perf_counter() - started, coalesced=True)
+        return content
+
+    try:
+        content = _send(client, model, messages, kind, stop_at, cache, start, started)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(content)
+        return content
+    finally:
+        with _pending_lock:
+            del _pending[key]
+
+def _send(client, model, messages, kind, stop_at, cache, start, started):
+    limiter = get_limiter(client.api_key)
+    estimated_tokens = estimate_tokens(messages)
+    for attempt in range(MAX_RETRIES):
+        limiter.acquire(estimated_tokens)
+        try:
+            with _in_flight:
+                sent = time.perf_counter()
+                content, usage, stopped = _complete(client, model, messages, stop_at)
+            break
+        except openai.RateLimitError as e:
+            limiter.on_rate_limited(parse_retry_after(e.response.headers))
+            if attempt == MAX_RETRIES - 1:
+                record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__)
+                raise
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt == MAX_RETRIES - 1:
+                record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__)
+                raise
+            time.sleep(min(2 ** attempt, 30))
+        except Exception as e:
+            record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__)
+            raise
+
+    latency = time.perf_counter() - sent
+    limiter.on_success(estimated_tokens, usage.total_tokens if usage else None)
+    record_usage(usage)
+    record_call(kind, start, time.perf_counter() - started, latency, attempt, usage, stopped=stopped)
+
+    if cache is not None and content:
+        cache.put(model, messages, content, _variant(stop_at))
+    return content
+
+def _complete(client, model, messages, stop_at):
+    """(reply text, usage, whether the reply was cut short) of one API request"""
+    if stop_at is None or not STREAM_VERDICTS:
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=False
+        )
+        return response.choices[0].message.content or "", getattr(response, "usage", None), False
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    text, usage = "", None
+    with stream:
+        for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices:
+                text += chunk.choices[0].delta.content or ""
+                match = stop_at.search(text)
+                if match:
+                    # Leaving the with block closes the connection, so the rest of the reply is never generated or read
+                    return text[:match.end()], usage, True
+    return text, usage, False
+
+async def _acomplete(client, model, messages, stop_at):
+    """_complete() for an AsyncOpenAI client"""
+    if stop_at is None or not STREAM_VERDICTS:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=False
+        )
+        return response.choices[0].message.content or "", getattr(response, "usage", None), False
+
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    text, usage = "", None
+    async with stream:
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices:
+                text += chunk.choices[0].delta.content or ""
+                match = stop_at.search(text)
+                if match:
+                    return text[:match.end()], usage, True
+    return text, usage, False
+
+async def achat(client, model, messages, kind=None, stop_at=None):
+    """Async counterpart of chat() for an AsyncOpenAI client.
+
+    Shares the cache and per-key rate limits with chat(); MAX_IN_FLIGHT caps the
+    concurrent requests of the event loop and TIMEOUT bounds each attempt.
+    Identical requests of concurrent tasks share one in-flight request."""
+    start, started = time.time(), time.perf_counter()
+    lane = asyncio.current_task().get_name()
+    variant = _variant(stop_at)
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(model, messages, variant)
+        if cached is not None:
+            record_call(kind, start, time.perf_counter() - started, cached=True, lane=lane)
+            return cached
+
+    key = make_key(model, messages, variant)
+    pending = _async_pending.setdefault(asyncio.get_running_loop(), {})
+    while key in pending:
+        future = pending[key]
+        try:
+            # shield: cancelling this task must not cancel the request the other tasks wait for
+            content = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            continue  # The task sending it was cancelled; send it (or wait for the next sender)
+        record_saved_call("coalesced requests")
+        record_call(kind, start, time.perf_counter() - started, coalesced=True, lane=lane)
+        return content
+
+    future = pending[key] = asyncio.get_running_loop().create_future()
+    try:
+        content = await _asend(client, model, messages, kind, stop_at, cache, start, started, lane)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # Retrieved, so no "exception was never retrieved" warning when nobody waited
+        raise
+    else:
+        future.set_result(content)
+        return content
+    finally:
+        del pending[key]
+
+async def _asend(client, model, messages, kind, stop_at, cache, start, started, lane):
+    loop = asyncio.get_running_loop()
+    in_flight = _async_in_flight.setdefault(loop, asyncio.Semaphore(MAX_IN_FLIGHT))
+    limiter = get_limiter(client.api_key)
+    estimated_tokens = estimate_tokens(messages)
+    for attempt in range(MAX_RETRIES):
+        await limiter.acquire_async(estimated_tokens)
+        try:
+            async with in_flight:
+                sent = time.perf_counter()
+                content, usage, stopped = await asyncio.wait_for(_acomplete(client, model, messages, stop_at), TIMEOUT)
+            break
+        except openai.RateLimitError as e:
+            limiter.on_rate_limited(parse_retry_after(e.response.headers))
+            if attempt == MAX_RETRIES - 1:
+                record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__, lane=lane)
+                raise
+        except (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt == MAX_RETRIES - 1:
+                record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__, lane=lane)
+                raise
+            await asyncio.sleep(min(2 ** attempt, 30))
+        except Exception as e:
+            record_call(kind, start, time.perf_counter() - started, retries=attempt, error=type(e).__name__, lane=lane)
+            raise
+
+    latency = time.perf_counter() - sent
+    limiter.on_success(estimated_tokens, usage.total_tokens if usage else None)
+    record_usage(usage)
+    record_call(kind, start, time.perf_counter() - started, latency, attempt, usage, stopped=stopped, lane=lane)
+
+    if cache is not None and content:
+        cache.put(model, messages, content, _variant(stop_at))
+    return content
+
+def record_saved_call(kind):
+    """Count an LLM call that a local fast path made unnecessary"""
+    with _saved_calls_lock:
+        _saved_calls[kind] += 1
+
+def saved_calls_report():
+    """Summary of the LLM calls saved by local fast paths, for printing at the end of a run"""
+    with _saved_calls_lock:
+        total = sum(_saved_calls.values())
+        details = ", ".join(f"{count} {kind}" for kind, count in sorted(_saved_calls.items()))
+    return f"Local fast paths: {total} LLM calls saved" + (f" ({details})" if details else "")
+
+def record_usage(usage):
+    """Count the prompt tokens of a response and how many of them hit the provider's prefix cache"""
+    if usage is None:
+        return
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)  # DeepSeek
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)  # OpenAI-compatible
+        cached = getattr(details, "cached_tokens", None)
+    with _prompt_tokens_lock:
+        _prompt_tokens["total"] += usage.prompt_tokens or 0
+        _prompt_tokens["cached"] += cached or 0
+
+def prompt_cache_report():
+    """Share of prompt tokens served from the provider's prefix cache, for printing at the end of a run"""
+    with _prompt_tokens_lock:
+        total, cached = _prompt_tokens["total"], _prompt_tokens["cached"]
+    hit_rate = (cached / total * 100) if total > 0 else 0
+    return f"Provider prompt cache: {cached} of {total} prompt tokens cached ({hit_rate:.1f}%)"
+
+def run_plan(client, plan):
+    """Run a request plan synchronously and return its result.
+
+    A plan is a generator that yields ChatRequest (and Pause) objects and receives
+    each reply text back; API errors are raised inside the plan at the yield, so
+    its own try/except handles them exactly as with a direct chat() call."""
+    reply, error = None, None
+    while True:
+        try:
+            request = plan.throw(error) if error is not None else plan.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        reply, error = None, None
+        if isinstance(request, Pause):
+            time.sleep(request.seconds)
+            continue
+        try:
+            reply = chat(client, request.model, request.messages, request.kind, request.stop_at)
+        except Exception as e:
+            error = e
+
+async def arun_plan(client, plan):
+    """Run a request plan on the event loop with achat(); gives the same result as run_plan()"""
+    reply, error = None, None
+    while True:
+        try:
+            request = plan.throw(error) if error is not None else plan.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        reply, error = None, None
+        if isinstance(request, Pause):
+            await asyncio.sleep(request.seconds)
+            continue
+        try:
+            reply = await achat(client, request.model, request.messages, request.kind, request.stop_at)
+        except Exception as e:
+            error = e
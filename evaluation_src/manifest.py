@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+STATE_FOLDER = ".evaluation"  # Subfolder of the benchmark holding manifest.json and other run state, so writing them leaves the benchmark folder's mtime alone
+MANIFEST_NAME = "manifest.json"  # Kept in STATE_FOLDER
+STAGE_FOLDERS = ['result', 'txt', 'score', 'evaluation']  # Model outputs and the outputs of each stage
+RACY_SECONDS = 2  # A folder modified this recently may still change within its mtime granularity, so it is rescanned
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+def state_path(base_path, name):
+    """Path of a run state file of a benchmark (kept in STATE_FOLDER)"""
+    return os.path.join(base_path, STATE_FOLDER, name)
+
+def write_state(path, data):
+    """Write a JSON state file atomically through a temporary file of its own, so workers and hosts
+    sharing STATE_FOLDER never write into each other's half-written file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, 0o644)  # mkstemp creates it readable by its owner only
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def output_model(file):
+    """Model of an output file: result/<model>.txt, txt/<model>_ds.txt, evaluation/<model>_ds.json
+    and score/evaluation_<model>_ds.json all give <model>, so every stage counts a model under one name"""
+    return os.path.splitext(os.path.basename(file))[0].removesuffix('_ds').removeprefix('evaluation_')
+
+def _trusted_mtime(mtime, now):
+    # Like git's racy-clean check: only trust an mtime that is safely in the past
+    return mtime if mtime is not None and now - mtime >= RACY_SECONDS else -1
+
+class Manifest:
+    """Cached index of a benchmark folder: per problem its difficulty, sub-question, step
+    and result quantity counts, and the files present in result/, txt/, score/ and evaluation/.
+
+    refresh() only re-reads what changed since the last run: the folder list when
+    the benchmark folder's mtime changed, problem.json when its mtime changed,
+    and a stage folder when its mtime changed. Every stage schedules from it
+    instead of walking the benchmark and opening every problem.json again."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = state_path(base_path, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.data = {"mtime": -1, "dirs": [], "problems": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except ValueError:
+                pass  # A damaged manifest is rebuilt
+        self.refresh()
+
+    def refresh(self):
+        """Bring the manifest up to date with the benchmark folder and save it if anything changed"""
+        now = time.time()
+        changed = False
+        base_mtime = _mtime(self.base_path)
+        if base_mtime != self.data["mtime"]:
+            self.data["dirs"] = sorted(
+                entry.name for entry in os.scandir(self.base_path)
+                if entry.is_dir() and entry.name != STATE_FOLDER
+            )
+            self.data["mtime"] = _trusted_mtime(base_mtime, now)
+            changed = True
+
+        problems = {}
+        for problem_dir in self.data["dirs"]:
+            old = self.data["problems"].get(problem_dir)
+            entry = self._refresh_problem(problem_dir, old, now)
+            if entry is not None:
+                problems[problem_dir] = entry
+            changed = changed or entry != old
+        changed = changed or problems.keys() != self.data["problems"].keys()
+        self.data["problems"] = problems
+        if changed:
+            self.save()
+
+    def _refresh_problem(self, problem_dir, old, now):
+        problem_path = os.path.join(self.base_path, problem_dir)
+        problem_json = os.path.join(problem_path, 'problem.json')
+        json_mtime = _mtime(problem_json)
+        if json_mtime is None:
+            return None
+        entry = dict(old) if old else {"mtime": {}, "files": {}}
+        entry["mtime"] = dict(entry["mtime"])
+        entry["files"] = dict(entry["files"])
+
+        # Entries written before "quantities" was indexed are read again once
+        if entry["mtime"].get('problem.json') != json_mtime or "quantities" not in entry:
+            with open(problem_json, 'r', encoding='utf-8') as f:
+                problem_data = json.load(f)
+            entry["difficulty"] = problem_data.get("difficulty")
+            entry["sub_questions"] = len(problem_data.get("answer", []))
+            entry["steps"] = sum(len(steps) for steps in problem_data.get("explanation_steps", {}).values())
+            entry["quantities"] = sum(
+                len(step.get("result_quantity", []))
+                for step in problem_data.get("steps_analysis", {}).values()
+                if isinstance(step, dict)
+            )
+            entry["mtime"]['problem.json'] = _trusted_mtime(json_mtime, now)
+
+        for folder in STAGE_FOLDERS:
+            folder_path = os.path.join(problem_path, folder)
+            folder_mtime = _mtime(folder_path)
+            if entry["mtime"].get(folder) == folder_mtime and folder in entry["files"]:
+                continue
+            entry["files"][folder] = sorted(os.listdir(folder_path)) if folder_mtime is not None else []
+            entry["mtime"][folder] = _trusted_mtime(folder_mtime, now) if folder_mtime is not None else None
+        return entry
+
+    def save(self):
+        with self._lock:
+            write_state(self.path, self.data)
+
+    def problems(self, prefix=''):
+        """(problem_dir, problem_path, entry) of every problem whose folder name starts with prefix"""
+        for problem_dir, entry in self.data["problems"].items():
+            if problem_dir.startswith(prefix):
+                yield problem_dir, os.path.join(self.base_path, problem_dir), entry
+
+def has_file(entry, folder, file):
+    """Whether the problem had folder/file when the manifest was refreshed"""
+    return file in entry["files"].get(folder, [])
+
+def load_manifest(base_path):
+    """Manifest of a benchmark folder, brought up to date"""
+    return Manifest(base_path)
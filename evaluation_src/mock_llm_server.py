@@ -0,0 +1,257 @@
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOST = "127.0.0.1"
+PORT = 8765  # Point llm_client.BASE_URL at http://127.0.0.1:8765 to run any script offline
+LATENCY = 0.5  # Mean seconds before the first token of a reply
+TOKEN_DELAY = 0.01  # Seconds per generated token (about 3 characters), streamed or not
+JITTER = 0.2  # Each reply waits LATENCY +/- up to JITTER seconds
+ERROR_RATE = 0.0  # Share of requests answered with a 500
+RATE_LIMIT_RATE = 0.0  # Share of requests answered with a 429
+RATE_LIMIT_RPM = None  # Quota per API key in requests per minute: requests beyond it in the last minute get a 429, as from a real provider
+RETRY_AFTER = 1  # Seconds in the Retry-After header of a 429
+CORRECT_RATE = 0.7  # Share of verdict prompts answered "true"
+SEED = 0
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Room for every connection a high-concurrency run opens at once
+
+ERROR_KINDS = ["Conceptual Errors", "Calculation Process Errors", "Variable Relationship Errors", "Condition Analysis Errors"]
+
+def canned_reply(messages, correct_rate=CORRECT_RATE):
+    """Deterministic reply to a judge request: the same messages always get the same reply.
+
+    The kind of prompt is recognised from its wording (English and Chinese), so
+    every stage gets a reply its parser accepts."""
+    prompt = messages[-1]["content"]
+    rng = random.Random(hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode('utf-8')).digest())
+    verdict = rng.random() < correct_rate
+
+    # format_result_ds: the synthetic outputs are already structured, so they are returned as they are
+    if "Content to restructure:" in prompt:
+        return prompt.split("Content to restructure:", 1)[1].strip()
+    # Shared extraction: the result and formula of every quantity listed under each step
+    if '"equation": "' in prompt:
+        extracted = {}
+        step = None
+        for line in prompt.splitlines():
+            header = re.match(r'^(step_\d+)[:：]\s*$', line)
+            if header:
+                step = extracted.setdefault(header.group(1), [])
+            elif step is not None and line.startswith("- "):
+                name = line[2:].strip()
+                step.append({"name": name, "result": f"{rng.randint(1, 50)}.0 m/s", "equation": f"{name} = a * t"})
+            else:
+                step = None
+        return json.dumps(extracted, ensure_ascii=False)
+    # Batched step judging: one JSON object per step listed in the prompt
+    if "JSON" in prompt:
+        verdicts = []
+        for step in re.findall(r'^(step_\d+)[:：]\s*$', prompt, re.MULTILINE):
+            correct = rng.random() < correct_rate
+            verdicts.append({
+                "step": step,
+                "value_correct": correct,
+                "equation_correct": correct or rng.random() < 0.5,
+                "error_analysis": "" if correct else "The result does not follow from the given conditions.",
+                "error_kind": "" if correct else rng.choice(ERROR_KINDS),
+            })
+        return json.dumps(verdicts)
+    # Like a real judge, a negative verdict comes with a short explanation
+    if '"true" or "false"' in prompt:
+        return "true" if verdict else "false. The actual result does not match the expected one; the relation between the quantities is applied incorrectly."
+    if '"正确"或"错误"' in prompt:
+        return "正确" if verdict else "错误。实际结果与预期结果不一致，物理量之间的关系使用有误。"
+    if "Conceptual Errors" in prompt:
+        return rng.choice(ERROR_KINDS)
+    if "error cause" in prompt or "错误原因" in prompt:
+        return "The step uses the wrong relation between the quantities."
+    # Extractions
+    return f"v = {rng.randint(1, 20)}.0 m/s"
+
+class MockLLMServer:
+    """Local OpenAI-compatible chat completions server for running the evaluators without API calls.
+
+    Answers POST /chat/completions (and /v1/chat/completions) after a random
+    delay, fails a configurable share of requests with 429 or 500, and counts
+    every request so a benchmark can report calls per second. RATE_LIMIT_RATE
+    fails random requests, RATE_LIMIT_RPM only those over a per-minute quota
+    (with a Retry-After of when the quota frees up). stream=True
+    replies are sent token by token as server-sent events; a client that
+    closes the stream early stops the generation, as with a real provider."""
+
+    def __init__(self, host=HOST, port=PORT, latency=LATENCY, jitter=JITTER, error_rate=ERROR_RATE,
+                 rate_limit_rate=RATE_LIMIT_RATE, correct_rate=CORRECT_RATE, seed=SEED, token_delay=TOKEN_DELAY,
+                 rate_limit_rpm=RATE_LIMIT_RPM):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self._accepted = {}  # API key -> times of its requests of the last minute within the quota
+        self.correct_rate = correct_rate
+        self.requests = 0
+        self.completion_tokens = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so the clients' connection pools are exercised
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # A client that closed a keep-alive connection (or a stream early) is not an error
+                    self.close_connection = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                with server._lock:
+                    server.requests += 1
+                    roll = server._rng.random()
+                    delay = max(0.0, server.latency + server._rng.uniform(-server.jitter, server.jitter))
+                    retry_after = RETRY_AFTER if roll < server.rate_limit_rate else server._over_quota(self.headers.get('Authorization'), time.monotonic())
+                    if retry_after is not None:
+                        server.rate_limited += 1
+                if retry_after is not None:
+                    return self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                      {"retry-after": str(retry_after)})
+                time.sleep(delay)
+                if roll < server.rate_limit_rate + server.error_rate:
+                    with server._lock:
+                        server.errors += 1
+                    return self._send(500, {"error": {"message": "Internal server error", "type": "server_error"}})
+
+                request = json.loads(body)
+                content = canned_reply(request["messages"], server.correct_rate)
+                tokens = [content[i:i + 3] for i in range(0, len(content), 3)]
+                prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 3 + 1
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                         "total_tokens": prompt_tokens + len(tokens)}
+                reply = {"id": f"mock-{server.requests}", "created": int(time.time()), "model": request.get("model", "mock")}
+                if request.get("stream"):
+                    return self._stream(reply, tokens, usage, (request.get("stream_options") or {}).get("include_usage"))
+
+                time.sleep(server.token_delay * len(tokens))
+                with server._lock:
+                    server.completion_tokens += len(tokens)
+                self._send(200, dict(
+                    reply,
+                    object="chat.completion",
+                    choices=[{"index": 0, "finish_reason": "stop",
+                              "message": {"role": "assistant", "content": content}}],
+                    usage=usage,
+                ))
+
+            def _stream(self, reply, tokens, usage, include_usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                chunks = [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None} for token in tokens]
+                chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+                try:
+                    for choice in chunks:
+                        self._event(dict(reply, object="chat.completion.chunk", choices=[choice]))
+                        if choice["finish_reason"] is None:
+                            with server._lock:
+                                server.completion_tokens += 1
+                            time.sleep(server.token_delay)
+                    if include_usage:
+                        self._event(dict(reply, object="chat.completion.chunk", choices=[], usage=usage))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # The client closed the stream; the rest is never generated
+
+            def _event(self, payload):
+                self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up on the request (timeout or cancelled task)
+
+        return Handler
+
+    def _over_quota(self, api_key, now):
+        """Seconds until the key's quota frees up when a request now would exceed it, else None (the request is counted)"""
+        if self.rate_limit_rpm is None:
+            return None
+        accepted = self._accepted.setdefault(api_key, deque())
+        while accepted and accepted[0] <= now - 60:
+            accepted.popleft()
+        if len(accepted) >= self.rate_limit_rpm:
+            return max(1, math.ceil(accepted[0] + 60 - now))
+        accepted.append(now)
+        return None
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        """Serve on a background thread and return the server"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def report(self):
+        return (f"Mock server: {self.requests} requests, {self.rate_limited} rate-limited, {self.errors} errors, "
+                f"{self.completion_tokens} completion tokens generated")
+
+def main():
+    server = MockLLMServer()
+    print(f"Mock LLM server listening on {server.base_url} (latency {LATENCY}s +/- {JITTER}s, {TOKEN_DELAY}s per token, "
+          f"{ERROR_RATE:.0%} errors, {RATE_LIMIT_RATE:.0%} rate-limited)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import re
+import time
+import random
+from typing import Dict, Any
+
+from result_parser import parse_deepseek_content
+
+SIZES_KB = [128, 512, 2048]  # Approximate sizes of the synthetic outputs
+SUB_QUESTIONS = 6
+REPEATS = 5
+
+def legacy_parse_deepseek_content(content: str, expected_sub_questions: list) -> Dict[str, Dict[str, Any]]:
+    """The former regex-scan parser of the step evaluators, kept as the reference for timing and output"""
+    sub_q_pattern = re.compile(
+        r'(sub_question_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
+        re.DOTALL
+    )
+
+    sub_questions = {}
+    matches = re.findall(sub_q_pattern, content)
+    parsed_sub_qs = {sub_q_label: sub_q_block for sub_q_label, sub_q_block in matches}
+
+    for sub_q_label in expected_sub_questions:
+        if sub_q_label in parsed_sub_qs:
+            sub_q_block = parsed_sub_qs[sub_q_label]
+            step_pattern = re.compile(
+                r'(step_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)step_\d+\s*:|'
+                + sub_q_label + r'_answer\s*:|$))',
+                re.DOTALL
+            )
+            
+            steps = {}
+            for step_label, step_text in re.findall(step_pattern, sub_q_block):
+                steps[step_label] = {
+                    "content": step_text.strip()
+                }
+
+            answer_pattern = re.compile(
+                rf'{sub_q_label}_answer\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
+                re.DOTALL
+            )
+            answer_match = re.search(answer_pattern, sub_q_block)
+            answer = answer_match.group(1).strip() if answer_match else ""
+
+            sub_questions[sub_q_label] = {
+                "steps": steps,
+                "answer": answer,
+                "is_complete": True
+            }
+        else:
+            sub_questions[sub_q_label] = {
+                "steps": {},
+                "answer": "",
+                "is_complete": False
+            }
+
+    return sub_questions
+
+def make_output(size_kb, sub_questions=SUB_QUESTIONS, seed=0):
+    """Synthetic restructured R1-style output: long rambling steps that also mention other steps inline"""
+    rng = random.Random(seed)
+    words = ["Wait,", "let", "me", "re-check", "the", "momentum", "balance", "so", "v", "=", "3.2", "m/s",
+             "and", "energy", "is", "conserved", "hmm,", "from", "step_2", "we", "get", "a", "=", "g*sin(theta)"]
+    target = size_kb * 1024
+    steps_per_sub_q = 12
+    line = " ".join(rng.choice(words) for _ in range(40))
+    lines_per_step = max(1, target // (len(line) + 1) // (sub_questions * steps_per_sub_q))
+    parts = []
+    step = 1
+    for q in range(1, sub_questions + 1):
+        parts.append(f"sub_question_{q}:")
+        for _ in range(steps_per_sub_q):
+            body = "\n".join(" ".join(rng.choice(words) for _ in range(40)) for _ in range(lines_per_step))
+            parts.append(f"step_{step}: {body}")
+            step += 1
+        parts.append(f"sub_question_{q}_answer: v = {rng.uniform(1, 10):.2f} m/s")
+    return "\n".join(parts) + "\n"
+
+def best_time(func, *args, repeats=REPEATS):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    expected = [f"sub_question_{i+1}" for i in range(SUB_QUESTIONS)]
+    print(f"{'size':>10} {'legacy (ms)':>12} {'single-pass (ms)':>17} {'speedup':>8}")
+    for size_kb in SIZES_KB:
+        content = make_output(size_kb)
+        if parse_deepseek_content(content, expected) != legacy_parse_deepseek_content(content, expected):
+            raise AssertionError(f"Parsers disagree on the {size_kb} KB output")
+        legacy = best_time(legacy_parse_deepseek_content, content, expected)
+        single_pass = best_time(parse_deepseek_content, content, expected)
+        print(f"{len(content) / 1024:>8.0f}KB {legacy * 1000:>12.2f} {single_pass * 1000:>17.2f} {legacy / single_pass:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import time
+import threading
+import importlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+import format_result_ds
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from llm_client import get_client, saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from rate_limit import rate_limit_report
+from call_profile import profile_report
+from results_store import store_report
+from leaderboard import leaderboard_report
+
+LANG = 'en'  # 'en' or 'ch' prompt variants of the evaluators
+ALL_MODELS = False  # Evaluate every model output under result/ in one pass (sets ALL_MODELS of the stage modules)
+
+# Concurrency limit of each stage; the slowest stage bounds the wall-clock time
+STAGE_WORKERS = {
+    'restructure': 8,
+    'answer': 8,
+    'step': 8,
+}
+
+class Pipeline:
+    """Streams every problem through the evaluation stages as soon as its inputs are ready.
+
+    restructure (format_result_ds) -> step grading, with answer grading running
+    alongside since it reads the raw result/ file directly. Each stage has its
+    own thread pool, so a problem moves on without waiting for the rest of the
+    benchmark to finish the previous stage. Problems are scheduled longest first
+    by their estimated cost (see scheduler.py), and a progress bar over the
+    estimated cost of all scheduled work shows the ETA of the whole run."""
+
+    def __init__(self, base_path, lang=LANG, stage_workers=None, all_models=ALL_MODELS):
+        self.base_path = base_path
+        self.answer_module = importlib.import_module(f"answer_evaluation_with_ds_{lang}_prompt")
+        self.step_module = importlib.import_module(f"step_evaluation_with_ds_{lang}_prompt")
+        if all_models:
+            format_result_ds.ALL_MODELS = self.answer_module.ALL_MODELS = True
+        self.client = get_client()
+        workers = dict(STAGE_WORKERS, **(stage_workers or {}))
+        self.executors = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=stage)
+            for stage, count in workers.items()
+        }
+        self.completed = defaultdict(int)
+        self.failed = defaultdict(int)
+        self._pending = 0
+        self._cond = threading.Condition()
+        self.eta = None
+
+    def _plan(self, cost):
+        # Counted when a problem is scheduled, including the step job a restructure job will submit
+        with self._cond:
+            if self.eta is not None:
+                self.eta.total += cost
+                self.eta.refresh()
+
+    def _submit(self, stage, func, *args, then=None, cost=0, then_cost=0):
+        with self._cond:
+            self._pending += 1
+        future = self.executors[stage].submit(func, *args)
+        future.add_done_callback(lambda f: self._finish(stage, f, then, cost, then_cost))
+
+    def _finish(self, stage, future, then, cost, then_cost):
+        try:
+            result = future.result()
+            with self._cond:
+                self.completed[stage] += 1
+            # Hand the problem to the next stage before this job stops counting as pending
+            if then is not None:
+                then(result)
+        except Exception as e:
+            tqdm.write(f"\nError in {stage} stage: {str(e)}")
+            with self._cond:
+                self.failed[stage] += 1
+                # The follow-up job planned for this problem will never run
+                if self.eta is not None and then is not None:
+                    self.eta.total -= then_cost
+        finally:
+            with self._cond:
+                self._pending -= 1
+                if self.eta is not None:
+                    self.eta.update(cost)
+                self._cond.notify_all()
+
+    def _submit_step(self, problem_path, txt_path, problem, cost):
+        txt_name = os.path.basename(txt_path)
+        result_name = f"{os.path.splitext(txt_name)[0]}.json"
+        self._submit('step', self.step_module.evaluate_problem, self.client, problem_path, txt_name, result_name, problem, cost=cost)
+
+    def submit_problem(self, problem_path, entry):
+        """Schedule the missing stages of one problem from its manifest entry"""
+        result_dir = os.path.join(problem_path, 'result')
+        score_dir = os.path.join(problem_path, 'score')
+        problem = None
+        step_cost = estimate_cost(entry, 'step')
+        restructure_cost = estimate_cost(entry, 'restructure')
+
+        def index():
+            # problem.json is read once per problem and shared by the jobs of every stage and model
+            nonlocal problem
+            if problem is None:
+                problem = self.step_module.index_problem(problem_path)
+            return problem
+
+        for file in entry["files"]["result"]:
+            if not format_result_ds.is_target(file):
+                continue
+            txt_path = format_result_ds.get_output_path(problem_path, file)
+            if has_file(entry, 'evaluation', f"{os.path.splitext(os.path.basename(txt_path))[0]}.json"):
+                continue
+            if has_file(entry, 'txt', os.path.basename(txt_path)):
+                self._plan(step_cost)
+                self._submit_step(problem_path, txt_path, index(), step_cost)
+                continue
+            self._plan(restructure_cost + step_cost)
+            self._submit(
+                'restructure', format_result_ds.restructure_file,
+                problem_path, file, index()['data']["question_structure"],
+                then=lambda txt_path, problem_path=problem_path, problem=index(): self._submit_step(problem_path, txt_path, problem, step_cost),
+                cost=restructure_cost, then_cost=step_cost
+            )
+
+        for input_file, (output_file, model_name) in self.answer_module.model_files(entry).items():
+            if has_file(entry, 'result', input_file) and not has_file(entry, 'score', output_file):
+                os.makedirs(score_dir, exist_ok=True)
+                answer_cost = estimate_cost(entry, 'answer')
+                self._plan(answer_cost)
+                self._submit('answer', self.answer_module.evaluate_answer_file,
+                             problem_path, os.path.join(result_dir, input_file),
+                             os.path.join(score_dir, output_file), model_name, index()['data'],
+                             cost=answer_cost)
+
+    def run(self):
+        manifest = load_manifest(self.base_path)
+        # Longest problems first (LPT): the stage pools run jobs in submission order
+        problems = lpt_order(manifest.problems('cal_problem_'), lambda problem: estimate_cost(problem[2], 'step'))
+        self.eta = cost_bar(0, "Estimated work")
+        for problem_dir, problem_path, entry in tqdm(problems, desc="Scheduling problems", unit="dir"):
+            if not entry["files"]["result"]:
+                continue
+            try:
+                self.submit_problem(problem_path, entry)
+            except Exception as e:
+                tqdm.write(f"\nError scheduling {problem_path}: {str(e)}")
+
+        with self._cond:
+            while self._pending > 0:
+                self._cond.wait()
+        self.eta.close()
+        for executor in self.executors.values():
+            executor.shutdown()
+        return dict(self.completed), dict(self.failed)
+
+def main():
+    base_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
+    print(f"Starting pipeline in {base_path}...")
+    print(f"Stage workers: {STAGE_WORKERS}")
+
+    start_time = time.time()
+    completed, failed = Pipeline(base_path).run()
+    elapsed_time = time.time() - start_time
+
+    print(f"\nPipeline completed in {elapsed_time:.2f} seconds")
+    for stage in STAGE_WORKERS:
+        print(f"{stage}: {completed.get(stage, 0)} done, {failed.get(stage, 0)} failed")
+    print(cache_report())
+    print(rate_limit_report())
+    print(prompt_cache_report())
+    print(profile_report())
+    print(saved_calls_report())
+    print(store_report())
+    print(leaderboard_report(base_path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+DEFAULT_RPM = None  # Requests per minute per API key unless set in KEY_LIMITS; None finds the ceiling from 429s
+DEFAULT_TPM = None  # Tokens (prompt + completion) per minute per API key; None for no token budget
+KEY_LIMITS = {}  # api_key -> (rpm, tpm) for keys with a known provider quota (either may be None)
+
+INITIAL_BACKOFF = 1  # Seconds to cool a key down after a 429 without Retry-After
+MAX_BACKOFF = 60
+MIN_RATE_SCALE = 0.1  # Adaptive throttling never drops a key below this fraction of its quota
+RATE_RECOVERY = 0.05  # Fraction of the quota won back after each successful request
+PROBE_RPM = 1  # Requests per minute a key without a configured quota gains per success after its first 429
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate per second up to capacity"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now, scale=1.0):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate * scale)
+        self.updated = now
+
+    def wait_time(self, amount, scale=1.0):
+        """Seconds until amount can be taken (0 if it can be taken now)"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate * scale)
+
+class KeyLimiter:
+    """Requests-per-minute and tokens-per-minute budget of one API key.
+
+    On a 429 the key is cooled down for Retry-After seconds (or an exponential
+    backoff) and its rate is halved; every success wins a little of it back.
+    A key without a configured rpm is not limited until its first 429, which
+    sets its rate to half the rate it was sending at; from there every success
+    adds PROBE_RPM (additive increase, multiplicative decrease), so throughput
+    settles at the real provider quota instead of a guess."""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm, rpm / 60) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm / 60) if tpm else None
+        self.probing = not rpm
+        self.probed_rpm = None  # Rate learned from 429s by a probing key
+        self._sent = deque()  # Send times of the last minute, until a probing key has its first 429
+        self.rate_scale = 1.0
+        self.backoff = INITIAL_BACKOFF
+        self.cooldown_until = 0.0
+        self.rate_limited = 0
+        self.picked = 0  # Times pick_key chose the key; breaks ties, so keys that can all send now take turns
+        self._lock = threading.Lock()
+
+    def _wait_time(self, estimated_tokens, now):
+        wait = self.cooldown_until - now
+        if self.requests is not None:
+            self.requests.refill(now, self.rate_scale)
+            wait = max(wait, self.requests.wait_time(1, self.rate_scale))
+        if self.tokens is not None:
+            self.tokens.refill(now, self.rate_scale)
+            wait = max(wait, self.tokens.wait_time(estimated_tokens, self.rate_scale))
+        return wait
+
+    def _reserve(self, estimated_tokens, now):
+        if self.requests is not None:
+            self.requests.tokens -= 1
+        if self.tokens is not None:
+            self.tokens.tokens -= estimated_tokens
+        if self.probing and self.probed_rpm is None:
+            self._sent.append(now)
+            while self._sent and self._sent[0] < now - 60:
+                self._sent.popleft()
+
+    def _set_probed_rpm(self, rpm):
+        self.probed_rpm = rpm
+        if self.requests is None:
+            # Start empty: the key has just been rate-limited
+            self.requests = TokenBucket(rpm, rpm / 60)
+            self.requests.tokens = 0
+        else:
+            self.requests.capacity = rpm
+            self.requests.rate = rpm / 60
+
+    def available_in(self, estimated_tokens=0):
+        """Seconds until the key may send (0 if it may send now)"""
+        with self._lock:
+            return max(0.0, self._wait_time(estimated_tokens, time.monotonic()))
+
+    def acquire(self, estimated_tokens):
+        """Block until the key may send a request of about estimated_tokens, then reserve it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._wait_time(estimated_tokens, now)
+                if wait <= 0:
+                    self._reserve(estimated_tokens, now)
+                    return
+            time.sleep(min(wait, MAX_BACKOFF))
+
+    async def acquire_async(self, estimated_tokens):
+        """acquire() for asyncio callers: waits with asyncio.sleep instead of blocking the loop"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._wait_time(estimated_tokens, now)
+                if wait <= 0:
+                    self._reserve(estimated_tokens, now)
+                    return
+            await asyncio.sleep(min(wait, MAX_BACKOFF))
+
+    def on_success(self, estimated_tokens, used_tokens=None):
+        with self._lock:
+            # Settle the reservation against what the provider actually counted
+            if used_tokens is not None and self.tokens is not None:
+                self.tokens.tokens -= used_tokens - estimated_tokens
+            self.backoff = INITIAL_BACKOFF
+            if self.probed_rpm is not None:
+                self._set_probed_rpm(self.probed_rpm + PROBE_RPM)
+            elif not self.probing:
+                self.rate_scale = min(1.0, self.rate_scale + RATE_RECOVERY)
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            self.rate_limited += 1
+            # The other requests in flight when the limit was hit get 429s too; the rate is cut once for all of them
+            cooling = time.monotonic() < self.cooldown_until
+            delay = retry_after if retry_after is not None else self.backoff
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+            if not self.probing:
+                self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale / 2)
+            elif not cooling:
+                if self.probed_rpm is None:
+                    # Requests per minute actually sent, over the last minute or since the first request
+                    elapsed = min(60, max(1, time.monotonic() - self._sent[0])) if self._sent else 60
+                    rpm = len(self._sent) * 60 / elapsed
+                else:
+                    rpm = self.probed_rpm
+                self._sent.clear()
+                self._set_probed_rpm(max(1, rpm / 2))
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(api_key):
+    """Return the process-wide limiter of an API key"""
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            rpm, tpm = KEY_LIMITS.get(api_key, (DEFAULT_RPM, DEFAULT_TPM))
+            limiter = KeyLimiter(rpm, tpm)
+            _limiters[api_key] = limiter
+        return limiter
+
+def pick_key(api_keys, estimated_tokens=0):
+    """Choose the key that can send soonest, so work flows away from cooling-down keys;
+    among keys that can send equally soon, the one picked least often"""
+    limiters = {api_key: get_limiter(api_key) for api_key in api_keys}
+    api_key = min(api_keys, key=lambda api_key: (limiters[api_key].available_in(estimated_tokens), limiters[api_key].picked))
+    limiters[api_key].picked += 1
+    return api_key
+
+def estimate_tokens(messages):
+    """Rough token count of a request (about 3 characters per token for mixed Chinese/English text)"""
+    return sum(len(message["content"]) for message in messages) // 3 + 1
+
+def parse_retry_after(headers):
+    """Seconds to wait according to Retry-After / retry-after-ms response headers, or None"""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def rate_limit_report():
+    with _limiters_lock:
+        total = sum(limiter.rate_limited for limiter in _limiters.values())
+        throttled = sum(1 for limiter in _limiters.values() if limiter.rate_scale < 1.0)
+        probed = [limiter.probed_rpm for limiter in _limiters.values() if limiter.probed_rpm is not None]
+        report = f"Rate limiter: {len(_limiters)} keys, {total} rate-limited responses, {throttled} keys currently throttled"
+        if probed:
+            report += f", {len(probed)} keys probing at {sum(probed) / len(probed):.0f} rpm on average"
+        return report
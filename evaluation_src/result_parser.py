@@ -0,0 +1,107 @@
+import re
+from bisect import bisect_left
+from typing import Dict, Any
+
+# Markers of the restructured model output (see format_result_ds), compiled once
+SUB_Q_MARKER = re.compile(r'(sub_question_\d+)\s*:\s*')
+SUB_Q_BOUNDARY = re.compile(r'\nsub_question_\d+\s*:')
+STEP_MARKER = re.compile(r'(step_\d+)\s*:\s*')
+STEP_BOUNDARY = re.compile(r'\nstep_\d+\s*:')
+ANSWER_MARKER = re.compile(r'(sub_question_\d+)_answer\s*:\s*')
+LINE_MARKER = re.compile(r'\n(?:sub_question_\d+(?:_answer)?|step_\d+)\s*:')
+
+def _first_at_or_after(positions, pos, default):
+    i = bisect_left(positions, pos)
+    return positions[i] if i < len(positions) else default
+
+def split_sub_questions(content: str) -> Dict[str, str]:
+    """Map each sub_question_N label to its block of text (the last block wins if a label repeats).
+
+    A block runs from its marker to the next sub_question_N: that starts a line.
+    Boundaries are found in one scan and looked up by bisection, so splitting is
+    linear in the length of the output."""
+    boundaries = [m.start() for m in SUB_Q_BOUNDARY.finditer(content)]
+    blocks = {}
+    pos = 0
+    while True:
+        marker = SUB_Q_MARKER.search(content, pos)
+        if marker is None:
+            return blocks
+        pos = _first_at_or_after(boundaries, marker.end(), len(content))
+        blocks[marker.group(1)] = content[marker.end():pos]
+
+def parse_sub_question(sub_q_label: str, sub_q_block: str) -> Dict[str, Any]:
+    """Steps and final answer of one sub-question block.
+
+    A step runs until the next step_N: that starts a line or the
+    sub_question_N_answer: marker of this sub-question."""
+    step_ends = [m.start() for m in STEP_BOUNDARY.finditer(sub_q_block)]
+    answer_markers = [m for m in ANSWER_MARKER.finditer(sub_q_block) if m.group(1) == sub_q_label]
+    answer_starts = [m.start() for m in answer_markers]
+
+    steps = {}
+    pos = 0
+    while True:
+        marker = STEP_MARKER.search(sub_q_block, pos)
+        if marker is None:
+            break
+        pos = min(
+            _first_at_or_after(step_ends, marker.end(), len(sub_q_block)),
+            _first_at_or_after(answer_starts, marker.end(), len(sub_q_block))
+        )
+        steps[marker.group(1)] = {
+            "content": sub_q_block[marker.end():pos].strip()
+        }
+
+    answer = sub_q_block[answer_markers[0].end():].strip() if answer_markers else ""
+    return {
+        "steps": steps,
+        "answer": answer,
+        "is_complete": True
+    }
+
+def parse_deepseek_content(content: str, expected_sub_questions: list) -> Dict[str, Dict[str, Any]]:
+    """Parse deepseek.txt content into hierarchical structure"""
+    parsed_sub_qs = split_sub_questions(content)
+
+    sub_questions = {}
+    # Process all expected sub-questions
+    for sub_q_label in expected_sub_questions:
+        if sub_q_label in parsed_sub_qs:
+            sub_questions[sub_q_label] = parse_sub_question(sub_q_label, parsed_sub_qs[sub_q_label])
+        else:
+            # Add missing sub-questions
+            sub_questions[sub_q_label] = {
+                "steps": {},
+                "answer": "",
+                "is_complete": False
+            }
+
+    return sub_questions
+
+def extract_marked_answer(content: str, sub_q_label: str):
+    """The line after the sub_question_N_answer: marker of sub_q_label.
+
+    Returns None when the marker is missing, empty, wrapped in markdown (e.g.
+    **sub_question_1_answer: ...**), followed by more text before the next line
+    that starts a marker, or ambiguous (it appears more than once with different
+    answers), so the caller can fall back to the LLM extractor."""
+    answers = set()
+    for marker in ANSWER_MARKER.finditer(content):
+        if marker.group(1) != sub_q_label:
+            continue
+        if content[content.rfind('\n', 0, marker.start()) + 1:marker.start()].strip():
+            return None  # Something (a heading, bold or list markup, prose) precedes the marker on its line
+        # Search from the marker itself: its trailing \s* may already have eaten the next line break
+        end = LINE_MARKER.search(content, marker.start())
+        end = end.start() if end else len(content)
+        answer, _, rest = content[marker.end():end].partition('\n')
+        if rest.strip():
+            return None  # A summary, header or explanation follows the answer
+        answer = answer.strip()
+        if answer.startswith('*') or answer.endswith('*'):
+            return None
+        answers.add(answer)
+    if len(answers) != 1:
+        return None
+    return answers.pop() or None
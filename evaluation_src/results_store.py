@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from manifest import output_model
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for the parquet backend
+    pyarrow = None
+
+RESULTS_BACKEND = None  # None (per-problem JSON only), 'sqlite' or 'parquet'
+RESULTS_DIR = os.path.dirname(os.path.abspath(__file__))  # results.sqlite / results.parquet/ are written here
+BATCH_ROWS = 500  # Buffered rows are written in one transaction (sqlite) or one part file (parquet)
+
+# One row per graded sub-question (step is None) and per judged step
+COLUMNS = [
+    ('stage', 'TEXT'),  # 'answer' (score/ files) or 'step' (evaluation/ files)
+    ('problem', 'TEXT'),
+    ('model', 'TEXT'),
+    ('difficulty', 'TEXT'),
+    ('sub_q', 'TEXT'),
+    ('step', 'TEXT'),
+    ('score', 'REAL'),
+    ('equation_correct', 'INTEGER'),
+    ('value_correct', 'INTEGER'),
+    ('error_kind', 'TEXT'),
+    ('detail', 'TEXT'),  # JSON of the full per-problem entry, so the JSON files can be exported again
+    ('source', 'TEXT'),  # Per-problem JSON file of the row, relative to the problem folder
+    ('run_at', 'REAL'),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+def _number(name):
+    return int(name.rsplit('_', 1)[1])
+
+def _source(problem_path, output_path):
+    return os.path.relpath(output_path, problem_path).replace(os.sep, '/')
+
+def step_rows(problem_path, result_path, problem_data, txt_results):
+    """Rows of one step evaluation result (evaluation/<model>_ds.json)"""
+    source = _source(problem_path, result_path)
+    model = output_model(result_path)
+    base = {'stage': 'step', 'problem': os.path.basename(problem_path), 'model': model,
+            'difficulty': problem_data.get('difficulty'), 'source': source}
+    rows = []
+    for sub_q, sub_q_result in txt_results.items():
+        rows.append(dict(base, sub_q=sub_q, step=None, score=sub_q_result['score']))
+        for step, step_result in sub_q_result['steps'].items():
+            analysis = step_result['analysis']
+            rows.append(dict(
+                base, sub_q=sub_q, step=step, score=step_result['score'],
+                equation_correct=analysis.get('equation_correct'),
+                value_correct=analysis.get('value_correct'),
+                error_kind=analysis.get('error_kind'),
+                detail=json.dumps(analysis, ensure_ascii=False)
+            ))
+    return rows
+
+def answer_rows(problem_path, output_path, results):
+    """Rows of one answer evaluation result (score/evaluation_<model>_ds.json); results maps sub-question number to its result"""
+    base = {'stage': 'answer', 'problem': os.path.basename(problem_path), 'model': output_model(output_path),
+            'source': _source(problem_path, output_path)}
+    return [
+        dict(base, difficulty=result.get('difficulty'), sub_q=f"sub_question_{num}", step=None,
+             score=1.0 if result['correct'] else 0.0, detail=json.dumps(result, ensure_ascii=False))
+        for num, result in results.items()
+    ]
+
+class ResultsStore(ABC):
+    """Buffers result rows and writes them in batches; subclasses provide _write and query.
+
+    The rows of one add() call always land in the same batch, and a batch
+    replaces any earlier rows of the same per-problem file, so a re-evaluated
+    problem is not counted twice."""
+
+    def __init__(self, path, batch_rows=BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.written = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def add(self, rows):
+        run_at = time.time()
+        rows = [
+            {name: row.get(name, run_at if name == 'run_at' else None) for name in COLUMN_NAMES}
+            for row in rows
+        ]
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.batch_rows:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._write(self._buffer)
+        self.written += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def _write(self, rows):
+        """Write one batch of rows"""
+
+    @abstractmethod
+    def query(self, columns=None, **filters):
+        """Rows (as dicts) whose columns equal the given filters, e.g. query(model='deepseek_r1', stage='step')"""
+
+    def report(self):
+        return f"Results store: {self.written} rows written to {self.path}"
+
+class SqliteResultsStore(ResultsStore):
+    def __init__(self, path=os.path.join(RESULTS_DIR, "results.sqlite"), batch_rows=BATCH_ROWS):
+        super().__init__(path, batch_rows)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS results ({', '.join(f'{name} {kind}' for name, kind in COLUMNS)})")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_file ON results (problem, source)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_model ON results (model, stage, difficulty)")
+        self._conn.commit()
+
+    def _write(self, rows):
+        files = {(row['problem'], row['source']) for row in rows}
+        with self._conn:
+            self._conn.executemany("DELETE FROM results WHERE problem = ? AND source = ?", files)
+            self._conn.executemany(
+                f"INSERT INTO results ({', '.join(COLUMN_NAMES)}) VALUES ({', '.join('?' * len(COLUMN_NAMES))})",
+                [tuple(row[name] for name in COLUMN_NAMES) for row in rows]
+            )
+
+    def query(self, columns=None, **filters):
+        columns = columns or COLUMN_NAMES
+        where = " AND ".join(f"{name} IS ?" for name in filters) or "1"
+        with self._lock:
+            self._flush()
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM results WHERE {where} ORDER BY rowid",
+                tuple(filters.values())
+            )
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def sql(self, statement, params=()):
+        """Run any read query, e.g. an aggregate over the whole benchmark"""
+        with self._lock:
+            self._flush()
+            return self._conn.execute(statement, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+class ParquetResultsStore(ResultsStore):
+    """Append-only parquet dataset: every batch is one part file in the results.parquet folder.
+
+    A re-evaluated file gets new rows with a later run_at; query() keeps only
+    the latest rows of each per-problem file."""
+
+    def __init__(self, path=os.path.join(RESULTS_DIR, "results.parquet"), batch_rows=BATCH_ROWS):
+        if pyarrow is None:
+            raise ImportError("The parquet results backend needs pyarrow (pip install pyarrow)")
+        super().__init__(path, batch_rows)
+        os.makedirs(path, exist_ok=True)
+        types = {'TEXT': pyarrow.string(), 'REAL': pyarrow.float64(), 'INTEGER': pyarrow.bool_()}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+    def _write(self, rows):
+        table = pyarrow.Table.from_pylist(rows, schema=self.schema)
+        part_path = os.path.join(self.path, f"part-{time.time_ns()}-{os.getpid()}.parquet")
+        pyarrow.parquet.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+
+    def query(self, columns=None, **filters):
+        columns = columns or COLUMN_NAMES
+        with self._lock:
+            self._flush()
+        dataset = pyarrow.dataset.dataset(self.path, schema=self.schema, format='parquet')
+        expression = None
+        for name, value in filters.items():
+            condition = pyarrow.dataset.field(name).is_null() if value is None else pyarrow.dataset.field(name) == value
+            expression = condition if expression is None else expression & condition
+        # Only the needed columns and the row groups matching the filters are read
+        needed = list(dict.fromkeys(list(columns) + ['problem', 'source', 'run_at']))
+        rows = dataset.to_table(columns=needed, filter=expression).to_pylist()
+        latest = {}
+        for row in rows:
+            file = (row['problem'], row['source'])
+            latest[file] = max(latest.get(file, row['run_at']), row['run_at'])
+        return [
+            {name: row[name] for name in columns}
+            for row in rows if row['run_at'] == latest[(row['problem'], row['source'])]
+        ]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide results store, or None when RESULTS_BACKEND is None"""
+    global _store
+    if RESULTS_BACKEND is None:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = {'sqlite': SqliteResultsStore, 'parquet': ParquetResultsStore}[RESULTS_BACKEND]()
+            atexit.register(_store.close)
+        return _store
+
+def store_rows(rows):
+    """Queue rows for the results store, if one is configured"""
+    store = get_store()
+    if store is not None:
+        store.add(rows)
+
+def store_report():
+    """Rows written to the results store, for printing at the end of a run"""
+    store = get_store()
+    if store is None:
+        return "Results store: disabled"
+    store.flush()
+    return store.report()
+
+def export_problem_json(store, base_path, overwrite=False):
+    """Write the per-problem JSON files back out of the store, in the format the evaluators write them"""
+    files = {}
+    for row in store.query():
+        files.setdefault((row['problem'], row['source']), []).append(row)
+
+    written = 0
+    for (problem, source), rows in files.items():
+        output_path = os.path.join(base_path, problem, *source.split('/'))
+        if os.path.exists(output_path) and not overwrite:
+            continue
+        rows.sort(key=lambda row: (_number(row['sub_q']), -1 if row['step'] is None else _number(row['step'])))
+        if rows[0]['stage'] == 'answer':
+            data = {rows[0]['model']: {row['sub_q']: json.loads(row['detail']) for row in rows}}
+        else:
+            data = {}
+            for row in rows:
+                if row['step'] is None:
+                    data[row['sub_q']] = {'score': row['score'], 'steps': {}}
+                else:
+                    data[row['sub_q']]['steps'][row['step']] = {'score': row['score'], 'analysis': json.loads(row['detail'])}
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=rows[0]['stage'] != 'answer')
+        written += 1
+    return written
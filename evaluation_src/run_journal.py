@@ -0,0 +1,81 @@
+import os
+import json
+import threading
+from llm_client import record_saved_call
+
+JOURNAL_ENABLED = True
+JOURNAL_SUFFIX = ".journal"  # The journal of an output file sits next to it until the file is written
+JOURNAL_FSYNC = False  # fsync every record (survives power loss, not just a crashed or killed run)
+
+class RunJournal:
+    """Write-ahead log of the finished LLM work (extractions, verdicts, step results) for one output file.
+
+    Every result is appended as one JSON line the moment it is known, so a
+    restarted run replays them instead of calling the LLM again and resumes at
+    the exact sub-question or step. Once the output file is written the journal
+    is removed. A path of None gives a journal that remembers nothing."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.replayed = 0
+        self._file = None
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        kind, key, value = json.loads(line)
+                    except ValueError:
+                        continue  # A line torn by the crash is simply redone
+                    self.entries[(kind, key)] = value
+
+    def lookup(self, kind, key):
+        """(True, value) for a journaled result, (False, None) otherwise"""
+        with self._lock:
+            if (kind, key) in self.entries:
+                self.replayed += 1
+                return True, self.entries[(kind, key)]
+            return False, None
+
+    def record(self, kind, key, value):
+        with self._lock:
+            self.entries[(kind, key)] = value
+            if self.path is None:
+                return
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps([kind, key, value], ensure_ascii=False) + "\n")
+            self._file.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self._file.fileno())
+
+    def finish(self):
+        """Drop the journal once its results are in the output file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+def open_journal(output_path):
+    """Journal of an output file, holding whatever an interrupted run already finished"""
+    return RunJournal(output_path + JOURNAL_SUFFIX if JOURNAL_ENABLED else None)
+
+def journaled(journal, kind, key, plan):
+    """Request plan that replays a journaled result, or runs plan and journals its result"""
+    if journal is not None:
+        found, value = journal.lookup(kind, key)
+        if found:
+            record_saved_call("journal replays")
+            plan.close()
+            return value
+    value = yield from plan
+    if journal is not None:
+        journal.record(kind, key, value)
+    return value
+
+def journal_has(journal, kind, key):
+    """Whether a result is journaled, without counting it as replayed"""
+    return journal is not None and (kind, key) in journal.entries
@@ -0,0 +1,29 @@
+from tqdm import tqdm
+
+# Relative judge work per step: harder problems have more wrong steps, and each wrong step costs extra calls
+DIFFICULTY_WEIGHTS = {'knowledge': 1.0, 'easy': 1.0, 'medium': 1.5, 'hard': 2.0}
+
+def estimate_cost(entry, stage):
+    """Rough cost, in judge calls, of one model output of a problem in a stage, from its manifest entry.
+
+    restructure is one call whose length grows with the solution; answer grading
+    extracts and judges each sub-question; step grading judges each sub-question
+    answer and then, for the steps of wrong sub-questions, extracts and judges
+    every result quantity."""
+    weight = DIFFICULTY_WEIGHTS.get(str(entry.get("difficulty")).lower(), 1.0)
+    sub_questions = entry.get("sub_questions", 0)
+    steps = entry.get("steps", 0)
+    quantities = entry.get("quantities", steps)
+    if stage == 'restructure':
+        return 1 + weight * steps / 2
+    if stage == 'answer':
+        return 2 * sub_questions
+    return sub_questions + weight * (2 * steps + quantities)
+
+def lpt_order(jobs, cost):
+    """Jobs longest first (LPT), so the long tail starts early instead of running alone at the end"""
+    return sorted(jobs, key=cost, reverse=True)
+
+def cost_bar(total, desc):
+    """Progress bar over estimated cost, so its ETA weighs the remaining jobs by their size instead of counting them"""
+    return tqdm(total=total, desc=desc, unit="cost", bar_format="{desc}: {percentage:3.0f}%|{bar}| {n:.0f}/{total:.0f} cost [{elapsed}<{remaining}]")
@@ -1,66 +1,73 @@
 import json
 import re
 import os
-from typing import Dict, Any
 from tqdm import tqdm
-from openai import OpenAI
-import time
-
-def parse_deepseek_content(content: str, expected_sub_questions: list) -> Dict[str, Dict[str, Any]]:
-    """解析 deepseek.txt 内容为层级结构"""
-    sub_q_pattern = re.compile(
-        r'(sub_question_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
-        re.DOTALL
-    )
-
-    sub_questions = {}
-    matches = re.findall(sub_q_pattern, content)
-
-    # 创建已解析子问题的映射
-    parsed_sub_qs = {sub_q_label: sub_q_block for sub_q_label, sub_q_block in matches}
-
-    # 处理所有预期的子问题
-    for sub_q_label in expected_sub_questions:
-        if sub_q_label in parsed_sub_qs:
-            # 处理存在的子问题
-            sub_q_block = parsed_sub_qs[sub_q_label]
-            step_pattern = re.compile(
-                r'(step_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)step_\d+\s*:|'
-                + sub_q_label + r'_answer\s*:|$))',
-                re.DOTALL
-            )
-            
-            steps = {}
-            for step_label, step_text in re.findall(step_pattern, sub_q_block):
-                steps[step_label] = {
-                    "content": step_text.strip()
-                }
-
-            answer_pattern = re.compile(
-                rf'{sub_q_label}_answer\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
-                re.DOTALL
-            )
-            answer_match = re.search(answer_pattern, sub_q_block)
-            answer = answer_match.group(1).strip() if answer_match else ""
+from llm_client import get_client, get_async_client, ChatRequest, Pause, VERDICT, run_plan, arun_plan, record_saved_call, saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from rate_limit import rate_limit_report
+from call_profile import profile_report
+from result_parser import parse_deepseek_content
+from equivalence import answers_equivalent, values_equivalent, expressions_equivalent, single_quantity_verdict
+from run_journal import open_journal, journaled, journal_has
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from results_store import step_rows, store_rows, store_report
+from leaderboard import record_step_file, leaderboard_report
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+STEP_WORKERS = 16  # 单个问题内同时评估的步骤数
+
+BATCH_STEP_JUDGING = False  # 用一次结构化请求评估答错子问题的所有步骤，而不是逐步骤发送提示
+LOCAL_EQUIVALENCE = True  # 先在本地判断纯数值（含单位）和简单公式是否等价（见 equivalence.py），无法判断时再询问 LLM
+SHARED_EXTRACTION = False  # 用一次请求提取答错子问题所有物理量的结果和公式，供其各步骤共用，而不是每个步骤发送两次提取请求
+
+USE_ASYNC = False  # 使用 asyncio 引擎（AsyncOpenAI，单个事件循环）代替线程池
+ASYNC_PROBLEMS = 8  # asyncio 引擎同时评估的模型输出数（未开启 ALL_MODELS 时即问题数）
+ALL_MODELS = False  # 一次运行评估所有模型整理后的输出（txt/<模型>_ds.txt），而不只是 deepseek_r1_ds.txt
+
+ERROR_CATEGORIES = """Graphical Analysis Errors: 
+Errors in understanding, drawing, analyzing, or extracting data from graphics. For example, misreading coordinate axes, misjudging curve trends, or missing key data points.
 
-            sub_questions[sub_q_label] = {
-                "steps": steps,
-                "answer": answer,
-                "is_complete": True
-            }
-        else:
-            # 添加缺失的子问题
-            sub_questions[sub_q_label] = {
-                "steps": {},
-                "answer": "",
-                "is_complete": False
-            }
+Physical Law Application Errors: 
+Confusing physical law concepts or using them in inappropriate scenarios. For example, misusing the law of conservation of momentum or the law of conservation of energy.
+
+Physical Condition Analysis Errors: 
+Misjudgment of system boundaries, internal and external forces, or components. For example, ignoring friction or misjudging the isolation of the system.
 
-    return sub_questions
+Physical Process Understanding Errors: 
+Deviations in the understanding of the development of phenomena, state changes, or causal relationships. For example, incorrect analysis of the motion process of an object or the mechanism of energy conversion.
 
+Variable Relationship Errors: 
+Misunderstanding of the dependency or functional relationship between physical quantities. For example, misunderstanding that acceleration is proportional to velocity.
 
-def evaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval):
-    """评估单个步骤的内容，分点分析所有物理量"""
+Calculation Process Errors: 
+Errors in mathematical operations, formula derivation, or substitution calculations. For example, algebraic operation errors or unit conversion errors.
+
+Boundary Condition Analysis Errors: 
+Ignoring or incorrectly handling special cases, limiting conditions, or ranges of applicability. For example, not considering system behavior at extreme temperatures or pressures."""
+
+# 所有评估请求都以同一个系统提示和 judge_messages 中的问题部分开头，支持前缀缓存的服务（DeepSeek）
+# 在同一问题的每次调用中都可以从缓存读取这部分共享的提示
+SYSTEM_PROMPT = f"""你是一个专业的物理解题评估助手。
+对错误进行分类时使用以下错误原因：
+{ERROR_CATEGORIES}"""
+
+def judge_messages(context, question, prompt, step_content=None):
+    """评估请求的消息：固定的系统提示、问题、解题内容，最后是本次调用特有的提示"""
+    shared = f"问题背景：{context}\n具体问题：{question}\n"
+    if step_content is not None:
+        shared += f"解题步骤内容：{step_content}\n"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": shared + prompt},
+    ]
+
+def plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """evaluate_step_content 的请求计划（见 llm_client.run_plan）
+
+    extraction 为子问题共用提取结果中属于该步骤的部分（见
+    plan_extract_sub_question）；给出时不再发送提取请求。"""
     results = {
         'equation_correct': False,
         'value_correct': False,
@@ -75,23 +82,20 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
 
     try:
         # 提取相关内容
-        extract_result_prompt = f"""基于以下解题步骤内容，请提取与以下物理量相关的内容：
-问题背景：{context}
-具体问题：{question}
-需要提取的物理量：
+        if extraction is not None:
+            record_saved_call("step extractions")
+            extracted_result_content = extraction['result']
+        else:
+            extract_result_prompt = f"""基于以上解题步骤内容，请提取与以下物理量相关的内容：
 {names_prompt}
-解题步骤内容：{step_content}
 请只返回相关的结果内容，不要相关公式，不要添加任何解释。"""
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个专业的物理问题分析助手"},
-                {"role": "user", "content": extract_result_prompt},
-            ],
-            stream=False
-        )
+            reply = yield ChatRequest(
+                model="deepseek-chat",
+                kind="step.extract_result",
+                messages=judge_messages(context, question, extract_result_prompt, step_content)
+            )
         
-        extracted_result_content = response.choices[0].message.content.strip()
+            extracted_result_content = reply.strip()
         # print(f"Extracted_result_content: {extracted_result_content}")
         pbar_eval.update(1)
 
@@ -110,24 +114,27 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
                 for i, q in enumerate(step_analysis['result_quantity'])
                 if q['value'] != 'N/A'  # 只处理值不为 'N/A' 的物理量
             ])
+            # 只有一个预期值且提取结果是带单位的纯数值时，在本地比较
+            local_verdict = single_quantity_verdict(step_analysis['result_quantity'], 'value', extracted_result_content, values_equivalent) if LOCAL_EQUIVALENCE else None
+            if local_verdict is not None:
+                record_saved_call("value judgments")
+                results['value_correct'] = local_verdict
             # 如果 values_str 不为空，则进行后续处理
-            if values_str:
+            elif values_str:
                 value_prompt = f"""请判断以下结果是否等价：
 预期结果：
 {values_str}
 实际内容：
 {extracted_result_content}
 请逐个判断所有结果，有一次错误的也是错误，只回答"正确"或"错误"。如果正确不用解释，如果有错误也用一两句话简单说明一下。"""
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的物理计算结果评估助手"},
-                        {"role": "user", "content": value_prompt},
-                    ],
-                    stream=False
+                    kind="step.judge_value",
+                    stop_at=VERDICT,
+                    messages=judge_messages(context, question, value_prompt)
                 )
                 
-                value_result = response.choices[0].message.content.strip()
+                value_result = reply.strip()
                 # print(f"Value result: {value_result}")
                 # 判断结果中是否包含“正确”
                 results['value_correct'] = '正确' in value_result
@@ -137,25 +144,22 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
         if results['value_correct'] == True:
             results['equation_correct'] = True
         else:
-            extract_equation_prompt = f"""基于以下解题步骤内容，请提取与以下物理量相关的内容：
-问题背景：{context}
-具体问题：{question}
-需要提取的物理量：
+            if extraction is not None:
+                record_saved_call("step extractions")
+                extract_equation_content = extraction['equation']
+            else:
+                extract_equation_prompt = f"""基于以上解题步骤内容，请提取与以下物理量相关的内容：
 {names_prompt}
-解题步骤内容：{step_content}
 返回得到所要求物理量的相关公式
 请只返回相关的内容，不要添加任何解释。"""
-            # 提取相关内容
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的物理问题分析助手"},
-                    {"role": "user", "content": extract_equation_prompt},
-                ],
-                stream=False
-            )
+                # 提取相关内容
+                reply = yield ChatRequest(
+                    model="deepseek-chat",
+                    kind="step.extract_equation",
+                    messages=judge_messages(context, question, extract_equation_prompt, step_content)
+                )
             
-            extract_equation_content = response.choices[0].message.content.strip()
+                extract_equation_content = reply.strip()
             # print(f"Extract_equation_content: {extract_equation_content}")
 
             pbar_eval.update(1)
@@ -171,23 +175,26 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
                     for i, q in enumerate(step_analysis['result_quantity'])
                     if q['equation'] != 'N/A'  # 只处理值不为 'N/A' 的物理量
                 ])
-                if "N/A" not in equations_str:
+                # 只有一个预期公式且 sympy 能证明等价时，无需调用 LLM
+                local_verdict = single_quantity_verdict(step_analysis['result_quantity'], 'equation', extract_equation_content, expressions_equivalent) if LOCAL_EQUIVALENCE else None
+                if local_verdict is not None:
+                    record_saved_call("equation judgments")
+                    results['equation_correct'] = local_verdict
+                elif "N/A" not in equations_str:
                     equation_prompt = f"""请判断以下物理公式是否等价,不考虑单位：
 预期公式：
 {equations_str}
 实际内容：
 {extract_equation_content}
 请判断所有公式，只回答"正确"或"错误"，如果正确不用解释，如果有错误也用一两句话简单说明一下。"""
-                    response = client.chat.completions.create(
+                    reply = yield ChatRequest(
                         model="deepseek-chat",
-                        messages=[
-                            {"role": "system", "content": "你是一个专业的物理公式评估助手"},
-                            {"role": "user", "content": equation_prompt},
-                        ],
-                        stream=False
+                        kind="step.judge_equation",
+                        stop_at=VERDICT,
+                        messages=judge_messages(context, question, equation_prompt)
                     )
                     
-                    equation_result = response.choices[0].message.content.strip()
+                    equation_result = reply.strip()
                     # print(f"Equation result: {equation_result}")
                     results['equation_correct'] = '正确' in equation_result
             pbar_eval.update(1)
@@ -211,72 +218,61 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
 {extract_equation_content}
 再请用一两句简洁得说明错误原因,用英文回答问题
 """
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的物理问题错误分析助手"},
-                        {"role": "user", "content": error_analysis_prompt},
-                    ],
-                    stream=False
+                    kind="step.error_analysis",
+                    messages=judge_messages(context, question, error_analysis_prompt)
                 )
                 
-                results['error_analysis'] = response.choices[0].message.content.strip()
+                results['error_analysis'] = reply.strip()
 
                 error_prompt = f"""请分析以下解题步骤中的错误：
 标准答案内容：{standard_step_content}
 实际内容：
 {extract_equation_content}
 错误分析：{results['error_analysis']}
-在以下错误原因中挑选一个，
-Graphical Analysis Errors: 
-Errors in understanding, drawing, analyzing, or extracting data from graphics. For example, misreading coordinate axes, misjudging curve trends, or missing key data points.
-
-Physical Law Application Errors: 
-Confusing physical law concepts or using them in inappropriate scenarios. For example, misusing the law of conservation of momentum or the law of conservation of energy.
-
-Physical Condition Analysis Errors: 
-Misjudgment of system boundaries, internal and external forces, or components. For example, ignoring friction or misjudging the isolation of the system.
-
-Physical Process Understanding Errors: 
-Deviations in the understanding of the development of phenomena, state changes, or causal relationships. For example, incorrect analysis of the motion process of an object or the mechanism of energy conversion.
-
-Variable Relationship Errors: 
-Misunderstanding of the dependency or functional relationship between physical quantities. For example, misunderstanding that acceleration is proportional to velocity.
-
-Calculation Process Errors: 
-Errors in mathematical operations, formula derivation, or substitution calculations. For example, algebraic operation errors or unit conversion errors.
-
-Boundary Condition Analysis Errors: 
-Ignoring or incorrectly handling special cases, limiting conditions, or ranges of applicability. For example, not considering system behavior at extreme temperatures or pressures.
+在系统提示列出的错误原因中挑选一个，
 只返回错误原因种类即可，例如Conceptual Errors
 """
 
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的物理问题错误分析助手"},
-                        {"role": "user", "content": error_prompt},
-                    ],
-                    stream=False
+                    kind="step.error_kind",
+                    messages=judge_messages(context, question, error_prompt)
                 )
                 
-                results['error_kind'] = response.choices[0].message.content.strip()
+                results['error_kind'] = reply.strip()
                 pbar_eval.update(1)
 
     except Exception as e:
         print(f"评估出错: {str(e)}")
-        time.sleep(1)
+        yield Pause(1)
 
     return results
 
 
-def evaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
-    """评估答案是否正确"""
-    client = OpenAI(api_key="your_api_key", base_url="https://api.deepseek.com")
+def evaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """评估单个步骤的内容，分点分析所有物理量"""
+    return run_plan(client, plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction))
+
+
+async def aevaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """异步引擎使用的 evaluate_step_content，client 为 AsyncOpenAI 客户端"""
+    return await arun_plan(client, plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction))
+
+
+def plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """evaluate_with_deepseek 的请求计划"""
     
-    prompt = f"""请基于以下信息，判断两个答案是否在含义上等价，不考虑单位：
-具体问题：
-{question_content}
+    # 纯数值和简单表达式在本地比较，只有无法判断的答案才交给 LLM
+    if LOCAL_EQUIVALENCE:
+        verdict = answers_equivalent(actual_answer, expected_answer)
+        if verdict is not None:
+            record_saved_call("answer judgments")
+            pbar_eval.update(1)
+            return verdict
+
+    prompt = f"""请判断以上问题的两个答案是否在含义上等价，不考虑单位：
 实际回答：
 {actual_answer}
 预期回答：
@@ -284,177 +280,648 @@ def evaluate_with_deepseek(actual_answer, expected_answer, context, question_con
 请只回答"正确"或"错误"来表示这两个答案是否表达相同的含义。评判时请主要考虑数学表达式等细节是否等价，不需要考虑单位。"""
 
     try:
-        response = client.chat.completions.create(
+        reply = yield ChatRequest(
             model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个专业的数学问题答案评估助手"},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False
+            kind="step.judge_answer",
+            stop_at=VERDICT,
+            messages=judge_messages(context, question_content, prompt)
         )
         
-        result = response.choices[0].message.content.strip()
+        result = reply.strip()
         pbar_eval.update(1)
         return result == '正确'
     except Exception as e:
         print(f"评估出错: {str(e)}")
-        time.sleep(1)  # 添加延迟重试
+        yield Pause(1)  # 添加延迟重试
         return False
 
 
-def evaluate_folder(folder_path: str):
-    """评估文件夹中的所有问题"""
-    results = {}
-    client = OpenAI(api_key="your_api_key", base_url="https://api.deepseek.com")
-    
-    # 遍历所有子文件夹
-    for subfolder in tqdm(os.listdir(folder_path), desc="处理子文件夹"):
-        subfolder_path = os.path.join(folder_path, subfolder)
-        if not os.path.isdir(subfolder_path):
-            continue
-        print("subfolder_path is", subfolder_path)
-        
-        # 读取v8问题文件
-        problem_path_v8 = os.path.join(subfolder_path, "problem.json")
-        if not os.path.exists(problem_path_v8):
-            continue
+def evaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """评估答案是否正确"""
+    return run_plan(get_client(), plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval))
+
+
+async def aevaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """异步引擎使用的 evaluate_with_deepseek"""
+    return await arun_plan(get_async_client(), plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval))
+
 
-        evaluation_path = os.path.join(subfolder_path, "evaluation")
-        os.makedirs(evaluation_path, exist_ok=True)
-        deepseek_result_path = os.path.join(evaluation_path, "deepseek_ds.json")
-        if os.path.exists(deepseek_result_path):
-            print(f"{deepseek_result_path} 已存在，跳过评估。")
+def parse_batch_verdicts(reply):
+    """解析批量评估返回的逐步骤 JSON 数组"""
+    match = re.search(r'\[.*\]', reply, re.DOTALL)
+    if not match:
+        return []
+    try:
+        verdicts = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [verdict for verdict in verdicts if isinstance(verdict, dict)]
+
+
+def plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval):
+    """用一次请求评估子问题的所有步骤。
+
+    step_items 为 step_key -> (step_analysis, standard_step_content)。返回
+    step_key -> 与 evaluate_step_content 格式相同的结果；评估结果中缺失的步骤
+    对应 None，由调用方逐步骤重新评估。"""
+    all_results = {}
+    steps_parts = []
+    for step_key, (step_analysis, standard_step_content) in step_items.items():
+        quantities = step_analysis['result_quantity']
+        quantities_str = '\n'.join(
+            f"- {q['name']}：预期结果 {q['value']}；预期公式 {q['equation']}"
+            for q in quantities
+        )
+        steps_parts.append(f"{step_key}：\n标准答案内容：{standard_step_content}\n物理量：\n{quantities_str}")
+        all_results[step_key] = None
+
+    prompt = f"""请对照以上解题步骤内容评估以下解题步骤：
+需要评估的步骤：
+{chr(10).join(steps_parts)}
+请逐个步骤判断实际内容是否得到了所有预期结果（value_correct），以及所用公式是否与所有预期公式等价，不考虑单位（equation_correct）。标记为 N/A 的预期结果或公式不参与判断。
+如果某个步骤不完全正确，请用一两句话简洁地说明错误原因，用英文回答（error_analysis），并在系统提示列出的错误原因中挑选一个（error_kind）。
+只返回 JSON 数组，每个步骤一个对象，例如：
+[{{"step": "step_1", "value_correct": false, "equation_correct": true, "error_analysis": "...", "error_kind": "Calculation Process Errors"}}]"""
+
+    try:
+        reply = yield ChatRequest(
+            model="deepseek-chat",
+            kind="step.batched",
+            messages=judge_messages(context, question, prompt, step_content)
+        )
+    except Exception as e:
+        print(f"批量评估出错: {str(e)}")
+        return all_results
+    pbar_eval.update(1)
+
+    for verdict in parse_batch_verdicts(reply):
+        step_key = verdict.get('step')
+        if step_key not in all_results or all_results[step_key] is not None:
             continue
+        quantities = step_items[step_key][0]['result_quantity']
+        results = {
+            'equation_correct': False,
+            'value_correct': False,
+            "miss_item": [],
+            'error_kind': '',
+            'error_analysis': ''
+        }
+        # 与 evaluate_step_content 相同的 N/A 规则，以及“结果正确则公式正确”的规则
+        if all(q['value'] == 'N/A' for q in quantities):
+            results['miss_item'].append("value_correct")
+        else:
+            results['value_correct'] = verdict.get('value_correct') is True
+        if results['value_correct']:
+            results['equation_correct'] = True
+        elif all(q['equation'] == 'N/A' for q in quantities):
+            results['miss_item'].append("equation_correct")
+        else:
+            results['equation_correct'] = verdict.get('equation_correct') is True
+        if not (results['equation_correct'] and results['value_correct']):
+            results['error_analysis'] = str(verdict.get('error_analysis') or '').strip()
+            results['error_kind'] = str(verdict.get('error_kind') or '').strip()
+        all_results[step_key] = results
+
+    return all_results
+
 
-        with open(problem_path_v8, 'r', encoding='utf-8') as f:
-            problem_data_v8 = json.load(f)
+def evaluate_steps_batched(client, step_content, step_items, context, question, pbar_eval):
+    """用一次请求评估子问题的所有步骤（见 plan_evaluate_steps_batched）"""
+    return run_plan(client, plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval))
 
-        # 读取txt文件夹中的评估文件
-        txt_folder = os.path.join(subfolder_path, "txt")
-        if not os.path.exists(txt_folder):
+
+async def aevaluate_steps_batched(client, step_content, step_items, context, question, pbar_eval):
+    """异步引擎使用的 evaluate_steps_batched"""
+    return await arun_plan(client, plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval))
+
+
+def record_batched_results(journal, batched_results):
+    """将批量评估得到的步骤结果写入日志，重启后的运行不会再次评估"""
+    if journal is None:
+        return
+    for step_key, step_results in batched_results.items():
+        if step_results is not None:
+            journal.record("step", step_key, step_results)
+
+
+def parse_shared_extraction(reply, step_items):
+    """从共用提取的回复中得到 step_key -> {'result', 'equation'} 提取内容。
+
+    内容与逐步骤提取的回复形式相同：只有一个物理量时为结果或公式本身，否则每个
+    物理量一行 "名称: 内容"。回复中缺失的步骤，或缺少其任一物理量的步骤，对应 None。"""
+    match = re.search(r'\{.*\}', reply, re.DOTALL)
+    try:
+        extracted = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+        extracted = {}
+    if not isinstance(extracted, dict):
+        extracted = {}
+
+    extractions = {}
+    for step_key, (step_analysis, _) in step_items.items():
+        entries = extracted.get(step_key)
+        if not isinstance(entries, list):
+            extractions[step_key] = None
+            continue
+        by_name = {str(entry.get('name')): entry for entry in entries if isinstance(entry, dict)}
+        names = [q['name'] for q in step_analysis['result_quantity']]
+        if any(name not in by_name for name in names):
+            # 物理量被改名或遗漏时会以空内容判定；改由逐步骤提取处理该步骤
+            extractions[step_key] = None
             continue
+        extraction = {}
+        for field in ('result', 'equation'):
+            contents = [str(by_name[name].get(field) or '').strip() for name in names]
+            if len(names) == 1:
+                extraction[field] = contents[0]
+            else:
+                extraction[field] = '\n'.join(f"{name}: {content}" for name, content in zip(names, contents))
+        extractions[step_key] = extraction
+    return extractions
+
+
+def plan_extract_sub_question(step_content, step_items, context, question):
+    """用一次请求提取给定步骤中所有物理量的结果和公式。
 
-        # 寻找deepseek.txt文件
-        deepseek_path = os.path.join(txt_folder, "deepseek_ds.txt")
-        if not os.path.exists(deepseek_path):
+    step_items 为 step_key -> (step_analysis, standard_step_content)。返回
+    step_key -> 供 plan_evaluate_step 使用的提取结果；回复中缺失的步骤对应 None，
+    由这些步骤自行发送提取请求。"""
+    steps_parts = []
+    for step_key, (step_analysis, _) in step_items.items():
+        names_prompt = '\n'.join(f"- {q['name']}" for q in step_analysis['result_quantity'])
+        steps_parts.append(f"{step_key}：\n{names_prompt}")
+
+    prompt = f"""基于以上解题步骤内容，请提取与以下各步骤物理量相关的内容：
+{chr(10).join(steps_parts)}
+对每个物理量，返回解题步骤内容中得到的结果（result）以及得到它所用的公式（equation）。内容中没有给出的项用空字符串表示。
+只返回 JSON 对象，将每个步骤映射到其物理量列表，不要添加任何解释，例如：
+{{"step_1": [{{"name": "v", "result": "3.0 m/s", "equation": "v = a * t"}}]}}"""
+
+    try:
+        reply = yield ChatRequest(
+            model="deepseek-chat",
+            kind="step.extract_shared",
+            messages=judge_messages(context, question, prompt, step_content)
+        )
+    except Exception as e:
+        print(f"共用提取出错: {str(e)}")
+        return dict.fromkeys(step_items)
+    return parse_shared_extraction(reply, step_items)
+
+
+def get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping):
+    """返回子问题各步骤的 step_key -> (步骤分析, 标准步骤内容)"""
+    steps_analysis = problem_data_v8['steps_analysis']
+    
+    # 获取该子问题的step范围
+    start_step = sub_q_step_mapping[sub_q_key]['start_step']
+    end_step = sub_q_step_mapping[sub_q_key]['end_step']
+
+    # 遍历该子问题对应的steps
+    step_items = {}
+    for step_num in range(start_step, end_step + 1):
+        step_key = f"step_{step_num}"
+        if step_key in steps_analysis:
+            step_items[step_key] = (steps_analysis[step_key], problem_data_v8['explanation_steps'][sub_q_key][step_key])
+    return step_items
+
+
+def score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping):
+    """为每个已评估步骤打分，并在该子问题的所有步骤上取平均"""
+    step_scores = {}
+    for step_key, step_results in step_results_by_key.items():
+        # 计算步骤得分
+        step_score = 0.0
+        if step_results['equation_correct']:
+            step_score += 0.5
+        if step_results['value_correct']:
+            step_score += 0.5
+            
+        step_scores[step_key] = {
+            'score': step_score,
+            'analysis': step_results
+        }
+
+    # 计算总分（使用该子问题steps的平均分）
+    total_steps = sub_q_step_mapping[sub_q_key]['end_step'] - sub_q_step_mapping[sub_q_key]['start_step'] + 1
+    total_score = sum(s['score'] for s in step_scores.values()) / total_steps if total_steps > 0 else 0.0
+    
+    return {
+        'score': total_score,
+        'steps': step_scores
+    }
+
+
+def evaluate_sub_question(client, problem_data_v8, sub_q_key, sub_q_data, expected_answer, sub_q_step_mapping, step_executor, pbar_eval, journal=None):
+    """评估单个子问题：先判断最终答案，再在 step_executor 上并发评估各步骤"""
+    actual_answer = sub_q_data['answer']
+    
+    # 首先评估整体答案
+    is_correct = run_plan(client, journaled(journal, "answer", sub_q_key, plan_evaluate_answer(
+        actual_answer,
+        expected_answer,
+        problem_data_v8['question_structure']['context'],
+        problem_data_v8['question_structure'][sub_q_key],
+        pbar_eval
+    )))
+    print(f"{sub_q_key} answer is_correct: {is_correct}")
+    
+    if is_correct:
+        # 如果答案正确，直接给满分
+        return {
+            'score': 1.0,
+            'steps': {}
+        }
+
+    # 如果答案错误，从该子问题的第一个step开始评估
+    step_items = get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping)
+    
+    # 合并该子问题在deepseek.txt中的所有步骤内容
+    deepseek_steps_content = "\n".join([
+        step_data['content'] 
+        for step_data in sub_q_data['steps'].values()
+    ])
+
+    # 批量模式下先用一次结构化请求评估所有步骤
+    batched_results = {}
+    pending_items = {step_key: item for step_key, item in step_items.items() if not journal_has(journal, "step", step_key)}
+    if BATCH_STEP_JUDGING and pending_items:
+        batched_results = evaluate_steps_batched(
+            client,
+            deepseek_steps_content,
+            pending_items,
+            problem_data_v8['question_structure']['context'],
+            problem_data_v8['question_structure'][sub_q_key],
+            pbar_eval
+        )
+        record_batched_results(journal, batched_results)
+
+    # 其余待评估步骤共用一次对其所有物理量的提取
+    extractions = {}
+    extract_items = {step_key: item for step_key, item in pending_items.items() if batched_results.get(step_key) is None}
+    if SHARED_EXTRACTION and extract_items:
+        extractions = run_plan(client, journaled(journal, "extraction", sub_q_key, plan_extract_sub_question(
+            deepseek_steps_content,
+            extract_items,
+            problem_data_v8['question_structure']['context'],
+            problem_data_v8['question_structure'][sub_q_key]
+        )))
+
+    # 各步骤都与合并后的内容比较、互不依赖，因此其余步骤并发评估
+    step_futures = {}
+    for step_key, (step_analysis, standard_step_content) in step_items.items():
+        if batched_results.get(step_key) is not None:
             continue
-        # print("deepseek_path is", deepseek_path)
-        
-        
-        with open(deepseek_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # 在合并后的内容中查找匹配
+        step_futures[step_key] = step_executor.submit(
+            run_plan,
+            client,
+            journaled(journal, "step", step_key, plan_evaluate_step(
+                deepseek_steps_content,  # 使用合并后的内容
+                step_analysis,
+                problem_data_v8['question_structure']['context'],
+                problem_data_v8['question_structure'][sub_q_key],
+                standard_step_content,
+                pbar_eval,
+                extractions.get(step_key)
+            ))
+        )
+
+    # 按步骤顺序收集结果
+    step_results_by_key = {}
+    for step_key in step_items:
+        if step_key in step_futures:
+            step_results_by_key[step_key] = step_futures[step_key].result()
+        else:
+            step_results_by_key[step_key] = batched_results[step_key]
+
+    return score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping)
+
+
+async def aevaluate_sub_question(client, problem_data_v8, sub_q_key, sub_q_data, expected_answer, sub_q_step_mapping, pbar_eval, journal=None):
+    """asyncio 版的 evaluate_sub_question：各步骤作为并发任务运行，而不是线程池任务"""
+    context = problem_data_v8['question_structure']['context']
+    question = problem_data_v8['question_structure'][sub_q_key]
+
+    is_correct = await arun_plan(client, journaled(journal, "answer", sub_q_key, plan_evaluate_answer(sub_q_data['answer'], expected_answer, context, question, pbar_eval)))
+    print(f"{sub_q_key} answer is_correct: {is_correct}")
+    
+    if is_correct:
+        return {
+            'score': 1.0,
+            'steps': {}
+        }
+
+    step_items = get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping)
+    deepseek_steps_content = "\n".join([
+        step_data['content'] 
+        for step_data in sub_q_data['steps'].values()
+    ])
+
+    batched_results = {}
+    pending_items = {step_key: item for step_key, item in step_items.items() if not journal_has(journal, "step", step_key)}
+    if BATCH_STEP_JUDGING and pending_items:
+        batched_results = await aevaluate_steps_batched(client, deepseek_steps_content, pending_items, context, question, pbar_eval)
+        record_batched_results(journal, batched_results)
+
+    extractions = {}
+    extract_items = {step_key: item for step_key, item in pending_items.items() if batched_results.get(step_key) is None}
+    if SHARED_EXTRACTION and extract_items:
+        extractions = await arun_plan(client, journaled(journal, "extraction", sub_q_key, plan_extract_sub_question(
+            deepseek_steps_content, extract_items, context, question
+        )))
+
+    pending_keys = [step_key for step_key in step_items if batched_results.get(step_key) is None]
+    pending_results = await asyncio.gather(*(
+        arun_plan(client, journaled(journal, "step", step_key, plan_evaluate_step(
+            deepseek_steps_content,
+            step_items[step_key][0],
+            context,
+            question,
+            step_items[step_key][1],
+            pbar_eval,
+            extractions.get(step_key)
+        )))
+        for step_key in pending_keys
+    ))
+    pending_results = dict(zip(pending_keys, pending_results))
+
+    step_results_by_key = {}
+    for step_key in step_items:
+        if step_key in pending_results:
+            step_results_by_key[step_key] = pending_results[step_key]
+        else:
+            step_results_by_key[step_key] = batched_results[step_key]
+
+    return score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping)
+
+
+def index_problem(subfolder_path):
+    """读取 problem.json，得到同一问题各模型评估共用的数据；没有该文件时返回 None"""
+    # 读取v8问题文件
+    problem_path_v8 = os.path.join(subfolder_path, "problem.json")
+    if not os.path.exists(problem_path_v8):
+        return None
 
-        # 获取预期的子问题列表
-        expected_sub_questions = [f"sub_question_{i+1}" for i in range(len(problem_data_v8['answer']))]
+    with open(problem_path_v8, 'r', encoding='utf-8') as f:
+        problem_data_v8 = json.load(f)
 
-        # 解析deepseek.txt内容
-        parsed_content = parse_deepseek_content(content, expected_sub_questions)
+    # 获取预期的子问题列表
+    expected_sub_questions = [f"sub_question_{i+1}" for i in range(len(problem_data_v8['answer']))]
+
+    # 为每个子问题建立step映射
+    sub_q_step_mapping = {}
+    current_step = 1
+
+    # 遍历 explanation_steps 中的每个子问题
+    for sub_q_key in problem_data_v8['explanation_steps'].keys():
+        # 获取当前子问题的步骤数量
+        steps_in_sub_q = len(problem_data_v8['explanation_steps'][sub_q_key])
         
-        # 评估结果
-        txt_results = {}
+        # 更新 sub_q_step_mapping
+        sub_q_step_mapping[sub_q_key] = {
+            'start_step': current_step,
+            'end_step': current_step + steps_in_sub_q - 1
+        }
         
-        # 为每个子问题建立step映射
-        sub_q_step_mapping = {}
-        current_step = 1
-
-        # 遍历 explanation_steps 中的每个子问题
-        for sub_q_key in problem_data_v8['explanation_steps'].keys():
-            # 获取当前子问题的步骤数量
-            steps_in_sub_q = len(problem_data_v8['explanation_steps'][sub_q_key])
+        # 更新 current_step 为下一个子问题的起始步骤
+        current_step += steps_in_sub_q
+
+    return {
+        'data': problem_data_v8,
+        'expected_sub_questions': expected_sub_questions,
+        'sub_q_step_mapping': sub_q_step_mapping
+    }
+
+
+def load_problem(subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """读取并解析单个问题文件夹，返回 (problem_data_v8, parsed_content, sub_q_step_mapping, result_path)；跳过时返回 None。
+
+    评估同一问题的多个模型输出时，problem 为该文件夹的 index_problem() 结果。"""
+    if problem is None and not os.path.exists(os.path.join(subfolder_path, "problem.json")):
+        return None
+
+    evaluation_path = os.path.join(subfolder_path, "evaluation")
+    os.makedirs(evaluation_path, exist_ok=True)
+    deepseek_result_path = os.path.join(evaluation_path, result_name)
+    if os.path.exists(deepseek_result_path):
+        print(f"{deepseek_result_path} 已存在，跳过评估。")
+        return None
+
+    if problem is None:
+        problem = index_problem(subfolder_path)
+
+    # 读取txt文件夹中的评估文件
+    txt_folder = os.path.join(subfolder_path, "txt")
+    if not os.path.exists(txt_folder):
+        return None
+
+    # 寻找deepseek.txt文件
+    deepseek_path = os.path.join(txt_folder, txt_name)
+    if not os.path.exists(deepseek_path):
+        return None
+    # print("deepseek_path is", deepseek_path)
+    
+    
+    with open(deepseek_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # 解析deepseek.txt内容
+    parsed_content = parse_deepseek_content(content, problem['expected_sub_questions'])
+
+    return problem['data'], parsed_content, problem['sub_q_step_mapping'], deepseek_result_path
+
+
+def save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results):
+    # 保存评估结果
+    with open(deepseek_result_path, 'w', encoding='utf-8') as f:
+        json.dump(txt_results, f, indent=4)
+    print(f"评估结果已保存到: {deepseek_result_path}")
+    store_rows(step_rows(subfolder_path, deepseek_result_path, problem_data_v8, txt_results))
+    record_step_file(subfolder_path, deepseek_result_path, problem_data_v8.get('difficulty'), txt_results)
+
+
+def evaluate_problem(client, subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """评估单个问题文件夹，返回评估结果；跳过时返回 None"""
+    loaded = load_problem(subfolder_path, txt_name, result_name, problem)
+    if loaded is None:
+        return None
+    problem_data_v8, parsed_content, sub_q_step_mapping, deepseek_result_path = loaded
+
+    # 评估结果
+    txt_results = {}
+    journal = open_journal(deepseek_result_path)
+    
+    # 子问题同样并发评估，llm_client.MAX_IN_FLIGHT 限制所有请求的总并发数
+    with tqdm(total=len(problem_data_v8['answer']), desc=f"评估 {txt_name}") as pbar_eval, \
+            ThreadPoolExecutor(max_workers=STEP_WORKERS) as step_executor, \
+            ThreadPoolExecutor(max_workers=max(len(parsed_content), 1)) as sub_q_executor:
+        sub_q_futures = {}
+        for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items()):
+            sub_q_futures[sub_q_key] = sub_q_executor.submit(
+                evaluate_sub_question,
+                client,
+                problem_data_v8,
+                sub_q_key,
+                sub_q_data,
+                problem_data_v8['answer'][i],
+                sub_q_step_mapping,
+                step_executor,
+                pbar_eval,
+                journal
+            )
+        for sub_q_key, future in sub_q_futures.items():
+            txt_results[sub_q_key] = future.result()
+
+    save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results)
+    journal.finish()
+    return txt_results
+
+
+async def aevaluate_problem(client, subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """asyncio 版的 evaluate_problem；client 为 AsyncOpenAI 客户端"""
+    loaded = load_problem(subfolder_path, txt_name, result_name, problem)
+    if loaded is None:
+        return None
+    problem_data_v8, parsed_content, sub_q_step_mapping, deepseek_result_path = loaded
+
+    journal = open_journal(deepseek_result_path)
+    with tqdm(total=len(problem_data_v8['answer']), desc=f"评估 {txt_name}") as pbar_eval:
+        sub_q_results = await asyncio.gather(*(
+            aevaluate_sub_question(
+                client,
+                problem_data_v8,
+                sub_q_key,
+                sub_q_data,
+                problem_data_v8['answer'][i],
+                sub_q_step_mapping,
+                pbar_eval,
+                journal
+            )
+            for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items())
+        ))
+    txt_results = dict(zip(parsed_content.keys(), sub_q_results))
+
+    save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results)
+    journal.finish()
+    return txt_results
+
+
+def pending_problems(folder_path, txt_name="deepseek_r1_ds.txt"):
+    """从清单中读取仍有整理后输出待评估的问题，按估计耗时从长到短返回 (文件夹, 路径, outputs, cost)；
+    outputs 为 (txt_name, result_name) 列表，cost 为其估计的评估调用次数"""
+    problems = []
+    for subfolder, subfolder_path, entry in load_manifest(folder_path).problems():
+        txt_names = [name for name in entry["files"]["txt"] if name.endswith("_ds.txt")] if ALL_MODELS else [txt_name]
+        outputs = [
+            (name, f"{os.path.splitext(name)[0]}.json")
+            for name in txt_names
+            if has_file(entry, 'txt', name) and not has_file(entry, 'evaluation', f"{os.path.splitext(name)[0]}.json")
+        ]
+        if outputs:
+            problems.append((subfolder, subfolder_path, outputs, estimate_cost(entry, 'step') * len(outputs)))
+    # 困难、步骤多的问题先开始（LPT），避免运行末尾只剩它们在跑
+    return lpt_order(problems, lambda problem: problem[3])
+
+
+def evaluate_problem_models(client, subfolder_path, outputs):
+    """同时评估同一问题的多个模型输出，problem.json 只读取一次"""
+    problem = index_problem(subfolder_path)
+    if problem is None:
+        return {}
+    if len(outputs) == 1:
+        txt_name, result_name = outputs[0]
+        return {result_name: evaluate_problem(client, subfolder_path, txt_name, result_name, problem)}
+    # 各模型并行评估；llm_client.MAX_IN_FLIGHT 限制所有模型的总请求数
+    with ThreadPoolExecutor(max_workers=len(outputs)) as model_executor:
+        futures = {
+            result_name: model_executor.submit(evaluate_problem, client, subfolder_path, txt_name, result_name, problem)
+            for txt_name, result_name in outputs
+        }
+        return {result_name: future.result() for result_name, future in futures.items()}
+
+
+def evaluate_folder(folder_path: str):
+    """评估文件夹中的所有问题"""
+    results = {}
+    client = get_client()
+    
+    # 遍历所有子文件夹
+    problems = pending_problems(folder_path)
+    # ETA 按剩余问题的估计耗时计算
+    with cost_bar(sum(problem[3] for problem in problems), desc="处理子文件夹") as pbar:
+        for subfolder, subfolder_path, outputs, cost in problems:
+            print("subfolder_path is", subfolder_path)
             
-            # 更新 sub_q_step_mapping
-            sub_q_step_mapping[sub_q_key] = {
-                'start_step': current_step,
-                'end_step': current_step + steps_in_sub_q - 1
+            model_results = {
+                result_name: txt_results
+                for result_name, txt_results in evaluate_problem_models(client, subfolder_path, outputs).items()
+                if txt_results is not None
             }
-            
-            # 更新 current_step 为下一个子问题的起始步骤
-            current_step += steps_in_sub_q
+            pbar.update(cost)
+            if not model_results:
+                continue
+            # 单个模型时保持 {子文件夹: 结果} 的格式；ALL_MODELS 时按结果文件分别保存各模型的结果
+            results[subfolder] = model_results if ALL_MODELS else model_results[outputs[0][1]]
+            # break
+    
+    return results
 
-        
-        with tqdm(total=len(problem_data_v8['answer']), desc=f"评估 deepseek_r1.txt") as pbar_eval:
-            for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items()):
-                expected_answer = problem_data_v8['answer'][i]
-                actual_answer = sub_q_data['answer']
-                
-                # 首先评估整体答案
-                is_correct = evaluate_with_deepseek(
-                    actual_answer,
-                    expected_answer,
-                    problem_data_v8['question_structure']['context'],
-                    problem_data_v8['question_structure'][sub_q_key],
-                    pbar_eval
-                )
-                print(f"{sub_q_key} answer is_correct: {is_correct}")
-                
-                if is_correct:
-                    # 如果答案正确，直接给满分
-                    txt_results[sub_q_key] = {
-                        'score': 1.0,
-                        'steps': {}
-                    }
-                else:
-                    # 如果答案错误，从该子问题的第一个step开始评估
-                    step_scores = {}
-                    steps_analysis = problem_data_v8['steps_analysis']
-                    
-                    # 获取该子问题的step范围
-                    start_step = sub_q_step_mapping[sub_q_key]['start_step']
-                    end_step = sub_q_step_mapping[sub_q_key]['end_step']
-                    
-                    # 合并该子问题在deepseek.txt中的所有步骤内容
-                    deepseek_steps_content = "\n".join([
-                        step_data['content'] 
-                        for step_data in sub_q_data['steps'].values()
-                    ])
-
-                    # 遍历该子问题对应的steps
-                    for step_num in range(start_step, end_step + 1):
-                        step_key = f"step_{step_num}"
-                        if step_key in steps_analysis:
-                            step_analysis = steps_analysis[step_key]
-                            
-                            # 在合并后的内容中查找匹配
-                            step_results = evaluate_step_content(
-                                client,
-                                deepseek_steps_content,  # 使用合并后的内容
-                                step_analysis,
-                                problem_data_v8['question_structure']['context'],
-                                problem_data_v8['question_structure'][sub_q_key],
-                                problem_data_v8['explanation_steps'][sub_q_key][step_key],
-                                pbar_eval
-                            )
-                            
-                            # 计算步骤得分
-                            step_score = 0.0
-                            if step_results['equation_correct']:
-                                step_score += 0.5
-                            if step_results['value_correct']:
-                                step_score += 0.5
-                                
-                            step_scores[step_key] = {
-                                'score': step_score,
-                                'analysis': step_results
-                            }
-
-                    # 计算总分（使用该子问题steps的平均分）
-                    total_steps = end_step - start_step + 1
-                    total_score = sum(s['score'] for s in step_scores.values()) / total_steps if total_steps > 0 else 0.0
-                    
-                    txt_results[sub_q_key] = {
-                        'score': total_score,
-                        'steps': step_scores
-                    }
-
-        # 保存评估结果
-        with open(deepseek_result_path, 'w', encoding='utf-8') as f:
-            json.dump(txt_results, f, indent=4)
-        print(f"评估结果已保存到: {deepseek_result_path}")
-        results[subfolder] = txt_results
-        # break
+
+async def aevaluate_folder(folder_path: str, concurrency=ASYNC_PROBLEMS):
+    """用 asyncio 引擎评估文件夹中的所有问题，最多同时评估 `concurrency` 个模型输出。
+
+    所有问题在同一个 task group 中运行，出错或 Ctrl+C 时会取消全部未完成的请求，
+    不会留下仍在运行的线程。"""
+    results = {}
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def evaluate(subfolder, subfolder_path, outputs, cost, pbar):
+        shared = {}
+
+        async def evaluate_model(txt_name, result_name):
+            async with semaphore:
+                # 问题的第一个输出开始时读取 problem.json，其他模型直接复用
+                if 'problem' not in shared:
+                    shared['problem'] = index_problem(subfolder_path)
+                if shared['problem'] is None:
+                    return None
+                return await aevaluate_problem(client, subfolder_path, txt_name, result_name, shared['problem'])
+
+        model_results = await asyncio.gather(*(evaluate_model(txt_name, result_name) for txt_name, result_name in outputs))
+        model_results = {
+            result_name: txt_results
+            for (_, result_name), txt_results in zip(outputs, model_results)
+            if txt_results is not None
+        }
+        pbar.update(cost)
+        if model_results:
+            results[subfolder] = model_results if ALL_MODELS else model_results[outputs[0][1]]
+
+    # 按问题依次排队（耗时长的在前），同一问题的各模型输出并行评估
+    problems = pending_problems(folder_path)
+    with cost_bar(sum(problem[3] for problem in problems), desc="处理子文件夹") as pbar:
+        async with asyncio.TaskGroup() as task_group:
+            for subfolder, subfolder_path, outputs, cost in problems:
+                task_group.create_task(evaluate(subfolder, subfolder_path, outputs, cost, pbar))
     
     return results
 
-# 使用示例
-folder_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
-results = evaluate_folder(folder_path)
+def main():
+    # 使用示例
+    folder_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
+    if USE_ASYNC:
+        asyncio.run(aevaluate_folder(folder_path))
+    else:
+        evaluate_folder(folder_path)
+    print(cache_report())
+    print(rate_limit_report())
+    print(prompt_cache_report())
+    print(profile_report())
+    print(saved_calls_report())
+    print(store_report())
+    print(leaderboard_report(folder_path))
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,73 @@
 import json
 import re
 import os
-from typing import Dict, Any
 from tqdm import tqdm
-from openai import OpenAI
-import time
-
-def parse_deepseek_content(content: str, expected_sub_questions: list) -> Dict[str, Dict[str, Any]]:
-    """Parse deepseek.txt content into hierarchical structure"""
-    sub_q_pattern = re.compile(
-        r'(sub_question_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
-        re.DOTALL
-    )
-
-    sub_questions = {}
-    matches = re.findall(sub_q_pattern, content)
-
-    # Create mapping of parsed sub-questions
-    parsed_sub_qs = {sub_q_label: sub_q_block for sub_q_label, sub_q_block in matches}
-
-    # Process all expected sub-questions
-    for sub_q_label in expected_sub_questions:
-        if sub_q_label in parsed_sub_qs:
-            # Process existing sub-questions
-            sub_q_block = parsed_sub_qs[sub_q_label]
-            step_pattern = re.compile(
-                r'(step_\d+)\s*:\s*(.*?)(?=(?:(?:\n|^)step_\d+\s*:|'
-                + sub_q_label + r'_answer\s*:|$))',
-                re.DOTALL
-            )
-            
-            steps = {}
-            for step_label, step_text in re.findall(step_pattern, sub_q_block):
-                steps[step_label] = {
-                    "content": step_text.strip()
-                }
-
-            answer_pattern = re.compile(
-                rf'{sub_q_label}_answer\s*:\s*(.*?)(?=(?:(?:\n|^)sub_question_\d+\s*:|$))',
-                re.DOTALL
-            )
-            answer_match = re.search(answer_pattern, sub_q_block)
-            answer = answer_match.group(1).strip() if answer_match else ""
+from llm_client import get_client, get_async_client, ChatRequest, Pause, VERDICT, run_plan, arun_plan, record_saved_call, saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from rate_limit import rate_limit_report
+from call_profile import profile_report
+from result_parser import parse_deepseek_content
+from equivalence import answers_equivalent, values_equivalent, expressions_equivalent, single_quantity_verdict
+from run_journal import open_journal, journaled, journal_has
+from manifest import load_manifest, has_file
+from scheduler import estimate_cost, lpt_order, cost_bar
+from results_store import step_rows, store_rows, store_report
+from leaderboard import record_step_file, leaderboard_report
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+STEP_WORKERS = 16  # Steps graded at once within a problem
+
+BATCH_STEP_JUDGING = False  # Judge all steps of a failing sub-question with one structured request instead of per-step prompts
+LOCAL_EQUIVALENCE = True  # Decide plain numbers with units and simple formulas locally (see equivalence.py) before asking the LLM
+SHARED_EXTRACTION = False  # Extract the result and formula of every quantity of a failing sub-question with one request shared by its steps, instead of two extraction requests per step
+
+USE_ASYNC = False  # Run on the asyncio engine (AsyncOpenAI, one event loop) instead of thread pools
+ASYNC_PROBLEMS = 8  # Model outputs evaluated at once by the asyncio engine (one per problem unless ALL_MODELS)
+ALL_MODELS = False  # Evaluate the restructured output (txt/<model>_ds.txt) of every model in one run instead of only deepseek_r1_ds.txt
+
+ERROR_CATEGORIES = """Graphical Analysis Errors: 
+Errors in understanding, drawing, analyzing, or extracting data from graphics. For example, misreading coordinate axes, misjudging curve trends, or missing key data points.
 
-            sub_questions[sub_q_label] = {
-                "steps": steps,
-                "answer": answer,
-                "is_complete": True
-            }
-        else:
-            # Add missing sub-questions
-            sub_questions[sub_q_label] = {
-                "steps": {},
-                "answer": "",
-                "is_complete": False
-            }
+Physical Law Application Errors: 
+Confusing physical law concepts or using them in inappropriate scenarios. For example, misusing the law of conservation of momentum or the law of conservation of energy.
+
+Physical Condition Analysis Errors: 
+Misjudgment of system boundaries, internal and external forces, or components. For example, ignoring friction or misjudging the isolation of the system.
 
-    return sub_questions
+Physical Process Understanding Errors: 
+Deviations in the understanding of the development of phenomena, state changes, or causal relationships. For example, incorrect analysis of the motion process of an object or the mechanism of energy conversion.
 
+Variable Relationship Errors: 
+Misunderstanding of the dependency or functional relationship between physical quantities. For example, misunderstanding that acceleration is proportional to velocity.
 
-def evaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval):
-    """Evaluate individual step content, analyzing all physical quantities point by point"""
+Calculation Process Errors: 
+Errors in mathematical operations, formula derivation, or substitution calculations. For example, algebraic operation errors or unit conversion errors.
+
+Boundary Condition Analysis Errors: 
+Ignoring or incorrectly handling special cases, limiting conditions, or ranges of applicability. For example, not considering system behavior at extreme temperatures or pressures."""
+
+# Every judge request starts with this system prompt and the problem block of judge_messages, so providers with
+# prefix caching (DeepSeek) serve that shared part of the prompt from cache on every call about the same question
+SYSTEM_PROMPT = f"""You are a professional physics solution evaluation assistant.
+Error categories used when classifying an error:
+{ERROR_CATEGORIES}"""
+
+def judge_messages(context, question, prompt, step_content=None):
+    """Messages of a judge request: the fixed system prompt, the problem, the solution content, then the call-specific prompt"""
+    shared = f"Problem context: {context}\nSpecific question: {question}\n"
+    if step_content is not None:
+        shared += f"Solution step content: {step_content}\n"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": shared + prompt},
+    ]
+
+def plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """Request plan of evaluate_step_content (see llm_client.run_plan)
+
+    extraction is this step's part of the shared sub-question extraction
+    (see plan_extract_sub_question); when given, no extraction requests are sent."""
     results = {
         'equation_correct': False,
         'value_correct': False,
@@ -75,23 +82,20 @@ def evaluate_step_content(client, step_content, step_analysis, context, question
 
     try:
         # Extract relevant content
-        extract_result_prompt = f"""Based on the following solution step content, please extract content related to the following physical quantities:
-Problem context: {context}
-Specific question: {question}
-Physical quantities to extract:
+        if extraction is not None:
+            record_saved_call("step extractions")
+            extracted_result_content = extraction['result']
+        else:
+            extract_result_prompt = f"""Based on the solution step content above, please extract content related to the following physical quantities:
 {names_prompt}
-Solution step content: {step_content}
 Please only return the relevant result content, not related formulas, and do not add any explanations."""
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are a professional physics problem analysis assistant."},
-                {"role": "user", "content": extract_result_prompt},
-            ],
-            stream=False
-        )
+            reply = yield ChatRequest(
+                model="deepseek-chat",
+                kind="step.extract_result",
+                messages=judge_messages(context, question, extract_result_prompt, step_content)
+            )
         
-        extracted_result_content = response.choices[0].message.content.strip()
+            extracted_result_content = reply.strip()
         # print(f"Extracted_result_content: {extracted_result_content}")
         pbar_eval.update(1)
 
@@ -110,24 +114,27 @@ Please only return the relevant result content, not related formulas, and do not
                 for i, q in enumerate(step_analysis['result_quantity'])
                 if q['value'] != 'N/A'  # Only process physical quantities with values not 'N/A'
             ])
+            # A single expected value is compared locally when the extracted result is a plain number with a unit
+            local_verdict = single_quantity_verdict(step_analysis['result_quantity'], 'value', extracted_result_content, values_equivalent) if LOCAL_EQUIVALENCE else None
+            if local_verdict is not None:
+                record_saved_call("value judgments")
+                results['value_correct'] = local_verdict
             # If values_str is not empty, proceed with subsequent processing
-            if values_str:
+            elif values_str:
                 value_prompt = f"""Please judge whether the following results are equivalent:
 Expected results:
 {values_str}
 Actual content:
 {extracted_result_content}
 Please judge all results individually. If any one is wrong, it's considered wrong. Only answer "true" or "false". If correct, no explanation needed. If incorrect, briefly explain in one or two sentences."""
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "You are a professional physics calculation result evaluation assistant."},
-                        {"role": "user", "content": value_prompt},
-                    ],
-                    stream=False
+                    kind="step.judge_value",
+                    stop_at=VERDICT,
+                    messages=judge_messages(context, question, value_prompt)
                 )
                 
-                value_result = response.choices[0].message.content.strip()
+                value_result = reply.strip()
                 # print(f"Value result: {value_result}")
                 # Check if result contains "correct"
                 results['value_correct'] = 'true' in value_result.lower()
@@ -137,25 +144,22 @@ Please judge all results individually. If any one is wrong, it's considered wron
         if results['value_correct'] == True:
             results['equation_correct'] = True
         else:
-            extract_equation_prompt = f"""Based on the following solution step content, please extract content related to the following physical quantities:
-Problem context: {context}
-Specific question: {question}
-Physical quantities to extract:
+            if extraction is not None:
+                record_saved_call("step extractions")
+                extract_equation_content = extraction['equation']
+            else:
+                extract_equation_prompt = f"""Based on the solution step content above, please extract content related to the following physical quantities:
 {names_prompt}
-Solution step content: {step_content}
 Return the relevant formulas for obtaining the required physical quantities
 Please only return the relevant content, do not add any explanations."""
-            # Extract relevant content
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a professional physics problem analysis assistant."},
-                    {"role": "user", "content": extract_equation_prompt},
-                ],
-                stream=False
-            )
+                # Extract relevant content
+                reply = yield ChatRequest(
+                    model="deepseek-chat",
+                    kind="step.extract_equation",
+                    messages=judge_messages(context, question, extract_equation_prompt, step_content)
+                )
             
-            extract_equation_content = response.choices[0].message.content.strip()
+                extract_equation_content = reply.strip()
             # print(f"Extract_equation_content: {extract_equation_content}")
 
             pbar_eval.update(1)
@@ -171,23 +175,26 @@ Please only return the relevant content, do not add any explanations."""
                     for i, q in enumerate(step_analysis['result_quantity'])
                     if q['equation'] != 'N/A'  # Only process physical quantities with values not 'N/A'
                 ])
-                if "N/A" not in equations_str:
+                # A single expected formula that sympy proves equivalent needs no LLM call
+                local_verdict = single_quantity_verdict(step_analysis['result_quantity'], 'equation', extract_equation_content, expressions_equivalent) if LOCAL_EQUIVALENCE else None
+                if local_verdict is not None:
+                    record_saved_call("equation judgments")
+                    results['equation_correct'] = local_verdict
+                elif "N/A" not in equations_str:
                     equation_prompt = f"""Please judge whether the following physics formulas are equivalent, ignoring units:
 Expected formulas:
 {equations_str}
 Actual content:
 {extract_equation_content}
 Please judge all formulas, only answer "true" or "false". If correct, no explanation needed. If incorrect, briefly explain in one or two sentences."""
-                    response = client.chat.completions.create(
+                    reply = yield ChatRequest(
                         model="deepseek-chat",
-                        messages=[
-                            {"role": "system", "content": "You are a professional physics formula evaluation assistant."},
-                            {"role": "user", "content": equation_prompt},
-                        ],
-                        stream=False
+                        kind="step.judge_equation",
+                        stop_at=VERDICT,
+                        messages=judge_messages(context, question, equation_prompt)
                     )
                     
-                    equation_result = response.choices[0].message.content.strip()
+                    equation_result = reply.strip()
                     # print(f"Equation result: {equation_result}")
                     results['equation_correct'] = 'true' in equation_result.lower()
             pbar_eval.update(1)
@@ -202,72 +209,61 @@ Actual content:
 {extract_equation_content}
 Please briefly explain the error cause in one or two sentences, answer in English
 """
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "You are a professional physics problem error analysis assistant."},
-                        {"role": "user", "content": error_analysis_prompt},
-                    ],
-                    stream=False
+                    kind="step.error_analysis",
+                    messages=judge_messages(context, question, error_analysis_prompt)
                 )
                 
-                results['error_analysis'] = response.choices[0].message.content.strip()
+                results['error_analysis'] = reply.strip()
 
                 error_prompt = f"""Please analyze the errors in the following solution steps:
 Standard answer content: {standard_step_content}
 Actual content:
 {extract_equation_content}
 Error analysis: {results['error_analysis']}
-Choose one error cause from the following:
-Graphical Analysis Errors: 
-Errors in understanding, drawing, analyzing, or extracting data from graphics. For example, misreading coordinate axes, misjudging curve trends, or missing key data points.
-
-Physical Law Application Errors: 
-Confusing physical law concepts or using them in inappropriate scenarios. For example, misusing the law of conservation of momentum or the law of conservation of energy.
-
-Physical Condition Analysis Errors: 
-Misjudgment of system boundaries, internal and external forces, or components. For example, ignoring friction or misjudging the isolation of the system.
-
-Physical Process Understanding Errors: 
-Deviations in the understanding of the development of phenomena, state changes, or causal relationships. For example, incorrect analysis of the motion process of an object or the mechanism of energy conversion.
-
-Variable Relationship Errors: 
-Misunderstanding of the dependency or functional relationship between physical quantities. For example, misunderstanding that acceleration is proportional to velocity.
-
-Calculation Process Errors: 
-Errors in mathematical operations, formula derivation, or substitution calculations. For example, algebraic operation errors or unit conversion errors.
-
-Boundary Condition Analysis Errors: 
-Ignoring or incorrectly handling special cases, limiting conditions, or ranges of applicability. For example, not considering system behavior at extreme temperatures or pressures.
+Choose one error cause from the error categories listed in the system prompt.
 Only return the error category, for example: Conceptual Errors
 """
 
-                response = client.chat.completions.create(
+                reply = yield ChatRequest(
                     model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": "You are a professional physics problem error analysis assistant."},
-                        {"role": "user", "content": error_prompt},
-                    ],
-                    stream=False
+                    kind="step.error_kind",
+                    messages=judge_messages(context, question, error_prompt)
                 )
                 
-                results['error_kind'] = response.choices[0].message.content.strip()
+                results['error_kind'] = reply.strip()
                 pbar_eval.update(1)
 
     except Exception as e:
         print(f"Evaluation error: {str(e)}")
-        time.sleep(1)
+        yield Pause(1)
 
     return results
 
 
-def evaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
-    """Evaluate whether the answer is correct"""
-    client = OpenAI(api_key="your_api_key", base_url="https://api.deepseek.com")
+def evaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """Evaluate individual step content, analyzing all physical quantities point by point"""
+    return run_plan(client, plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction))
+
+
+async def aevaluate_step_content(client, step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction=None):
+    """Async evaluate_step_content for the asyncio engine; client is an AsyncOpenAI client"""
+    return await arun_plan(client, plan_evaluate_step(step_content, step_analysis, context, question, standard_step_content, pbar_eval, extraction))
+
+
+def plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """Request plan of evaluate_with_deepseek"""
     
-    prompt = f"""Please judge whether the two answers are semantically equivalent based on the following information, ignoring units:
-Specific question:
-{question_content}
+    # Plain numbers and simple expressions are compared locally; only undecidable answers reach the LLM
+    if LOCAL_EQUIVALENCE:
+        verdict = answers_equivalent(actual_answer, expected_answer)
+        if verdict is not None:
+            record_saved_call("answer judgments")
+            pbar_eval.update(1)
+            return verdict
+
+    prompt = f"""Please judge whether the two answers to the question above are semantically equivalent, ignoring units:
 Actual answer:
 {actual_answer}
 Expected answer:
@@ -275,177 +271,650 @@ Expected answer:
 Please only answer "true" or "false" to indicate whether these two answers express the same meaning. When judging, please mainly consider whether details like mathematical expressions are equivalent, no need to consider units."""
 
     try:
-        response = client.chat.completions.create(
+        reply = yield ChatRequest(
             model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are a professional mathematics problem answer evaluation assistant."},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False
+            kind="step.judge_answer",
+            stop_at=VERDICT,
+            messages=judge_messages(context, question_content, prompt)
         )
         
-        result = response.choices[0].message.content.strip()
+        result = reply.strip()
         pbar_eval.update(1)
         return 'true' in result.lower()
     except Exception as e:
         print(f"Evaluation error: {str(e)}")
-        time.sleep(1)  # Add delay for retry
+        yield Pause(1)  # Add delay for retry
         return False
 
 
-def evaluate_folder(folder_path: str):
-    """Evaluate all problems in the folder"""
-    results = {}
-    client = OpenAI(api_key="your_api_key", base_url="https://api.deepseek.com")
-    
-    # Traverse all subfolders
-    for subfolder in tqdm(os.listdir(folder_path), desc="Processing subfolders"):
-        subfolder_path = os.path.join(folder_path, subfolder)
-        if not os.path.isdir(subfolder_path):
-            continue
-        print("subfolder_path is", subfolder_path)
-        
-        # Read v8 problem file
-        problem_path_v8 = os.path.join(subfolder_path, "problem.json")
-        if not os.path.exists(problem_path_v8):
-            continue
+def evaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """Evaluate whether the answer is correct"""
+    return run_plan(get_client(), plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval))
+
+
+async def aevaluate_with_deepseek(actual_answer, expected_answer, context, question_content, pbar_eval):
+    """Async evaluate_with_deepseek for the asyncio engine"""
+    return await arun_plan(get_async_client(), plan_evaluate_answer(actual_answer, expected_answer, context, question_content, pbar_eval))
+
 
-        evaluation_path = os.path.join(subfolder_path, "evaluation")
-        os.makedirs(evaluation_path, exist_ok=True)
-        deepseek_result_path = os.path.join(evaluation_path, "deepseek_ds.json")
-        if os.path.exists(deepseek_result_path):
-            print(f"{deepseek_result_path} already exists, skipping evaluation.")
+def parse_batch_verdicts(reply):
+    """Parse the JSON array of per-step verdicts returned by the batched judge"""
+    match = re.search(r'\[.*\]', reply, re.DOTALL)
+    if not match:
+        return []
+    try:
+        verdicts = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [verdict for verdict in verdicts if isinstance(verdict, dict)]
+
+
+def plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval):
+    """Judge every step of a sub-question in one request.
+
+    step_items maps step_key to (step_analysis, standard_step_content). Returns
+    step_key -> results in the same format as evaluate_step_content; steps missing
+    from the judge's reply map to None so the caller can grade them one by one."""
+    all_results = {}
+    steps_parts = []
+    for step_key, (step_analysis, standard_step_content) in step_items.items():
+        quantities = step_analysis['result_quantity']
+        quantities_str = '\n'.join(
+            f"- {q['name']}: expected result {q['value']}; expected formula {q['equation']}"
+            for q in quantities
+        )
+        steps_parts.append(f"{step_key}:\nStandard answer content: {standard_step_content}\nPhysical quantities:\n{quantities_str}")
+        all_results[step_key] = None
+
+    prompt = f"""Please judge the following solution steps against the solution step content above:
+Steps to judge:
+{chr(10).join(steps_parts)}
+For each step, judge whether the actual content obtains every expected result (value_correct) and uses formulas equivalent to every expected formula, ignoring units (equation_correct). Skip expected results or formulas marked N/A.
+If a step is not fully correct, briefly explain the error cause in one or two sentences in English (error_analysis) and choose one error cause from the error categories listed in the system prompt (error_kind).
+Only return a JSON array with one object per step, for example:
+[{{"step": "step_1", "value_correct": false, "equation_correct": true, "error_analysis": "...", "error_kind": "Calculation Process Errors"}}]"""
+
+    try:
+        reply = yield ChatRequest(
+            model="deepseek-chat",
+            kind="step.batched",
+            messages=judge_messages(context, question, prompt, step_content)
+        )
+    except Exception as e:
+        print(f"Batched evaluation error: {str(e)}")
+        return all_results
+    pbar_eval.update(1)
+
+    for verdict in parse_batch_verdicts(reply):
+        step_key = verdict.get('step')
+        if step_key not in all_results or all_results[step_key] is not None:
             continue
+        quantities = step_items[step_key][0]['result_quantity']
+        results = {
+            'equation_correct': False,
+            'value_correct': False,
+            "miss_item": [],
+            'error_kind': '',
+            'error_analysis': ''
+        }
+        # Apply the same N/A and "correct value implies correct formula" rules as evaluate_step_content
+        if all(q['value'] == 'N/A' for q in quantities):
+            results['miss_item'].append("value_correct")
+        else:
+            results['value_correct'] = verdict.get('value_correct') is True
+        if results['value_correct']:
+            results['equation_correct'] = True
+        elif all(q['equation'] == 'N/A' for q in quantities):
+            results['miss_item'].append("equation_correct")
+        else:
+            results['equation_correct'] = verdict.get('equation_correct') is True
+        if not (results['equation_correct'] and results['value_correct']):
+            results['error_analysis'] = str(verdict.get('error_analysis') or '').strip()
+            results['error_kind'] = str(verdict.get('error_kind') or '').strip()
+        all_results[step_key] = results
+
+    return all_results
+
 
-        with open(problem_path_v8, 'r', encoding='utf-8') as f:
-            problem_data_v8 = json.load(f)
+def evaluate_steps_batched(client, step_content, step_items, context, question, pbar_eval):
+    """Judge every step of a sub-question in one request (see plan_evaluate_steps_batched)"""
+    return run_plan(client, plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval))
 
-        # Read evaluation files in txt folder
-        txt_folder = os.path.join(subfolder_path, "txt")
-        if not os.path.exists(txt_folder):
+
+async def aevaluate_steps_batched(client, step_content, step_items, context, question, pbar_eval):
+    """Async evaluate_steps_batched for the asyncio engine"""
+    return await arun_plan(client, plan_evaluate_steps_batched(step_content, step_items, context, question, pbar_eval))
+
+
+def record_batched_results(journal, batched_results):
+    """Journal the step results of a batched judgment so a restarted run does not judge them again"""
+    if journal is None:
+        return
+    for step_key, step_results in batched_results.items():
+        if step_results is not None:
+            journal.record("step", step_key, step_results)
+
+
+def parse_shared_extraction(reply, step_items):
+    """step_key -> {'result', 'equation'} extracted content from the shared extraction reply.
+
+    The content has the same shape as the per-step extraction replies: the bare
+    result or formula for a single quantity, one "name: content" line per
+    quantity otherwise. Steps missing from the reply, or missing any of their
+    quantities, map to None."""
+    match = re.search(r'\{.*\}', reply, re.DOTALL)
+    try:
+        extracted = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+        extracted = {}
+    if not isinstance(extracted, dict):
+        extracted = {}
+
+    extractions = {}
+    for step_key, (step_analysis, _) in step_items.items():
+        entries = extracted.get(step_key)
+        if not isinstance(entries, list):
+            extractions[step_key] = None
+            continue
+        by_name = {str(entry.get('name')): entry for entry in entries if isinstance(entry, dict)}
+        names = [q['name'] for q in step_analysis['result_quantity']]
+        if any(name not in by_name for name in names):
+            # A renamed or dropped quantity would be judged against nothing; the per-step extraction handles the step
+            extractions[step_key] = None
             continue
+        extraction = {}
+        for field in ('result', 'equation'):
+            contents = [str(by_name[name].get(field) or '').strip() for name in names]
+            if len(names) == 1:
+                extraction[field] = contents[0]
+            else:
+                extraction[field] = '\n'.join(f"{name}: {content}" for name, content in zip(names, contents))
+        extractions[step_key] = extraction
+    return extractions
+
+
+def plan_extract_sub_question(step_content, step_items, context, question):
+    """Extract the result and formula of every physical quantity of the given steps in one request.
 
-        # Find deepseek.txt file
-        deepseek_path = os.path.join(txt_folder, "deepseek_ds.txt")
-        if not os.path.exists(deepseek_path):
+    step_items maps step_key -> (step_analysis, standard_step_content). Returns
+    step_key -> extraction for plan_evaluate_step, or None for steps the reply
+    misses, which then send their own extraction requests."""
+    steps_parts = []
+    for step_key, (step_analysis, _) in step_items.items():
+        names_prompt = '\n'.join(f"- {q['name']}" for q in step_analysis['result_quantity'])
+        steps_parts.append(f"{step_key}:\n{names_prompt}")
+
+    prompt = f"""Based on the solution step content above, please extract content related to the following physical quantities of each step:
+{chr(10).join(steps_parts)}
+For every physical quantity, return its result in the solution step content (result) and the formula used to obtain it (equation). Use an empty string for anything the content does not give.
+Only return a JSON object mapping each step to the list of its physical quantities, without explanations, for example:
+{{"step_1": [{{"name": "v", "result": "3.0 m/s", "equation": "v = a * t"}}]}}"""
+
+    try:
+        reply = yield ChatRequest(
+            model="deepseek-chat",
+            kind="step.extract_shared",
+            messages=judge_messages(context, question, prompt, step_content)
+        )
+    except Exception as e:
+        print(f"Shared extraction error: {str(e)}")
+        return dict.fromkeys(step_items)
+    return parse_shared_extraction(reply, step_items)
+
+
+def get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping):
+    """Map step_key -> (step analysis, standard step content) for the steps of a sub-question"""
+    steps_analysis = problem_data_v8['steps_analysis']
+    
+    # Get step range for this sub-question
+    start_step = sub_q_step_mapping[sub_q_key]['start_step']
+    end_step = sub_q_step_mapping[sub_q_key]['end_step']
+
+    # Traverse steps corresponding to this sub-question
+    step_items = {}
+    for step_num in range(start_step, end_step + 1):
+        step_key = f"step_{step_num}"
+        if step_key in steps_analysis:
+            step_items[step_key] = (steps_analysis[step_key], problem_data_v8['explanation_steps'][sub_q_key][step_key])
+    return step_items
+
+
+def score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping):
+    """Score each judged step and average over the steps of the sub-question"""
+    step_scores = {}
+    for step_key, step_results in step_results_by_key.items():
+        # Calculate step score
+        step_score = 0.0
+        if step_results['equation_correct']:
+            step_score += 0.5
+        if step_results['value_correct']:
+            step_score += 0.5
+            
+        step_scores[step_key] = {
+            'score': step_score,
+            'analysis': step_results
+        }
+
+    # Calculate total score (use average score of steps in this sub-question)
+    total_steps = sub_q_step_mapping[sub_q_key]['end_step'] - sub_q_step_mapping[sub_q_key]['start_step'] + 1
+    total_score = sum(s['score'] for s in step_scores.values()) / total_steps if total_steps > 0 else 0.0
+    
+    return {
+        'score': total_score,
+        'steps': step_scores
+    }
+
+
+def evaluate_sub_question(client, problem_data_v8, sub_q_key, sub_q_data, expected_answer, sub_q_step_mapping, step_executor, pbar_eval, journal=None):
+    """Evaluate one sub-question: check the final answer, then grade its steps on step_executor"""
+    actual_answer = sub_q_data['answer']
+    
+    # First evaluate overall answer
+    is_correct = run_plan(client, journaled(journal, "answer", sub_q_key, plan_evaluate_answer(
+        actual_answer,
+        expected_answer,
+        problem_data_v8['question_structure']['context'],
+        problem_data_v8['question_structure'][sub_q_key],
+        pbar_eval
+    )))
+    print(f"{sub_q_key} answer is_correct: {is_correct}")
+    
+    if is_correct:
+        # If answer is correct, give full score directly
+        return {
+            'score': 1.0,
+            'steps': {}
+        }
+
+    # If answer is incorrect, start evaluating from the first step of this sub-question
+    step_items = get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping)
+    
+    # Merge all step content for this sub-question in deepseek.txt
+    deepseek_steps_content = "\n".join([
+        step_data['content'] 
+        for step_data in sub_q_data['steps'].values()
+    ])
+
+    # In batched mode every step is first judged by one structured request
+    batched_results = {}
+    pending_items = {step_key: item for step_key, item in step_items.items() if not journal_has(journal, "step", step_key)}
+    if BATCH_STEP_JUDGING and pending_items:
+        batched_results = evaluate_steps_batched(
+            client,
+            deepseek_steps_content,
+            pending_items,
+            problem_data_v8['question_structure']['context'],
+            problem_data_v8['question_structure'][sub_q_key],
+            pbar_eval
+        )
+        record_batched_results(journal, batched_results)
+
+    # The steps left to grade share one extraction of all their quantities
+    extractions = {}
+    extract_items = {step_key: item for step_key, item in pending_items.items() if batched_results.get(step_key) is None}
+    if SHARED_EXTRACTION and extract_items:
+        extractions = run_plan(client, journaled(journal, "extraction", sub_q_key, plan_extract_sub_question(
+            deepseek_steps_content,
+            extract_items,
+            problem_data_v8['question_structure']['context'],
+            problem_data_v8['question_structure'][sub_q_key]
+        )))
+
+    # Steps are independent (each is judged against the merged content), so grade the rest concurrently
+    step_futures = {}
+    for step_key, (step_analysis, standard_step_content) in step_items.items():
+        if batched_results.get(step_key) is not None:
             continue
-        # print("deepseek_path is", deepseek_path)
-        
-        
-        with open(deepseek_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Find matches in merged content
+        step_futures[step_key] = step_executor.submit(
+            run_plan,
+            client,
+            journaled(journal, "step", step_key, plan_evaluate_step(
+                deepseek_steps_content,  # Use merged content
+                step_analysis,
+                problem_data_v8['question_structure']['context'],
+                problem_data_v8['question_structure'][sub_q_key],
+                standard_step_content,
+                pbar_eval,
+                extractions.get(step_key)
+            ))
+        )
+
+    # Collect step results in step order
+    step_results_by_key = {}
+    for step_key in step_items:
+        if step_key in step_futures:
+            step_results_by_key[step_key] = step_futures[step_key].result()
+        else:
+            step_results_by_key[step_key] = batched_results[step_key]
+
+    return score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping)
+
+
+async def aevaluate_sub_question(client, problem_data_v8, sub_q_key, sub_q_data, expected_answer, sub_q_step_mapping, pbar_eval, journal=None):
+    """evaluate_sub_question on the asyncio engine: the steps run as concurrent tasks instead of pool jobs"""
+    context = problem_data_v8['question_structure']['context']
+    question = problem_data_v8['question_structure'][sub_q_key]
+
+    is_correct = await arun_plan(client, journaled(journal, "answer", sub_q_key, plan_evaluate_answer(sub_q_data['answer'], expected_answer, context, question, pbar_eval)))
+    print(f"{sub_q_key} answer is_correct: {is_correct}")
+    
+    if is_correct:
+        return {
+            'score': 1.0,
+            'steps': {}
+        }
+
+    step_items = get_step_items(problem_data_v8, sub_q_key, sub_q_step_mapping)
+    deepseek_steps_content = "\n".join([
+        step_data['content'] 
+        for step_data in sub_q_data['steps'].values()
+    ])
+
+    batched_results = {}
+    pending_items = {step_key: item for step_key, item in step_items.items() if not journal_has(journal, "step", step_key)}
+    if BATCH_STEP_JUDGING and pending_items:
+        batched_results = await aevaluate_steps_batched(client, deepseek_steps_content, pending_items, context, question, pbar_eval)
+        record_batched_results(journal, batched_results)
+
+    extractions = {}
+    extract_items = {step_key: item for step_key, item in pending_items.items() if batched_results.get(step_key) is None}
+    if SHARED_EXTRACTION and extract_items:
+        extractions = await arun_plan(client, journaled(journal, "extraction", sub_q_key, plan_extract_sub_question(
+            deepseek_steps_content, extract_items, context, question
+        )))
+
+    pending_keys = [step_key for step_key in step_items if batched_results.get(step_key) is None]
+    pending_results = await asyncio.gather(*(
+        arun_plan(client, journaled(journal, "step", step_key, plan_evaluate_step(
+            deepseek_steps_content,
+            step_items[step_key][0],
+            context,
+            question,
+            step_items[step_key][1],
+            pbar_eval,
+            extractions.get(step_key)
+        )))
+        for step_key in pending_keys
+    ))
+    pending_results = dict(zip(pending_keys, pending_results))
+
+    step_results_by_key = {}
+    for step_key in step_items:
+        if step_key in pending_results:
+            step_results_by_key[step_key] = pending_results[step_key]
+        else:
+            step_results_by_key[step_key] = batched_results[step_key]
+
+    return score_sub_question(step_results_by_key, sub_q_key, sub_q_step_mapping)
+
+
+def index_problem(subfolder_path):
+    """Read problem.json into what every model evaluation of the problem shares, or None when it is missing"""
+    # Read v8 problem file
+    problem_path_v8 = os.path.join(subfolder_path, "problem.json")
+    if not os.path.exists(problem_path_v8):
+        return None
 
-        # Get expected sub-question list
-        expected_sub_questions = [f"sub_question_{i+1}" for i in range(len(problem_data_v8['answer']))]
+    with open(problem_path_v8, 'r', encoding='utf-8') as f:
+        problem_data_v8 = json.load(f)
 
-        # Parse deepseek.txt content
-        parsed_content = parse_deepseek_content(content, expected_sub_questions)
+    # Get expected sub-question list
+    expected_sub_questions = [f"sub_question_{i+1}" for i in range(len(problem_data_v8['answer']))]
+
+    # Establish step mapping for each sub-question
+    sub_q_step_mapping = {}
+    current_step = 1
+
+    # Traverse each sub-question in explanation_steps
+    for sub_q_key in problem_data_v8['explanation_steps'].keys():
+        # Get number of steps in current sub-question
+        steps_in_sub_q = len(problem_data_v8['explanation_steps'][sub_q_key])
         
-        # Evaluation results
-        txt_results = {}
+        # Update sub_q_step_mapping
+        sub_q_step_mapping[sub_q_key] = {
+            'start_step': current_step,
+            'end_step': current_step + steps_in_sub_q - 1
+        }
         
-        # Establish step mapping for each sub-question
-        sub_q_step_mapping = {}
-        current_step = 1
-
-        # Traverse each sub-question in explanation_steps
-        for sub_q_key in problem_data_v8['explanation_steps'].keys():
-            # Get number of steps in current sub-question
-            steps_in_sub_q = len(problem_data_v8['explanation_steps'][sub_q_key])
+        # Update current_step to the starting step of next sub-question
+        current_step += steps_in_sub_q
+
+    return {
+        'data': problem_data_v8,
+        'expected_sub_questions': expected_sub_questions,
+        'sub_q_step_mapping': sub_q_step_mapping
+    }
+
+
+def load_problem(subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """Read and parse one problem folder, returning (problem_data_v8, parsed_content, sub_q_step_mapping, result_path) or None when it is skipped.
+
+    problem is the index_problem() of the folder when several model outputs of it are evaluated."""
+    if problem is None and not os.path.exists(os.path.join(subfolder_path, "problem.json")):
+        return None
+
+    evaluation_path = os.path.join(subfolder_path, "evaluation")
+    os.makedirs(evaluation_path, exist_ok=True)
+    deepseek_result_path = os.path.join(evaluation_path, result_name)
+    if os.path.exists(deepseek_result_path):
+        print(f"{deepseek_result_path} already exists, skipping evaluation.")
+        return None
+
+    if problem is None:
+        problem = index_problem(subfolder_path)
+
+    # Read evaluation files in txt folder
+    txt_folder = os.path.join(subfolder_path, "txt")
+    if not os.path.exists(txt_folder):
+        return None
+
+    # Find deepseek.txt file
+    deepseek_path = os.path.join(txt_folder, txt_name)
+    if not os.path.exists(deepseek_path):
+        return None
+    # print("deepseek_path is", deepseek_path)
+    
+    
+    with open(deepseek_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # Parse deepseek.txt content
+    parsed_content = parse_deepseek_content(content, problem['expected_sub_questions'])
+
+    return problem['data'], parsed_content, problem['sub_q_step_mapping'], deepseek_result_path
+
+
+def save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results):
+    # Save evaluation results
+    with open(deepseek_result_path, 'w', encoding='utf-8') as f:
+        json.dump(txt_results, f, indent=4)
+    print(f"Evaluation results saved to: {deepseek_result_path}")
+    store_rows(step_rows(subfolder_path, deepseek_result_path, problem_data_v8, txt_results))
+    record_step_file(subfolder_path, deepseek_result_path, problem_data_v8.get('difficulty'), txt_results)
+
+
+def evaluate_problem(client, subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """Evaluate one problem folder, returning its results or None when it is skipped"""
+    loaded = load_problem(subfolder_path, txt_name, result_name, problem)
+    if loaded is None:
+        return None
+    problem_data_v8, parsed_content, sub_q_step_mapping, deepseek_result_path = loaded
+
+    # Evaluation results
+    txt_results = {}
+    journal = open_journal(deepseek_result_path)
+    
+    # Sub-questions are graded concurrently too; llm_client.MAX_IN_FLIGHT caps the requests of all of them
+    with tqdm(total=len(problem_data_v8['answer']), desc=f"Evaluating {txt_name}") as pbar_eval, \
+            ThreadPoolExecutor(max_workers=STEP_WORKERS) as step_executor, \
+            ThreadPoolExecutor(max_workers=max(len(parsed_content), 1)) as sub_q_executor:
+        sub_q_futures = {}
+        for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items()):
+            sub_q_futures[sub_q_key] = sub_q_executor.submit(
+                evaluate_sub_question,
+                client,
+                problem_data_v8,
+                sub_q_key,
+                sub_q_data,
+                problem_data_v8['answer'][i],
+                sub_q_step_mapping,
+                step_executor,
+                pbar_eval,
+                journal
+            )
+        for sub_q_key, future in sub_q_futures.items():
+            txt_results[sub_q_key] = future.result()
+
+    save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results)
+    journal.finish()
+    return txt_results
+
+
+async def aevaluate_problem(client, subfolder_path, txt_name="deepseek_r1_ds.txt", result_name="deepseek_r1_ds.json", problem=None):
+    """evaluate_problem on the asyncio engine; client is an AsyncOpenAI client"""
+    loaded = load_problem(subfolder_path, txt_name, result_name, problem)
+    if loaded is None:
+        return None
+    problem_data_v8, parsed_content, sub_q_step_mapping, deepseek_result_path = loaded
+
+    journal = open_journal(deepseek_result_path)
+    with tqdm(total=len(problem_data_v8['answer']), desc=f"Evaluating {txt_name}") as pbar_eval:
+        sub_q_results = await asyncio.gather(*(
+            aevaluate_sub_question(
+                client,
+                problem_data_v8,
+                sub_q_key,
+                sub_q_data,
+                problem_data_v8['answer'][i],
+                sub_q_step_mapping,
+                pbar_eval,
+                journal
+            )
+            for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items())
+        ))
+    txt_results = dict(zip(parsed_content.keys(), sub_q_results))
+
+    save_problem_results(subfolder_path, problem_data_v8, deepseek_result_path, txt_results)
+    journal.finish()
+    return txt_results
+
+
+def pending_problems(folder_path, txt_name="deepseek_r1_ds.txt"):
+    """(folder, path, outputs, cost) of every problem with restructured outputs left to evaluate, read from the manifest,
+    longest first; outputs lists (txt_name, result_name) and cost is their estimated number of judge calls"""
+    problems = []
+    for subfolder, subfolder_path, entry in load_manifest(folder_path).problems():
+        txt_names = [name for name in entry["files"]["txt"] if name.endswith("_ds.txt")] if ALL_MODELS else [txt_name]
+        outputs = [
+            (name, f"{os.path.splitext(name)[0]}.json")
+            for name in txt_names
+            if has_file(entry, 'txt', name) and not has_file(entry, 'evaluation', f"{os.path.splitext(name)[0]}.json")
+        ]
+        if outputs:
+            problems.append((subfolder, subfolder_path, outputs, estimate_cost(entry, 'step') * len(outputs)))
+    # Hard, many-step problems start first (LPT), so they do not run alone at the end of the run
+    return lpt_order(problems, lambda problem: problem[3])
+
+
+def evaluate_problem_models(client, subfolder_path, outputs):
+    """Evaluate several model outputs of one problem at once, reading problem.json only once"""
+    problem = index_problem(subfolder_path)
+    if problem is None:
+        return {}
+    if len(outputs) == 1:
+        txt_name, result_name = outputs[0]
+        return {result_name: evaluate_problem(client, subfolder_path, txt_name, result_name, problem)}
+    # The models are graded concurrently; llm_client.MAX_IN_FLIGHT caps the requests of all of them
+    with ThreadPoolExecutor(max_workers=len(outputs)) as model_executor:
+        futures = {
+            result_name: model_executor.submit(evaluate_problem, client, subfolder_path, txt_name, result_name, problem)
+            for txt_name, result_name in outputs
+        }
+        return {result_name: future.result() for result_name, future in futures.items()}
+
+
+def evaluate_folder(folder_path: str):
+    """Evaluate all problems in the folder"""
+    results = {}
+    client = get_client()
+    
+    # Traverse all subfolders
+    problems = pending_problems(folder_path)
+    # The ETA weighs the remaining problems by their estimated cost
+    with cost_bar(sum(problem[3] for problem in problems), desc="Processing subfolders") as pbar:
+        for subfolder, subfolder_path, outputs, cost in problems:
+            print("subfolder_path is", subfolder_path)
             
-            # Update sub_q_step_mapping
-            sub_q_step_mapping[sub_q_key] = {
-                'start_step': current_step,
-                'end_step': current_step + steps_in_sub_q - 1
+            model_results = {
+                result_name: txt_results
+                for result_name, txt_results in evaluate_problem_models(client, subfolder_path, outputs).items()
+                if txt_results is not None
             }
-            
-            # Update current_step to the starting step of next sub-question
-            current_step += steps_in_sub_q
+            pbar.update(cost)
+            if not model_results:
+                continue
+            # A single model keeps the {subfolder: results} shape; ALL_MODELS maps each result file to its results
+            results[subfolder] = model_results if ALL_MODELS else model_results[outputs[0][1]]
+            # break
+    
+    return results
 
-        
-        with tqdm(total=len(problem_data_v8['answer']), desc=f"Evaluating deepseek_r1.txt") as pbar_eval:
-            for i, (sub_q_key, sub_q_data) in enumerate(parsed_content.items()):
-                expected_answer = problem_data_v8['answer'][i]
-                actual_answer = sub_q_data['answer']
-                
-                # First evaluate overall answer
-                is_correct = evaluate_with_deepseek(
-                    actual_answer,
-                    expected_answer,
-                    problem_data_v8['question_structure']['context'],
-                    problem_data_v8['question_structure'][sub_q_key],
-                    pbar_eval
-                )
-                print(f"{sub_q_key} answer is_correct: {is_correct}")
-                
-                if is_correct:
-                    # If answer is correct, give full score directly
-                    txt_results[sub_q_key] = {
-                        'score': 1.0,
-                        'steps': {}
-                    }
-                else:
-                    # If answer is incorrect, start evaluating from the first step of this sub-question
-                    step_scores = {}
-                    steps_analysis = problem_data_v8['steps_analysis']
-                    
-                    # Get step range for this sub-question
-                    start_step = sub_q_step_mapping[sub_q_key]['start_step']
-                    end_step = sub_q_step_mapping[sub_q_key]['end_step']
-                    
-                    # Merge all step content for this sub-question in deepseek.txt
-                    deepseek_steps_content = "\n".join([
-                        step_data['content'] 
-                        for step_data in sub_q_data['steps'].values()
-                    ])
-
-                    # Traverse steps corresponding to this sub-question
-                    for step_num in range(start_step, end_step + 1):
-                        step_key = f"step_{step_num}"
-                        if step_key in steps_analysis:
-                            step_analysis = steps_analysis[step_key]
-                            
-                            # Find matches in merged content
-                            step_results = evaluate_step_content(
-                                client,
-                                deepseek_steps_content,  # Use merged content
-                                step_analysis,
-                                problem_data_v8['question_structure']['context'],
-                                problem_data_v8['question_structure'][sub_q_key],
-                                problem_data_v8['explanation_steps'][sub_q_key][step_key],
-                                pbar_eval
-                            )
-                            
-                            # Calculate step score
-                            step_score = 0.0
-                            if step_results['equation_correct']:
-                                step_score += 0.5
-                            if step_results['value_correct']:
-                                step_score += 0.5
-                                
-                            step_scores[step_key] = {
-                                'score': step_score,
-                                'analysis': step_results
-                            }
-
-                    # Calculate total score (use average score of steps in this sub-question)
-                    total_steps = end_step - start_step + 1
-                    total_score = sum(s['score'] for s in step_scores.values()) / total_steps if total_steps > 0 else 0.0
-                    
-                    txt_results[sub_q_key] = {
-                        'score': total_score,
-                        'steps': step_scores
-                    }
-
-        # Save evaluation results
-        with open(deepseek_result_path, 'w', encoding='utf-8') as f:
-            json.dump(txt_results, f, indent=4)
-        print(f"Evaluation results saved to: {deepseek_result_path}")
-        results[subfolder] = txt_results
-        # break
+
+async def aevaluate_folder(folder_path: str, concurrency=ASYNC_PROBLEMS):
+    """Evaluate all problems in the folder on the asyncio engine, `concurrency` model outputs at a time.
+
+    The problems run in a task group, so an error or Ctrl+C cancels every
+    outstanding request instead of leaving threads running."""
+    results = {}
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def evaluate(subfolder, subfolder_path, outputs, cost, pbar):
+        shared = {}
+
+        async def evaluate_model(txt_name, result_name):
+            async with semaphore:
+                # The first output of a problem to start reads problem.json; the other models reuse it
+                if 'problem' not in shared:
+                    shared['problem'] = index_problem(subfolder_path)
+                if shared['problem'] is None:
+                    return None
+                return await aevaluate_problem(client, subfolder_path, txt_name, result_name, shared['problem'])
+
+        model_results = await asyncio.gather(*(evaluate_model(txt_name, result_name) for txt_name, result_name in outputs))
+        model_results = {
+            result_name: txt_results
+            for (_, result_name), txt_results in zip(outputs, model_results)
+            if txt_results is not None
+        }
+        pbar.update(cost)
+        if model_results:
+            results[subfolder] = model_results if ALL_MODELS else model_results[outputs[0][1]]
+
+    # Outputs are queued problem by problem, longest first, so the models of a problem run side by side
+    problems = pending_problems(folder_path)
+    with cost_bar(sum(problem[3] for problem in problems), desc="Processing subfolders") as pbar:
+        async with asyncio.TaskGroup() as task_group:
+            for subfolder, subfolder_path, outputs, cost in problems:
+                task_group.create_task(evaluate(subfolder, subfolder_path, outputs, cost, pbar))
     
     return results
 
-# Usage example
-folder_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
-results = evaluate_folder(folder_path)
\ No newline at end of file
+def main():
+    # Usage example
+    folder_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
+    if USE_ASYNC:
+        asyncio.run(aevaluate_folder(folder_path))
+    else:
+        evaluate_folder(folder_path)
+    print(cache_report())
+    print(rate_limit_report())
+    print(prompt_cache_report())
+    print(profile_report())
+    print(saved_calls_report())
+    print(store_report())
+    print(leaderboard_report(folder_path))
+
+if __name__ == "__main__":
+    main()
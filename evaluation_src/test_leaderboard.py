@@ -0,0 +1,44 @@
+import os
+import json
+import leaderboard
+from leaderboard import Leaderboard, record_answer_file, record_step_file, get_leaderboard
+from results_store import answer_rows, step_rows
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+def make_problem(base_path):
+    problem_path = os.path.join(base_path, 'cal_problem_1')
+    write_json(os.path.join(problem_path, 'problem.json'), {"difficulty": "easy", "answer": ["4 m/s"]})
+    return problem_path
+
+def test_answer_and_step_results_of_one_model_share_a_row(tmp_path):
+    problem_path = make_problem(str(tmp_path))
+    write_json(os.path.join(problem_path, 'score', 'evaluation_deepseek_r1_ds.json'),
+               {"deepseek_r1": {"sub_question_1": {"difficulty": "easy", "correct": True}}})
+    write_json(os.path.join(problem_path, 'evaluation', 'deepseek_r1_ds.json'),
+               {"sub_question_1": {"score": 0.5, "steps": {}}})
+
+    totals = Leaderboard(str(tmp_path)).data["totals"]
+    assert list(totals['answer']) == list(totals['step']) == ['deepseek_r1']
+
+def test_recorded_files_of_one_model_share_a_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(leaderboard, '_leaderboards', {})
+    problem_path = make_problem(str(tmp_path))
+    record_answer_file(problem_path, os.path.join(problem_path, 'score', 'evaluation_deepseek_r1_ds.json'),
+                       {1: {"difficulty": "easy", "correct": True}})
+    record_step_file(problem_path, os.path.join(problem_path, 'evaluation', 'deepseek_r1_ds.json'), "easy",
+                     {"sub_question_1": {"score": 0.5, "steps": {}}})
+
+    report = get_leaderboard(str(tmp_path)).report()
+    assert report.splitlines()[1:] == ["deepseek_r1: answer 1/1 (100.0%; easy 100.0%) step score 0.500 (easy 0.500)"]
+
+def test_results_store_rows_of_one_model_share_a_model(tmp_path):
+    problem_path = make_problem(str(tmp_path))
+    answers = answer_rows(problem_path, os.path.join(problem_path, 'score', 'evaluation_deepseek_r1_ds.json'),
+                          {1: {"difficulty": "easy", "correct": True}})
+    steps = step_rows(problem_path, os.path.join(problem_path, 'evaluation', 'deepseek_r1_ds.json'), {"difficulty": "easy"},
+                      {"sub_question_1": {"score": 0.5, "steps": {}}})
+    assert {row['model'] for row in answers + steps} == {'deepseek_r1'}
@@ -0,0 +1,15 @@
+from collections import Counter
+from rate_limit import get_limiter, pick_key
+
+def test_pick_key_spreads_load_across_fresh_keys():
+    keys = ['fresh-a', 'fresh-b', 'fresh-c', 'fresh-d']
+    picks = Counter(pick_key(keys) for _ in range(1000))
+    assert set(picks) == set(keys)
+    assert max(picks.values()) - min(picks.values()) <= 1
+
+def test_pick_key_avoids_cooling_keys():
+    keys = ['cool-a', 'cool-b', 'cool-c']
+    get_limiter('cool-b').on_rate_limited(retry_after=30)
+    picks = Counter(pick_key(keys) for _ in range(100))
+    assert 'cool-b' not in picks
+    assert picks['cool-a'] == picks['cool-c'] == 50
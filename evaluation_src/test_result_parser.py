@@ -0,0 +1,22 @@
+from result_parser import extract_marked_answer
+
+def test_marked_answer_on_its_own_line():
+    content = "step_1: v = a t\nsub_question_1_answer: 4 m/s\nsub_question_2_answer: 10 J\n"
+    assert extract_marked_answer(content, "sub_question_1") == "4 m/s"
+    assert extract_marked_answer(content, "sub_question_2") == "10 J"
+
+def test_marked_answer_followed_by_prose_falls_back():
+    content = "sub_question_1_answer: 10 J\n\n### Summary\nThe block stops after 2 s.\n"
+    assert extract_marked_answer(content, "sub_question_1") is None
+    content = "sub_question_1_answer: 4 m/s\n\n**sub_question_2:** The energy is 10 J\n"
+    assert extract_marked_answer(content, "sub_question_1") is None
+
+def test_marked_answer_wrapped_in_markdown_falls_back():
+    assert extract_marked_answer("**sub_question_1_answer: 10 J**\n", "sub_question_1") is None
+    assert extract_marked_answer("**sub_question_1_answer:** 10 J\n", "sub_question_1") is None
+    assert extract_marked_answer("sub_question_1_answer: **10 J**\n", "sub_question_1") is None
+
+def test_missing_or_ambiguous_marker_falls_back():
+    assert extract_marked_answer("The answer is 10 J\n", "sub_question_1") is None
+    content = "sub_question_1_answer: 10 J\nsub_question_1_answer: 12 J\n"
+    assert extract_marked_answer(content, "sub_question_1") is None
@@ -0,0 +1,180 @@
+import io
+import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import importlib
+import contextlib
+
+import llm_cache
+import llm_client
+import leaderboard
+import format_result_ds
+from mock_llm_server import MockLLMServer
+
+PROBLEMS = 40  # Synthetic problems generated for each run
+MODELS = ['deepseek_r1', 'qwq_32b']  # Model outputs written to result/ of every problem
+CONCURRENCY_LEVELS = [4, 16, 64]  # Workers per stage (and llm_client.MAX_IN_FLIGHT) of each run
+ENGINES = ['thread', 'async']  # 'thread' runs the thread-pool code paths, 'async' the USE_ASYNC ones
+LANG = 'en'  # 'en' or 'ch' prompt variants of the evaluators
+LATENCY = 0.2  # Mock server reply latency in seconds
+JITTER = 0.1
+TOKEN_DELAY = 0.01  # Mock server seconds per generated token
+STREAM_VERDICTS = False  # Sets llm_client.STREAM_VERDICTS, to compare streamed verdicts with full replies
+SHARED_EXTRACTION = False  # Sets SHARED_EXTRACTION of the step evaluator, to compare one extraction per sub-question with two per step
+ERROR_RATE = 0.0  # Share of mock requests failing with a 500
+RATE_LIMIT_RATE = 0.0  # Share of mock requests failing with a 429
+RATE_LIMIT_RPM = None  # Mock per-key quota in requests per minute, for the limiter to find from its 429s
+SEED = 0
+QUIET = True  # Hide the progress output of the stages
+
+DIFFICULTIES = ['knowledge', 'easy', 'medium', 'hard']
+SYMBOLIC_ANSWERS = [r"\sqrt{2 g h}", r"\frac{m v^2}{2}", r"\frac{F}{m}", r"m g \sin\theta", "It moves to the left"]
+
+def make_problem(rng, number):
+    """problem.json of one synthetic problem with 1-4 sub-questions of 1-4 steps each"""
+    sub_questions = rng.randint(1, 4)
+    question_structure = {"context": f"Synthetic problem {number}: a block of mass m slides down a rough incline of height h."}
+    explanation_steps = {}
+    steps_analysis = {}
+    answers = []
+    step = 1
+    for q in range(1, sub_questions + 1):
+        sub_q_key = f"sub_question_{q}"
+        question_structure[sub_q_key] = f"Find quantity {q} of the block."
+        explanation_steps[sub_q_key] = {}
+        for _ in range(rng.randint(1, 4)):
+            value = rng.randint(1, 50)
+            explanation_steps[sub_q_key][f"step_{step}"] = f"Apply Newton's second law to get v{step} = {value}.0 m/s"
+            steps_analysis[f"step_{step}"] = {"result_quantity": [
+                {"name": f"v{step}", "value": f"{value}.0 m/s", "equation": f"v{step} = a * t{step}"}
+            ]}
+            step += 1
+        # Numbers with units are judged locally, symbolic and verbal answers need the LLM judge
+        answers.append(f"{rng.randint(1, 50)}.0 m/s" if rng.random() < 0.5 else rng.choice(SYMBOLIC_ANSWERS))
+    return {
+        "difficulty": rng.choice(DIFFICULTIES),
+        "answer": answers,
+        "question_structure": question_structure,
+        "explanation_steps": explanation_steps,
+        "steps_analysis": steps_analysis,
+    }
+
+def make_output(rng, problem):
+    """A model output for a problem in the structured format, with some wrong steps and answers"""
+    lines = []
+    for q, (sub_q_key, steps) in enumerate(problem["explanation_steps"].items()):
+        lines.append(f"{sub_q_key}:")
+        for step_key, step_text in steps.items():
+            if rng.random() < 0.7:
+                lines.append(f"{step_key}: {step_text}")
+            else:
+                lines.append(f"{step_key}: Using energy conservation, v{step_key[5:]} = {rng.randint(1, 50)}.0 m/s")
+        answer = problem["answer"][q] if rng.random() < 0.6 else rng.choice(SYMBOLIC_ANSWERS)
+        # Some outputs omit the answer marker, so the LLM extractor is exercised too
+        if rng.random() < 0.1:
+            lines.append(f"So the final result is {answer}")
+        else:
+            lines.append(f"{sub_q_key}_answer: {answer}")
+    return "\n".join(lines) + "\n"
+
+def generate_benchmark(base_path, problems=PROBLEMS, models=MODELS, seed=SEED):
+    """Write a synthetic final_benchmark: cal_problem_N/problem.json and result/<model>.txt"""
+    rng = random.Random(seed)
+    for number in range(1, problems + 1):
+        problem_path = os.path.join(base_path, f"cal_problem_{number}")
+        os.makedirs(os.path.join(problem_path, 'result'), exist_ok=True)
+        problem = make_problem(rng, number)
+        with open(os.path.join(problem_path, 'problem.json'), 'w', encoding='utf-8') as f:
+            json.dump(problem, f, indent=4, ensure_ascii=False)
+        for model in models:
+            with open(os.path.join(problem_path, 'result', f"{model}.txt"), 'w', encoding='utf-8') as f:
+                f.write(make_output(rng, problem))
+
+def configure(server, engine, level):
+    """Point every stage at the mock server and set its concurrency to level"""
+    api_key = f"mock-{engine}-{level}"  # A fresh key, so no rate-limiter state carries over between runs
+    llm_cache.CACHE_ENABLED = False
+    leaderboard.LEADERBOARD_ENABLED = False  # Its state file would outlive the temporary benchmark folder
+    llm_client.BASE_URL = server.base_url
+    llm_client.API_KEY = api_key
+    llm_client.STREAM_VERDICTS = STREAM_VERDICTS
+    llm_client.set_max_in_flight(level)
+    llm_client.set_pool_size(level)
+    format_result_ds.API_KEYS = [api_key]
+    format_result_ds.WORKERS_PER_KEY = level
+    format_result_ds.ALL_MODELS = True
+    answer_module = importlib.import_module(f"answer_evaluation_with_ds_{LANG}_prompt")
+    step_module = importlib.import_module(f"step_evaluation_with_ds_{LANG}_prompt")
+    answer_module.ALL_MODELS = step_module.ALL_MODELS = True
+    step_module.STEP_WORKERS = level
+    step_module.SHARED_EXTRACTION = SHARED_EXTRACTION
+    return answer_module, step_module
+
+def run_stages(base_path, engine, level, answer_module, step_module):
+    """Yield each stage name after running it over the benchmark"""
+    if engine == 'async':
+        asyncio.run(format_result_ds.aprocess_files(base_path))
+    else:
+        format_result_ds.process_files(base_path)
+    yield 'restructure'
+
+    files_to_process, _, _ = answer_module.find_files_to_process(base_path)
+    if engine == 'async':
+        asyncio.run(answer_module.aprocess_files(files_to_process, level))
+    else:
+        answer_module.process_files(files_to_process, level)
+    yield 'answer'
+
+    if engine == 'async':
+        asyncio.run(step_module.aevaluate_folder(base_path, level))
+    else:
+        step_module.evaluate_folder(base_path)
+    yield 'step'
+
+def benchmark(server, engine, level, problems=PROBLEMS):
+    """Run every stage over a fresh synthetic benchmark; returns [(stage, seconds, calls)]"""
+    base_path = tempfile.mkdtemp(prefix="synthetic_benchmark_")
+    try:
+        generate_benchmark(base_path, problems)
+        answer_module, step_module = configure(server, engine, level)
+        timings = []
+        output = io.StringIO()
+        with contextlib.ExitStack() as stack:
+            if QUIET:
+                stack.enter_context(contextlib.redirect_stdout(output))
+                stack.enter_context(contextlib.redirect_stderr(output))
+            start, calls = time.perf_counter(), server.requests
+            for stage in run_stages(base_path, engine, level, answer_module, step_module):
+                now = time.perf_counter()
+                timings.append((stage, now - start, server.requests - calls))
+                start, calls = now, server.requests
+        return timings
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+def main():
+    server = MockLLMServer(port=0, latency=LATENCY, jitter=JITTER, error_rate=ERROR_RATE,
+                           rate_limit_rate=RATE_LIMIT_RATE, seed=SEED, token_delay=TOKEN_DELAY,
+                           rate_limit_rpm=RATE_LIMIT_RPM).start()
+    print(f"{PROBLEMS} problems x {len(MODELS)} models, mock latency {LATENCY}s +/- {JITTER}s, "
+          f"{ERROR_RATE:.0%} errors, {RATE_LIMIT_RATE:.0%} rate-limited, streamed verdicts {STREAM_VERDICTS}, shared extraction {SHARED_EXTRACTION}")
+    print(f"{'engine':>7} {'workers':>8} {'stage':>12} {'seconds':>8} {'calls':>6} {'problems/s':>11} {'calls/s':>8}")
+    try:
+        for engine in ENGINES:
+            for level in CONCURRENCY_LEVELS:
+                timings = benchmark(server, engine, level, PROBLEMS)
+                timings.append(('total', sum(seconds for _, seconds, _ in timings), sum(calls for _, _, calls in timings)))
+                for stage, seconds, calls in timings:
+                    print(f"{engine:>7} {level:>8} {stage:>12} {seconds:>8.2f} {calls:>6} "
+                          f"{PROBLEMS / seconds:>11.2f} {calls / seconds:>8.1f}")
+    finally:
+        server.stop()
+        llm_client.close_clients()
+    print(server.report())
+
+if __name__ == "__main__":
+    main()
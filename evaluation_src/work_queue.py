@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+import llm_client
+import format_result_ds
+from manifest import load_manifest, has_file, state_path
+from scheduler import estimate_cost, lpt_order
+from rate_limit import pick_key, rate_limit_report
+from llm_client import saved_calls_report, prompt_cache_report
+from llm_cache import cache_report
+from call_profile import profile_report
+from results_store import store_report
+from leaderboard import leaderboard_report
+
+ROLE = 'worker'  # 'coordinator' queues the pending jobs of the benchmark, 'worker' runs them
+LANG = 'en'  # 'en' or 'ch' prompt variants of the evaluators
+ALL_MODELS = False  # Queue jobs for every model output under result/ (coordinator only)
+QUEUE_NAME = "work_queue.sqlite"  # Kept in the state subfolder of the benchmark, so every worker that mounts it shares the queue
+WORKER_API_KEYS = [
+    "your_api_key",
+]  # Keys of this worker; give each worker (host) its own pool
+WORKER_THREADS = 8  # Jobs a worker runs at once
+LEASE_SECONDS = 300  # A job whose worker stops renewing its lease this long goes back to the queue
+MAX_ATTEMPTS = 3  # Leases of a job before it is marked failed
+POLL_INTERVAL = 2  # Seconds a worker waits for jobs that are blocked or leased by other workers
+
+STATUSES = ['pending', 'leased', 'done', 'failed']
+
+class WorkQueue:
+    """Job queue in a SQLite file shared by a coordinator and any number of worker processes or hosts.
+
+    A job is one stage (restructure, answer or step) of one model output of one
+    problem, identified by its output file, so queueing it twice is a no-op.
+    Workers lease the costliest available job, renew the lease while they run
+    it and acknowledge it when done; a job whose lease runs out (its worker
+    died) is leased again, up to MAX_ATTEMPTS times. A step job waits for the
+    restructure job that writes its input. Problems are stored by folder name,
+    so workers may mount the benchmark at different paths. The file must be on a
+    filesystem with working locks, and the hosts' clocks must agree to well
+    within LEASE_SECONDS."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, stage TEXT, problem TEXT, args TEXT, output TEXT, cost REAL,
+            after TEXT, status TEXT, worker TEXT, lease_until REAL, attempts INTEGER, error TEXT, updated REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, cost)")
+
+    def _transaction(self, statements):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never lease the same job
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def put(self, stage, problem, args, output, cost=1, after=None):
+        """Queue a job and return its id; a finished or failed job of the same output is queued again"""
+        job_id = f"{stage}:{problem}:{output}"
+        self._transaction(lambda conn: conn.execute(
+            """INSERT INTO jobs (id, stage, problem, args, output, cost, after, status, attempts, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', 0, ?)
+            ON CONFLICT (id) DO UPDATE SET status = 'pending', attempts = 0, error = NULL, after = excluded.after,
+                cost = excluded.cost, updated = excluded.updated
+            WHERE status IN ('done', 'failed')""",
+            (job_id, stage, problem, json.dumps(args, ensure_ascii=False), output, cost, after, time.time())
+        ))
+        return job_id
+
+    def lease(self, worker):
+        """The costliest job that is ready (as a dict), leased to worker, or None"""
+        def take(conn):
+            now = time.time()
+            expired = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, MAX_ATTEMPTS)
+            ).fetchall()
+            for (job_id,) in expired:
+                self._fail(conn, job_id, "Lease expired on the last attempt", now)
+            row = conn.execute(
+                """SELECT id, stage, problem, args, output, attempts FROM jobs
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_until < ?))
+                AND (after IS NULL OR after IN (SELECT id FROM jobs WHERE status = 'done'))
+                ORDER BY cost DESC LIMIT 1""",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + LEASE_SECONDS, now, row[0])
+            )
+            return {"id": row[0], "stage": row[1], "problem": row[2], "args": json.loads(row[3]),
+                    "output": row[4], "attempt": row[5] + 1}
+        return self._transaction(take)
+
+    def renew(self, worker, job_ids):
+        """Extend the leases worker still holds"""
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND status = 'leased' AND worker = ?",
+            [(now + LEASE_SECONDS, now, job_id, worker) for job_id in job_ids]
+        ))
+
+    def ack(self, job_id):
+        # The output exists whoever wrote it, so a job leased again after a slow renewal is done too
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'done', error = NULL, updated = ? WHERE id = ?", (time.time(), job_id)
+        ))
+
+    def nack(self, worker, job_id, error):
+        """Return a failed job to the queue, or mark it failed after MAX_ATTEMPTS"""
+        def release(conn):
+            now = time.time()
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND status = 'leased' AND worker = ?", (job_id, worker)).fetchone()
+            if row is None:
+                return  # The lease ran out and the job is already someone else's
+            if row[0] >= MAX_ATTEMPTS:
+                self._fail(conn, job_id, error, now)
+            else:
+                conn.execute("UPDATE jobs SET status = 'pending', error = ?, updated = ? WHERE id = ?", (error, now, job_id))
+        self._transaction(release)
+
+    def _fail(self, conn, job_id, error, now):
+        conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?", (error, now, job_id))
+        # Jobs waiting for it would never become ready
+        for (waiting,) in conn.execute("SELECT id FROM jobs WHERE after = ? AND status = 'pending'", (job_id,)).fetchall():
+            self._fail(conn, waiting, f"{job_id} failed", now)
+
+    def unfinished(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def counts(self):
+        """{stage: {status: jobs}}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status").fetchall()
+        counts = {}
+        for stage, status, count in rows:
+            counts.setdefault(stage, dict.fromkeys(STATUSES, 0))[status] = count
+        return counts
+
+    def report(self):
+        lines = [f"Work queue {self.path}:"]
+        for stage, by_status in sorted(self.counts().items()):
+            lines.append(f"  {stage}: " + ", ".join(f"{count} {status}" for status, count in by_status.items()))
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def queue_path(base_path):
+    # Its journal files come and go with every transaction; there they leave the benchmark folder's mtime alone
+    path = state_path(base_path, QUEUE_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def enqueue_benchmark(base_path, queue, lang=LANG, all_models=ALL_MODELS):
+    """Queue every stage the manifest shows as missing, longest problems first; returns the number of missing outputs.
+
+    Mirrors Pipeline.submit_problem: restructure, then step grading of its
+    output, and answer grading of the raw result/ file alongside."""
+    answer_module = importlib.import_module(f"answer_evaluation_with_ds_{lang}_prompt")
+    if all_models:
+        format_result_ds.ALL_MODELS = answer_module.ALL_MODELS = True
+    manifest = load_manifest(base_path)
+    queued = 0
+    for problem_dir, problem_path, entry in lpt_order(manifest.problems('cal_problem_'), lambda problem: estimate_cost(problem[2], 'step')):
+        for file in entry["files"]["result"]:
+            if not format_result_ds.is_target(file):
+                continue
+            txt_name = os.path.basename(format_result_ds.get_output_path(problem_path, file))
+            result_name = f"{os.path.splitext(txt_name)[0]}.json"
+            if has_file(entry, 'evaluation', result_name):
+                continue
+            restructure_id = None
+            if not has_file(entry, 'txt', txt_name):
+                restructure_id = queue.put('restructure', problem_dir, [file], f"txt/{txt_name}", estimate_cost(entry, 'restructure'))
+                queued += 1
+            queue.put('step', problem_dir, [txt_name, result_name], f"evaluation/{result_name}", estimate_cost(entry, 'step'), after=restructure_id)
+            queued += 1
+
+        for input_file, (output_file, model_name) in answer_module.model_files(entry).items():
+            if has_file(entry, 'result', input_file) and not has_file(entry, 'score', output_file):
+                queue.put('answer', problem_dir, [input_file, output_file, model_name], f"score/{output_file}", estimate_cost(entry, 'answer'))
+                queued += 1
+    return queued
+
+class Worker:
+    """Leases jobs from the queue and runs them until no job is pending or leased.
+
+    A job whose output already exists is acknowledged without running it, so a
+    job finished by a worker that then died, or by a plain stage script, costs
+    no calls."""
+
+    def __init__(self, base_path, queue, lang=LANG, api_keys=None, threads=WORKER_THREADS, worker_id=None):
+        self.base_path = base_path
+        self.queue = queue
+        self.answer_module = importlib.import_module(f"answer_evaluation_with_ds_{lang}_prompt")
+        self.step_module = importlib.import_module(f"step_evaluation_with_ds_{lang}_prompt")
+        self.api_keys = api_keys or WORKER_API_KEYS
+        # Every stage of this worker uses its own keys: restructuring and step grading pick the least
+        # loaded one, answer grading uses the default client of llm_client
+        format_result_ds.API_KEYS = self.api_keys
+        llm_client.API_KEY = self.api_keys[0]
+        self.threads = threads
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run_stage(self, job):
+        problem_path = os.path.join(self.base_path, job["problem"])
+        if job["stage"] == 'restructure':
+            file, = job["args"]
+            with open(os.path.join(problem_path, 'problem.json'), 'r', encoding='utf-8') as f:
+                problem_structure = json.load(f)["question_structure"]
+            format_result_ds.restructure_file(problem_path, file, problem_structure)
+        elif job["stage"] == 'step':
+            txt_name, result_name = job["args"]
+            client = llm_client.get_client(pick_key(self.api_keys))
+            self.step_module.evaluate_problem(client, problem_path, txt_name, result_name)
+        else:
+            input_file, output_file, model_name = job["args"]
+            score_dir = os.path.join(problem_path, 'score')
+            os.makedirs(score_dir, exist_ok=True)
+            self.answer_module.evaluate_answer_file(problem_path, os.path.join(problem_path, 'result', input_file),
+                                                    os.path.join(score_dir, output_file), model_name)
+
+    def run_job(self, job):
+        try:
+            output_path = os.path.join(self.base_path, job["problem"], job["output"])
+            skipped = os.path.exists(output_path)
+            if not skipped:
+                self.run_stage(job)
+                if not os.path.exists(output_path):
+                    raise RuntimeError(f"{job['output']} was not written")
+            self.queue.ack(job["id"])
+            with self._lock:
+                if skipped:
+                    self.skipped += 1
+                else:
+                    self.completed += 1
+        except Exception as e:
+            tqdm.write(f"\nError in {job['id']} (attempt {job['attempt']}): {str(e)}")
+            with self._lock:
+                self.failed += 1
+            self.queue.nack(self.worker_id, job["id"], str(e))
+        finally:
+            with self._lock:
+                self._held.discard(job["id"])
+
+    def _heartbeat(self):
+        while not self._stopped.wait(LEASE_SECONDS / 3):
+            with self._lock:
+                held = list(self._held)
+            if held:
+                try:
+                    self.queue.renew(self.worker_id, held)
+                except sqlite3.Error as e:
+                    tqdm.write(f"\nCould not renew leases: {str(e)}")
+
+    def run(self):
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        running = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job") as executor, \
+                    tqdm(desc=f"Jobs of {self.worker_id}", unit="job") as pbar:
+                while True:
+                    while len(running) < self.threads:
+                        job = self.queue.lease(self.worker_id)
+                        if job is None:
+                            break
+                        with self._lock:
+                            self._held.add(job["id"])
+                        running.add(executor.submit(self.run_job, job))
+                    if not running:
+                        if self.queue.unfinished() == 0:
+                            break
+                        # Waiting for restructure jobs of other workers, or for their expired leases
+                        time.sleep(POLL_INTERVAL)
+                        continue
+                    done, running = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    pbar.update(len(done))
+        finally:
+            self._stopped.set()
+        return self.completed, self.skipped, self.failed
+
+def main():
+    base_path = r"C:\Users\13938\Desktop\ACL-2025\src\final_benchmark"
+    queue = WorkQueue(queue_path(base_path))
+
+    start_time = time.time()
+    if ROLE == 'coordinator':
+        print(f"Queueing jobs of {base_path}...")
+        print(f"{enqueue_benchmark(base_path, queue)} missing outputs queued")
+    else:
+        worker = Worker(base_path, queue)
+        print(f"Worker {worker.worker_id} running jobs of {queue.path} with {len(worker.api_keys)} API keys and {worker.threads} threads")
+        completed, skipped, failed = worker.run()
+        print(f"\nWorker finished in {time.time() - start_time:.2f} seconds: "
+              f"{completed} jobs done, {skipped} already done, {failed} failed attempts")
+        print(cache_report())
+        print(rate_limit_report())
+        print(prompt_cache_report())
+        print(profile_report())
+        print(saved_calls_report())
+        print(store_report())
+        print(leaderboard_report(base_path))
+    print(queue.report())
+    queue.close()
+
+if __name__ == "__main__":
+    main()